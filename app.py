@@ -1,14 +1,30 @@
-from flask import Flask, request
+from flask import Flask, request, send_file
 
 from app_service import AppService
-from utils.log import create_log_file
+from utils.exceptions import ExecutionInFlightException
+from utils.jobs import JobRegistry
+from utils.log import Log, configure_log_from_config, create_log_file
+from utils.metrics import Metrics, configure_metrics_from_config
+from utils.profiling import ExecutionProfiler, get_profile_path, is_profiling_requested
+from utils.reports import ReportStore
+from utils.utils import read_config_file
 
 import json
+import os
 import argparse
-import traceback
 
 app = Flask(__name__)
 
+config = read_config_file("config.ini")
+configure_log_from_config(config)
+configure_metrics_from_config(config)
+report_store = ReportStore(config.get("Reports", "dir", fallback="reports"),
+    config.getint("Reports", "max_reports", fallback=1000))
+job_registry = JobRegistry(config.getint("Jobs", "max_workers", fallback=4),
+    config.get("Jobs", "status_dir", fallback="executions"), report_store,
+    config.getfloat("Jobs", "status_retention_days", fallback=7) * 86400)
+profiles_dir = config.get("Profiling", "dir", fallback="profiles")
+
 
 @app.route("/", methods=["GET"])
 def home():
@@ -38,6 +54,7 @@ def get_sidebar_icon():
 
 @app.route("/api/logs", methods=["GET"])
 def logs():
+    Log.flush()
     try:
         with open("log.txt", "r", encoding="utf-8") as logfile:
             log = logfile.read()
@@ -45,6 +62,11 @@ def logs():
         log = "File log.txt does not exist"
     return log
 
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    # Sum of all the uWSGI workers, in the Prometheus text format
+    return Metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 @app.route("/api/execute", methods=["POST"])
 def execute():
     create_log_file()
@@ -60,28 +82,54 @@ def execute():
     }
 
     action_name = arguments["actionName"]
+    if action_name == "Anonymize":
+        action = app_service.data_anonymization
+    elif action_name == "Remediate":
+        action = app_service.data_remediation
+    else:
+        json_response["message"] =  f"No such action: {action_name}"
+        return json.dumps(json_response)
+
+    if config.getboolean("Profiling", "enabled", fallback=False) \
+            and is_profiling_requested(request.headers, app_service.params):
+        profiler = ExecutionProfiler(arguments["executionId"], profiles_dir,
+            config.getfloat("Profiling", "interval", fallback=0.01),
+            config.getint("Profiling", "top", fallback=30),
+            max_profiles=config.getint("Profiling", "max_profiles", fallback=20))
+        action = profiler.wrap(action)
+
+    # Runs in the background, BigID follows it through /api/executions/<executionId>
     try:
-        if action_name == "Anonymize":
-            app_service.data_anonymization()
-            json_response["statusEnum"] = "COMPLETED"
-            json_response["progress"] = 1
-            json_response["message"] = f"Completed action {action_name} successfully"
-        
-        elif action_name == "Remediate":
-            app_service.data_remediation()
-            json_response["statusEnum"] = "COMPLETED"
-            json_response["progress"] = 1
-            json_response["message"] = f"Completed action {action_name} successfully"
-
-        else:
-            json_response["message"] =  f"No such action: {action_name}"
-        
-
-    except Exception as err:
-            json_response["message"] = "Error - attempt to execute action "\
-                + f"{action_name} failed: {traceback.format_exc()}"
-
-    return json.dumps(json_response)
+        progress = job_registry.submit(arguments["executionId"], action_name, action,
+            app_service.report_status, config.getfloat("Jobs", "status_interval", fallback=5))
+    except ExecutionInFlightException as err:
+        json_response["message"] = str(err)
+        return json.dumps(json_response), 409
+    return json.dumps(progress.to_dict())
+
+
+@app.route("/api/executions/<execution_id>", methods=["GET"])
+def execution_status(execution_id: str):
+    status = job_registry.get_status(execution_id)
+    if status is None:
+        return json.dumps({"message": f"No such execution: {execution_id}"}), 404
+    return json.dumps(status)
+
+
+@app.route("/api/reports", methods=["GET"])
+def reports():
+    # Reports of the last executions, newest first
+    limit = request.args.get("limit", 100, type=int)
+    return json.dumps(report_store.read(limit, request.args.get("executionId")))
+
+
+@app.route("/api/executions/<execution_id>/profile", methods=["GET"])
+def execution_profile(execution_id: str):
+    profile_path = get_profile_path(profiles_dir, execution_id)
+    if profile_path is None:
+        return json.dumps({"message": f"No profile for execution: {execution_id}"}), 404
+    return send_file(os.path.abspath(profile_path), mimetype="application/zip", as_attachment=True,
+        download_name=f"profile-{os.path.basename(execution_id)}.zip")
 
 
 if __name__ == "__main__":
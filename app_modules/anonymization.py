@@ -1,75 +1,145 @@
-from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import chain, groupby, islice
 from configparser import RawConfigParser
-from typing import Union
 
 from bigid.bigid import BigIDAPI
+from cts.async_cts_request import AsyncCTSRequest
 from cts.cts_request import CTSRequest
 from databases.ds_connection import DataSourceConnection
+from utils.jobs import ExecutionProgress
 from utils.log import Log
+from utils.metrics import Metrics
+from utils.reports import get_report
 import utils.utils as ut
 
 
 def run_data_anonymization(config: RawConfigParser, params: dict, tpa_id: str, cts: CTSRequest,
-        bigid: BigIDAPI):
-
-    minimization_requests = get_batch_minimization_requests(bigid)
-
-    # minimization_requests = bigid.get_minimization_requests()
-    if len(minimization_requests.keys()) == 0:
+        bigid: BigIDAPI, progress: ExecutionProgress = None):
+
+    page_size = config.getint("BigID", "minimization_page_size", fallback=1000)
+    chunk_size = config.getint("BigID", "max_concurrency", fallback=8)
+    report = get_report(progress)
+    minimization_requests = report.time_iter("bigid_metadata",
+        iter_minimization_requests(bigid, page_size, chunk_size))
+
+    # Marking a request as completed removes its objects from the pending list
+    # and would shift the pages still being read, so it is done at the end.
+    # The requests anonymized before a failure are marked too, a later run
+    # would otherwise tokenize their tokens again.
+    completed = []
+    try:
+        anonymize_requests(minimization_requests, completed, chunk_size, tpa_id, cts, bigid,
+            params, config, progress)
+    finally:
+        # Stops the page reads still in flight before the pending list changes
+        minimization_requests.close()
+        if completed:
+            complete_requests(bigid, completed, progress)
+
+    if len(completed) == 0:
         Log.info("No deletion requests found! Exiting action")
-        return
 
-    for request_id, del_info in minimization_requests.items():
 
-        Log.info(f"---   Processing {request_id=}")
-
-        # Filter only records that as selected for "Delete Manually"
-        selected_objects = del_info["selected"]
-        records = bigid.get_sar_report(request_id)
-        records = list(filter(lambda x: x["fullObjectName"] in selected_objects, records))
-
-        # Group by data source
-        for source_name, grouped_records in groupby(records, lambda x: x["source"]):
-            Log.info(f"Initiating the anonymization for the data source {source_name}")
-            ds_conn_getter = bigid.get_data_source_conn_from_source_name(source_name)
-            ds_conn_getter.set_credentials(
-                bigid.get_data_source_credentials(tpa_id, source_name))
-            connect_ds_anonymize(ds_conn_getter, cts, list(grouped_records),
-                params, config)
+def anonymize_requests(minimization_requests, completed: list, chunk_size: int, tpa_id: str,
+        cts: CTSRequest, bigid: BigIDAPI, params: dict, config: RawConfigParser,
+        progress: ExecutionProgress = None):
+    """
+    Anonymizes the records of the minimization requests, appending
+    (request_id, ids) to completed as soon as a request is done
+    """
+    report = get_report(progress)
+    for requests_chunk in ut.chunked(minimization_requests, chunk_size):
+        # Fetch the metadata of the requests and their data sources in parallel
+        with report.timer("sar_fetch"):
+            sar_reports = bigid.get_sar_reports([request_id for request_id, _ in requests_chunk])
+        request_records = {}
+        for request_id, del_info in requests_chunk:
+            # Filter only records that as selected for "Delete Manually"
+            selected_objects = del_info["selected"]
+            request_records[request_id] = list(filter(
+                lambda x: x["fullObjectName"] in selected_objects, sar_reports[request_id]))
+            if progress is not None:
+                progress.add_total(len(request_records[request_id]))
+
+        if progress is not None:
+            progress.mark_phase(f"anonymize {len(requests_chunk)} requests")
+        source_names = [rec["source"] for records in request_records.values() for rec in records]
+        with report.timer("bigid_metadata"):
+            ds_conn_getters = bigid.get_data_source_conns(tpa_id, source_names)
+
+        for request_id, del_info in requests_chunk:
+
+            Log.info(f"---   Processing {request_id=}")
+            records = request_records[request_id]
+
+            # Group by data source
+            for source_name, grouped_records in groupby(records, lambda x: x["source"]):
+                Log.info(f"Initiating the anonymization for the data source {source_name}")
+                connect_ds_anonymize(ds_conn_getters[source_name], cts, list(grouped_records),
+                    params, config, progress)
+
+            completed.append((request_id, del_info["ids"]))
+
+
+def complete_requests(bigid: BigIDAPI, completed: list, progress: ExecutionProgress = None):
+    """
+    Marks the anonymized requests as completed, carrying on past the
+    requests that BigID fails to mark
+    """
+    if progress is not None:
+        progress.mark_phase("complete requests")
+    # Marking the requests completed is the tagging of the anonymization
+    with get_report(progress).timer("tagging"):
+        for request_id, ids in completed:
+            try:
+                bigid.set_minimization_request_action(request_id, "Completion Delete Manually", ids)
+            except Exception as err:
+                Log.error(f"Could not mark {request_id=} as completed: {err}")
+
+
+def update_table_batch(source_conn, table_name: str, target_cols: tuple, unique_id_col: str,
+        rows: list, token_map: dict):
+    """
+    Runs one parameterized UPDATE for all the rows of a table that have the
+    same anonymized columns. Each row is (values, unique_id_value) and its
+    columns are replaced by the tokens of their current values.
+    """
+    Log.info(f"Updating {len(rows)} rows of {table_name}: {list(target_cols)}")
 
-        bigid.set_minimization_request_action(request_id,
-            "Completion Delete Manually", del_info["ids"])
+    update_query = source_conn.get_anonymization_update_query(table_name, list(target_cols),
+        unique_id_col)
+    params_mult = [(*[token_map[val] for val in values], *values, unique_id_val)
+                   for values, unique_id_val in rows]
+    source_conn.run_query(update_query, is_multiple=True, params_mult=params_mult)
+    Metrics.inc("rows_tokenized_total", len(rows), action="anonymization")
 
 
-def update_table(records: Union[list, str], unique_id_record: dict,
-        source_conn, tokens: Union[list, str]):
+def tokenize_distinct(cts: CTSRequest, values: set, tokengroup: str, tokentemplate: str,
+        batch_size: int) -> dict:
     """
-    Generates and runs the update query.
-    If the arguments are lists, all fields will anonymized in a single query
+    Tokenizes every distinct value once, batch_size values per CTS request,
+    and returns the token of each value.
     """
-    if isinstance(tokens, list) and isinstance(records, list):
-        target_cols           = [rec["attr_original_name"] for rec in records]
-        target_col_vals       = [rec["value"] for rec in records]
-        full_object_name      = records[0]["fullObjectName"]
-        _, schema, table_name = full_object_name.split(".")
+    values = list(values)
+    token_map = {}
+    batches = [values[offset:offset + fetch_next]
+               for offset, fetch_next in ut.offset_fetchnext_iter(len(values), batch_size)]
+    if isinstance(cts, AsyncCTSRequest):
+        # All the batches are in flight at the same time, bounded by the client
+        futures = [cts.submit(batch, tokengroup, tokentemplate) for batch in batches]
+        for batch, future in zip(batches, futures):
+            token_map.update(zip(batch, future.result()))
     else:
-        target_cols           = records["attr_original_name"]
-        target_col_vals       = records["value"]
-        full_object_name      = records["fullObjectName"]
-        _, schema, table_name = full_object_name.split(".")
-
-    Log.info(f"{target_cols}, {target_col_vals}, {full_object_name}, {table_name}")
-
-    update_query = source_conn.get_update_query(table_name, tokens,
-        target_cols, target_col_vals, unique_id_record["attr_original_name"],
-        unique_id_record["value"])
-    
-    source_conn.run_query(update_query)
-
+        for batch in batches:
+            token_map.update(zip(batch, cts.tokenize(batch, tokengroup, tokentemplate)))
+    Log.info(f"Tokenized {len(values)} distinct values")
+    return token_map
 
 
 def connect_ds_anonymize(ds_conn_getter: DataSourceConnection, cts: CTSRequest,
-        grouped_records: list, params: dict, config: RawConfigParser):
+        grouped_records: list, params: dict, config: RawConfigParser,
+        progress: ExecutionProgress = None):
 
     # Data source connection
     connector_class, host, port, db = ds_conn_getter.get_conn_param()
@@ -79,13 +149,22 @@ def connect_ds_anonymize(ds_conn_getter: DataSourceConnection, cts: CTSRequest,
 
     categories = ut.read_categories(params["Categories"])
     Log.info(f"Categories that will be anonymized: {categories}")
+    batch_size = int(params.get("BatchSize", 100))
+    report = get_report(progress)
+    source_name = grouped_records[0]["source"] if grouped_records else None
+
+    # {(table_name, target_cols, unique_id_col): [(values, unique_id_value), ...]}
+    column_updates = {}
+    # {(table_name, unique_id_col): [unique_id_value, ...]}
+    unique_id_updates = {}
+    values_to_tokenize = set()
 
     try:
         # Group by proximityId/Line
         for proximity_id, records_groupby_table in groupby(list(grouped_records),
                 lambda x: x["proximityId"]):
 
-            Log.info(f"Starting anonymization for {proximity_id=}")
+            Log.debug(f"Starting anonymization for {proximity_id=}")
 
             proximity_group = list(records_groupby_table)
 
@@ -94,37 +173,62 @@ def connect_ds_anonymize(ds_conn_getter: DataSourceConnection, cts: CTSRequest,
             unique_id_col_name = None
             if unique_id_record is not None:
                 unique_id_col_name = unique_id_record["attr_original_name"]
-                Log.info(f"Unique ID column: {unique_id_col_name}")
+                Log.debug(f"Unique ID column: {unique_id_col_name}")
             else:
                 Log.info(f"{proximity_id=} does not have a unique_id or primary "
                     + "key. Skipping anonymization to avoid wrong data replacements")
                 continue
 
+            _, schema, table_name = unique_id_record["fullObjectName"].split(".")
+
             # Filter all records that are not primary key or unique id
             filt = lambda x: x["attr_original_name"] != unique_id_col_name and x["value"] \
                     and ut.category_allowed(x["category"], categories) and x["is_primary"] == "FALSE"
             remaining_records = list(filter(filt, proximity_group))
-            Log.info(f"Found {len(remaining_records)} records for anonymization, "
+            Log.debug(f"Found {len(remaining_records)} records for anonymization, "
                 + "except unique identifier")
             
             if len(remaining_records) > 0:
-                values = [rec["value"] for rec in remaining_records]
-                tokens = cts.tokenize(values, params["CTSTokengroup"], params["CTSTokentemplate"])
-                Log.info("Data tokenized successfully")
-
-                Log.info("Updating data with tokens...")
-                update_table(remaining_records, unique_id_record, source_conn, tokens)
-                Log.info("Updating data with tokens OK")
+                target_cols = tuple(rec["attr_original_name"] for rec in remaining_records)
+                values = tuple(rec["value"] for rec in remaining_records)
+                column_updates.setdefault((table_name, target_cols, unique_id_col_name), [])\
+                    .append((values, unique_id_record["value"]))
+                values_to_tokenize.update(values)
 
             if ut.category_allowed(unique_id_record["category"], categories):
-                Log.info("Unique identifier is selected for anonymization")
-                Log.info(unique_id_record["value"])
-                token = cts.tokenize(unique_id_record["value"], params["CTSTokengroup"],
-                    params["CTSTokentemplate"])[0]
-                Log.info("tokenized")
-
-                update_table(unique_id_record, unique_id_record, source_conn, token)
-                Log.info("Unique identifier anonymized")
+                Log.debug("Unique identifier is selected for anonymization")
+                unique_id_updates.setdefault((table_name, unique_id_col_name), [])\
+                    .append(unique_id_record["value"])
+                values_to_tokenize.add(unique_id_record["value"])
+
+        # Every distinct value is sent to the CTS once, in batches
+        if progress is not None:
+            progress.mark_phase(f"tokenize {len(values_to_tokenize)} values")
+        token_map = tokenize_distinct(cts, values_to_tokenize, params["CTSTokengroup"],
+            params["CTSTokentemplate"], batch_size)
+        Log.info("Data tokenized successfully")
+
+        Log.info("Updating data with tokens...")
+        if progress is not None:
+            progress.mark_phase("update tables")
+        # The other columns are matched by the original unique id, so they go first
+        for (table_name, target_cols, unique_id_col), rows in column_updates.items():
+            with report.timer("db_write"):
+                update_table_batch(source_conn, table_name, target_cols, unique_id_col, rows,
+                    token_map)
+            report.add_rows(source_name, table_name, target_cols, len(rows))
+            if progress is not None:
+                progress.add_processed(len(rows) * len(target_cols))
+
+        for (table_name, unique_id_col), unique_id_values in unique_id_updates.items():
+            rows = [((val,), val) for val in unique_id_values]
+            with report.timer("db_write"):
+                update_table_batch(source_conn, table_name, (unique_id_col,), unique_id_col, rows,
+                    token_map)
+            report.add_rows(source_name, table_name, unique_id_col, len(rows))
+            if progress is not None:
+                progress.add_processed(len(rows))
+        Log.info("Updating data with tokens OK")
 
     except Exception as err:
         Log.error(f"Exception found in connect_ds_anonymize: {err}")
@@ -134,13 +238,64 @@ def connect_ds_anonymize(ds_conn_getter: DataSourceConnection, cts: CTSRequest,
     source_conn.close_connection()
 
 
-def get_batch_minimization_requests(bigid: BigIDAPI, batch_size: int = 10,
-                                    nlines: int = 100000) -> dict:
-    minimization_requests = {}
-    for offset, fetch_next in ut.offset_fetchnext_iter(nlines, batch_size):
-        batch_minimization_requests = bigid.update_minimization_requests(offset, fetch_next)
-        if len(batch_minimization_requests) == 0:
-            break
-        ut.merge_anonymization_dicts(minimization_requests, batch_minimization_requests)
+def iter_minimization_requests(bigid: BigIDAPI, page_size: int = 1000, concurrency: int = 8):
+    """
+    Yields (request_id, {"selected": [...], "ids": [...]}) for every pending
+    minimization request as soon as all of its objects have been read. Once the
+    first page gives the total count, the other pages are fetched in parallel,
+    at most concurrency pages ahead of the one being consumed.
+    """
+    first_page, total_count = bigid.get_minimization_requests_page(0, page_size)
+    if len(first_page) == 0:
+        return
+    if total_count is not None:
+        offsets = range(page_size, total_count, page_size)
+        executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+        pages = _iter_pages_parallel(executor, bigid, offsets, page_size, max(concurrency, 1))
+    else:
+        executor = None
+        pages = _iter_pages_sequential(bigid, page_size)
 
-    return minimization_requests
\ No newline at end of file
+    try:
+        pending = {}
+        for page in chain([first_page], pages):
+            ut.merge_anonymization_dicts(pending, page)
+            # Pages are sorted by requestId, only the last request can continue in the next page
+            for request_id in list(pending.keys())[:-1]:
+                yield request_id, pending.pop(request_id)
+
+        yield from pending.items()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def _iter_pages_parallel(executor: ThreadPoolExecutor, bigid: BigIDAPI, offsets, page_size: int,
+        concurrency: int):
+    """
+    Yields the pages at offsets in order. A page is requested as an earlier
+    one is consumed, so no more than concurrency pages are held in memory.
+    """
+    fetch_page = lambda offset: bigid.get_minimization_requests_page(offset, page_size)[0]
+    offsets = iter(offsets)
+    in_flight = deque(executor.submit(fetch_page, offset)
+                      for offset in islice(offsets, concurrency))
+    try:
+        while in_flight:
+            page = in_flight.popleft().result()
+            for offset in islice(offsets, 1):
+                in_flight.append(executor.submit(fetch_page, offset))
+            yield page
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def _iter_pages_sequential(bigid: BigIDAPI, page_size: int):
+    offset = page_size
+    while True:
+        page, _ = bigid.get_minimization_requests_page(offset, page_size)
+        if len(page) == 0:
+            return
+        yield page
+        offset += page_size
@@ -1,107 +1,273 @@
 import math
 import re
 import datetime
+import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from configparser import RawConfigParser
 
+from cts.async_cts_request import AsyncCTSRequest
 from cts.cts_request import CTSRequest
 from bigid.bigid import BigIDAPI
-from databases.oracle_conn import OracleConnector
-from databases.mysql_conn import MySQLConnector
-from databases.postgresql_conn import PostgreSQLConnector
 from databases.ds_connection import DataSourceConnection
+from utils.checkpoints import CheckpointStore
+from utils.exceptions import RemediationException
+from utils.jobs import ExecutionProgress
 from utils.log import Log
-from utils.utils import offset_fetchnext_iter
+from utils.metrics import Metrics
+from utils.reports import get_report
+import utils.utils as ut
 
 
-def run_data_remediation(cts: CTSRequest, bigid: BigIDAPI, config: RawConfigParser, params: dict, tpa_id: str):
+_tagging_lock = threading.Lock()
+
+
+def run_data_remediation(cts: CTSRequest, bigid: BigIDAPI, config: RawConfigParser, params: dict, tpa_id: str,
+        progress: ExecutionProgress = None):
     Log.info("Starting remediation")
+    report = get_report(progress)
 
     # 1. Get a list of all available data sources
     # Conferir URL, proxy, tpa, ID
-    all_data_sources = bigid.get_all_data_sources()
+    with report.timer("bigid_metadata"):
+        all_data_sources = bigid.get_all_data_sources()
     Log.info(str(len(all_data_sources))+" Datasources found.")
 
     # 2. Filter the DS to get only those with connectors implemented in the API
     implemented_connectors = DataSourceConnection.get_all_implemented_connector_types()
     reachable_data_sources = list(filter(
         lambda x: x["type"] in implemented_connectors, all_data_sources))
+    source_concurrency = int(params.get("SourceConcurrency", 1))
+
+    checkpoints = None
+    if config.getboolean("Checkpoints", "enabled", fallback=False):
+        checkpoints = CheckpointStore(config.get("Checkpoints", "path", fallback="checkpoints.db"))
+
+    # 3. Remediate the data sources in parallel. A failing source does not stop the others
+    try:
+        errors = run_in_pool(
+            lambda ds: remediate_data_source(cts, bigid, config, params, tpa_id, ds["name"], progress,
+                checkpoints),
+            reachable_data_sources, source_concurrency, lambda ds: ds["name"])
+    finally:
+        if checkpoints is not None:
+            checkpoints.close()
+
+    if errors:
+        summary = "; ".join(f"{ds_name}: {err}" for ds_name, err in errors.items())
+        raise RemediationException(f"Remediation failed for {len(errors)} of "
+            + f"{len(reachable_data_sources)} data sources: {summary}")
+
+
+def remediate_data_source(cts: CTSRequest, bigid: BigIDAPI, config: RawConfigParser, params: dict,
+        tpa_id: str, ds_name: str, progress: ExecutionProgress = None,
+        checkpoints: CheckpointStore = None):
+    if progress is not None:
+        progress.mark_phase(f"source {ds_name}")
+    report = get_report(progress)
+    # 4. Get the list of remediation objects in the data source
+    with report.timer("bigid_metadata"):
+        remed_objs = bigid.get_remediation_objects_by_fqn(ds_name)
+    if len(remed_objs) == 0:
+        Log.warn("No Remediation Objects were found.")
+        return
+    with report.timer("bigid_metadata"):
+        remed_objs_col = bigid.get_remediation_objects_by_source_columns(ds_name)
+    # From this one, get policy hit and table size
+
+    # Filter those that have "Thales Tokenization" in actions taken
+    remed_objs_col = list(filter(
+        lambda x: x["annotations"]["actionTaken"] == "Thales Tokenization", remed_objs_col))
+    Log.warn(str(len(remed_objs_col))+" Remediation objects found.")
+
+    # 5. For every policy hit, search in the comments if the database
+    # has been tokenized
+    # Tags of all the tables are fetched in parallel
+    with report.timer("bigid_metadata"):
+        objects_tags = bigid.get_objects_tags([col_obj["fully_qualified_name"]
+                                               for col_obj in remed_objs_col])
+
+    table_concurrency = int(params.get("TableConcurrency", 1))
+    if table_concurrency <= 1:
+        source_conn = get_ds_connector(bigid, config, tpa_id, ds_name)
+        try:
+            for col_obj in remed_objs_col:
+                remediate_table(cts, bigid, source_conn, ds_name, col_obj, remed_objs, params, progress,
+                    objects_tags.get(col_obj["fully_qualified_name"]), checkpoints)
+        finally:
+            source_conn.close_connection()
+        return
+
+    # Connections are not thread safe, every table gets its own
+    def remediate_table_own_conn(col_obj: dict):
+        source_conn = get_ds_connector(bigid, config, tpa_id, ds_name)
+        try:
+            remediate_table(cts, bigid, source_conn, ds_name, col_obj, remed_objs, params, progress,
+                objects_tags.get(col_obj["fully_qualified_name"]), checkpoints)
+        finally:
+            source_conn.close_connection()
+
+    errors = run_in_pool(remediate_table_own_conn, remed_objs_col, table_concurrency,
+        lambda col_obj: col_obj["fully_qualified_name"])
+    if errors:
+        summary = "; ".join(f"{obj_name}: {err}" for obj_name, err in errors.items())
+        raise RemediationException(f"Remediation failed for {len(errors)} tables: {summary}")
+
+
+def remediate_table(cts: CTSRequest, bigid: BigIDAPI, source_conn, ds_name: str, col_obj: dict,
+        remed_objs: dict, params: dict, progress: ExecutionProgress = None,
+        all_object_tags: list = None, checkpoints: CheckpointStore = None):
     batch_size = int(params["BatchSize"])
+    concurrency = int(params.get("CTSConcurrency", 1))
+    read_mode = params.get("ReadMode", "stream")
+    report = get_report(progress)
+
+    Log.debug(str(col_obj))
+    # Check comments here to get the tokenized columns
+    obj_full_qual_name = col_obj["fully_qualified_name"]
+    non_col_obj = remed_objs[obj_full_qual_name]
+    Log.info("Got non column objects using Fully Qualified name")
+    annotation_id = non_col_obj["id"]
+    Log.info(f"Object annotation ID: {annotation_id}")
+
+    if all_object_tags is None:
+        with report.timer("bigid_metadata"):
+            all_object_tags = bigid.get_object_tags(obj_full_qual_name)
+    Log.debug(all_object_tags)
+    tokenized_columns = {tag["tagValue"] for tag in all_object_tags
+                         if tag["tagName"] == "Thales_Tokenized"}
+    Log.debug(tokenized_columns)
 
-    # 3. For each data source, get a list of remediation objects
-    for ds in reachable_data_sources:
-        ds_name = ds["name"]
-        source_conn = get_ds_connector(bigid, config, tpa_id, ds_name)
 
-        # 4. Get the list of remediation objects in the data source
-        remed_objs = bigid.get_remediation_objects_by_source(ds_name)
-        if len(remed_objs) == 0:
-            Log.warn("No Remediation Objects were found.")
+    full_object_name      = non_col_obj["fullObjectName"]
+    schema, table_name = full_object_name.split(".")
+
+    pkeys = source_conn.get_primary_keys(table_name, schema)
+    if len(pkeys) == 0:
+        Log.warn(f"No primary keys found in {ds_name} - {obj_full_qual_name}. Skipping...")
+        return
+
+    tkgroup = params["CTSTokengroup"]
+    tktemplates = ut.read_column_tokentemplates(params.get("ColumnTokentemplates", ""))
+
+    pending_columns = []
+    for col_hit_name in col_obj["annotations"]["policyHit"]:
+        Log.debug(col_hit_name)
+        if col_hit_name in tokenized_columns:
+            Log.info(f"Column {col_hit_name} is already tokenized. Skipping")
             continue
-        remed_objs_col = bigid.get_remediation_objects_by_source_columns(ds_name)
-        # From this one, get policy hit and table size
-
-        # Filter those that have "Thales Tokenization" in actions taken
-        remed_objs_col = list(filter(
-            lambda x: x["annotations"]["actionTaken"] == "Thales Tokenization", remed_objs_col))
-        Log.warn(str(len(remed_objs_col))+" Remediation objects found.")
-
-        # 5. For every policy hit, search in the comments if the database
-        # has been tokenized
-        for col_obj in remed_objs_col:
-            Log.info(str(col_obj))
-            # Check comments here to get the tokenized columns
-            obj_full_qual_name = col_obj["fully_qualified_name"]
-            non_col_obj = list(filter(lambda x: x["fullyQualifiedName"] == obj_full_qual_name, remed_objs))[0]
-            Log.info("Got non column objects using Fully Qualified name")
-            annotation_id = non_col_obj["id"]
-            Log.info(f"Object annotation ID: {annotation_id}")
-
-            tokenized_columns = []
-            all_object_tags = bigid.get_object_tags(obj_full_qual_name)
-            Log.info(all_object_tags)
-            for tag in all_object_tags:
-                if tag["tagName"] == "Thales_Tokenized":
-                    tokenized_columns.append(tag["tagValue"])
-            Log.info(tokenized_columns)
-
-
-            # Run query to get table size
-            _, schema, table_name = obj_full_qual_name.split(".")
-            table_size = get_nlines(source_conn, table_name)
-
-            full_object_name      = non_col_obj["fullObjectName"]
-            schema, table_name = full_object_name.split(".")
-
-            pkeys = source_conn.get_primary_keys(table_name, schema)
-            if len(pkeys) == 0:
-                Log.warn(f"No primary keys found in {ds_name} - {obj_full_qual_name}. Skipping...")
-                continue
-
-            for col_hit_name in col_obj["annotations"]["policyHit"]:
-                Log.info(col_hit_name)
-                if col_hit_name in tokenized_columns:
-                    Log.info(f"Column {col_hit_name} is already tokenized. Skipping")
-                    continue
-            
-                candidate_pkeys = list(filter(lambda x: x != col_hit_name, pkeys))
-                if candidate_pkeys:
-                    pkey = candidate_pkeys[0]
-                else:
-                    continue
-
-                # Choose if there are viable primary keys for tokenization
-
-                tkgroup, tktempl = params["CTSTokengroup"], params["CTSTokentemplate"]
-
-                Log.info(f"Tokenizing column {col_hit_name} of {table_name}")
-                
-                tokenize_column(cts, source_conn, schema, table_name, col_hit_name, pkey, table_size, batch_size, tkgroup, tktempl)
-                # Tag as tokenized
-                tag_column_thales_tokenized(bigid, ds_name, col_hit_name, obj_full_qual_name)
-                # Comment that tokenization was performed on column X at time Y
-                comment_tokenization(bigid, col_hit_name, annotation_id)
-        source_conn.close_connection()
+    
+        # Tokenizing a primary key column would change the row identity
+        # used to page through and update the table
+        if col_hit_name in pkeys:
+            Log.warn(f"Column {col_hit_name} is part of the primary key of {table_name}. Skipping")
+            continue
+
+        checkpoint = None
+        if checkpoints is not None:
+            checkpoint = checkpoints.get(ds_name, obj_full_qual_name, col_hit_name)
+
+        if checkpoint is not None and checkpoint["status"] == "done":
+            Log.info(f"Column {col_hit_name} of {table_name} was tokenized by a previous run")
+            with report.timer("tagging"):
+                finish_column(bigid, checkpoints, ds_name, col_hit_name, obj_full_qual_name,
+                    annotation_id)
+            continue
+        pending_columns.append((col_hit_name, checkpoint))
+
+    table_size = None
+    for columns, checkpoint in group_columns(pending_columns, params.get("TokenizeMode", "table")):
+        columns_str = ", ".join(columns)
+        start_key = None
+        if checkpoint is not None:
+            start_key = checkpoint["last_key"]
+            Log.info(f"Resuming {columns_str} of {table_name} after {start_key}, "
+                + f"{checkpoint['rows']} rows already tokenized")
+        else:
+            Log.info(f"Tokenizing {columns_str} of {table_name}")
+
+        if progress is not None:
+            progress.mark_phase(f"tokenize {table_name} {columns_str}")
+            if table_size is None:
+                table_size = get_table_size(source_conn, table_name, schema)
+            progress.add_total(table_size * len(columns))
+            if checkpoint is not None:
+                progress.add_processed(checkpoint["rows"] * len(columns))
+
+        def on_batch(batch_pkeys: list, columns: list = columns):
+            report.add_rows(ds_name, table_name, columns, len(batch_pkeys))
+            if checkpoints is None:
+                return
+            # Every column keeps its own checkpoint, so a run in another mode still resumes it.
+            # It is saved after the data source committed the batch, in another transaction:
+            # a crash between the two commits tokenizes that batch again on the next run
+            for col_hit_name in columns:
+                checkpoints.save(ds_name, obj_full_qual_name, col_hit_name, batch_pkeys[-1],
+                    len(batch_pkeys))
+
+        col_tktempls = [tktemplates.get(col, params["CTSTokentemplate"]) for col in columns]
+        if len(columns) == 1:
+            tokenize_column(cts, source_conn, schema, table_name, columns[0], pkeys, batch_size, tkgroup,
+                col_tktempls[0], concurrency, read_mode, progress, start_key, on_batch)
+        else:
+            tokenize_table(cts, source_conn, schema, table_name, columns, pkeys, batch_size, tkgroup,
+                col_tktempls, concurrency, read_mode, progress, start_key, on_batch)
+
+        if progress is not None:
+            progress.mark_phase(f"tag {table_name} {columns_str}")
+        for col_hit_name in columns:
+            if checkpoints is not None:
+                checkpoints.complete(ds_name, obj_full_qual_name, col_hit_name)
+            with report.timer("tagging"):
+                finish_column(bigid, checkpoints, ds_name, col_hit_name, obj_full_qual_name,
+                    annotation_id)
+
+
+def group_columns(pending_columns: list, tokenize_mode: str = "table") -> list:
+    """
+    Returns the (columns, checkpoint) passes over the table for the pending
+    (column, checkpoint) pairs. In "table" mode the columns that resume from
+    the same key are read, tokenized and written back in a single pass, in
+    "column" mode every column gets its own pass.
+    """
+    if tokenize_mode != "table":
+        return [([col], checkpoint) for col, checkpoint in pending_columns]
+
+    groups = {}
+    for col, checkpoint in pending_columns:
+        start_key = checkpoint["last_key"] if checkpoint is not None else None
+        groups.setdefault(start_key, ([], checkpoint))[0].append(col)
+    return list(groups.values())
+
+
+def finish_column(bigid: BigIDAPI, checkpoints: CheckpointStore, ds_name: str, col_hit_name: str,
+        obj_full_qual_name: str, annotation_id: str):
+    # Tag as tokenized
+    tag_column_thales_tokenized(bigid, ds_name, col_hit_name, obj_full_qual_name)
+    # Comment that tokenization was performed on column X at time Y
+    comment_tokenization(bigid, col_hit_name, annotation_id)
+    # From now on the tag tells the column was tokenized
+    if checkpoints is not None:
+        checkpoints.clear(ds_name, obj_full_qual_name, col_hit_name)
+
+
+def run_in_pool(func, items: list, max_workers: int, get_name) -> dict:
+    """
+    Runs func for every item with up to max_workers threads and waits for all
+    of them. Returns the exceptions raised, keyed by get_name(item).
+    """
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {executor.submit(func, item): get_name(item) for item in items}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+            except Exception as err:
+                Log.error(f"Remediation of {name} failed: {err}")
+                errors[name] = err
+    return errors
 
 
 def comment_tokenization(bigid: BigIDAPI, col_tokenized: str, annotation_id: str):
@@ -113,57 +279,158 @@ def comment_tokenization(bigid: BigIDAPI, col_tokenized: str, annotation_id: str
 
 def tag_column_thales_tokenized(bigid: BigIDAPI, source_name: str, col_hit_name: str,
         obj_full_qual_name: str):
+    # Tables remediated in parallel must not create the same tag twice
+    with _tagging_lock:
+        _tag_column_thales_tokenized(bigid, source_name, col_hit_name, obj_full_qual_name)
+
+
+def _tag_column_thales_tokenized(bigid: BigIDAPI, source_name: str, col_hit_name: str,
+        obj_full_qual_name: str):
     
     tag_name = "Thales_Tokenized"
     tag_description = "Tags the columns that were tokenized by the remediation app"
 
-    all_tags = bigid.get_bigid_tags()
+    tags_index = bigid.get_tags_index()
 
-    matching_tags_by_tagname = list(filter(lambda x: x["tagName"] == tag_name, all_tags))
-    if matching_tags_by_tagname:
-        parent_id = matching_tags_by_tagname[0]["tagId"]
+    main_tag = tags_index.get((tag_name, None))
+    if main_tag is not None:
+        parent_id = main_tag["tagId"]
     else:
         parent_id = bigid.create_main_tag(tag_name, tag_description)
 
-    matching_tagname_tagval = list(filter(lambda x: x["tagName"] == tag_name
-                                          and x["tagValue"] == col_hit_name, all_tags))
-    if not matching_tagname_tagval:
+    subtag = tags_index.get((tag_name, col_hit_name))
+    if subtag is None:
         subtag_id, _ = bigid.create_sub_tag(col_hit_name, parent_id,
             f"Thales API Tokenized Column {col_hit_name}")
     else:
-        subtag_id = matching_tagname_tagval[0]["valueId"]
+        subtag_id = subtag["valueId"]
     bigid.add_tag(obj_full_qual_name, source_name, parent_id, subtag_id)
 
-def get_primary_key(source_conn, table_name: str, schema: str = None) -> list:
-    return source_conn.get_primary_keys(table_name, schema)
-
 
 def tokenize_column(cts: CTSRequest, source_conn, schema: str, table_name: str, col_hit_name: str,
-        pkey_col_name: str, nlines: int, batch_size: int, tkgroup: str, tktemplate: str):
-    if isinstance(source_conn,OracleConnector):
-        for offset, fetchnext in offset_fetchnext_iter(nlines, batch_size):
-            pkeys, data = get_batch_pkey_data(source_conn, table_name, pkey_col_name, col_hit_name, offset, fetchnext)
-            tokens = cts.tokenize(data, tkgroup, tktemplate)
-            update_multiple_query = f"""
-                UPDATE {table_name}
-                SET {col_hit_name} = :1
-                WHERE {pkey_col_name} = :2
-            """
-            params_mult = [(tk, pk) for pk, tk in zip(pkeys, tokens)]
-            source_conn.run_query(update_multiple_query, is_multiple=True, params_mult=params_mult)
-            
-    elif isinstance(source_conn,PostgreSQLConnector):
-        for offset, fetchnext in offset_fetchnext_iter(nlines, batch_size):
-            pkeys, data = get_batch_pkey_data(source_conn, table_name, pkey_col_name, col_hit_name, offset, fetchnext)
-            tokens = cts.tokenize(data, tkgroup, tktemplate)
-            update_multiple_query = f"""
-                UPDATE {table_name}
-                SET {col_hit_name} = %s
-                WHERE {pkey_col_name} = %s
-            """
-            params_mult = [(tk, pk) for pk, tk in zip(pkeys, tokens)]
-            source_conn.run_query(update_multiple_query, is_multiple=True, params_mult=params_mult)
- 
+        pkey_col_names: list, batch_size: int, tkgroup: str, tktemplate: str,
+        concurrency: int = 1, read_mode: str = "stream", progress: ExecutionProgress = None,
+        start_key: tuple = None, on_batch=None):
+    """
+    Tokenizes every value of col_hit_name after start_key. With read_mode
+    "stream" the column is read by a single query through a streaming cursor,
+    with "keyset" by one query per batch. on_batch(pkeys) is called after every
+    batch is written back, in primary key order.
+    """
+    report = get_report(progress)
+    rows = report.time_iter("db_read", read_batches(source_conn, table_name, pkey_col_names,
+        col_hit_name, batch_size, read_mode, start_key, schema))
+    batches = (split_batch_pkey_data(batch) for batch in rows)
+    for pkeys, tokens in tokenize_batches(cts, batches, tkgroup, tktemplate, concurrency):
+        with report.timer("db_write"):
+            source_conn.update_batch(table_name, pkey_col_names, col_hit_name, pkeys, tokens,
+                schema=schema)
+        Metrics.inc("rows_tokenized_total", len(pkeys), action="remediation")
+        if on_batch is not None:
+            on_batch(pkeys)
+        if progress is not None:
+            progress.add_processed(len(pkeys))
+
+
+def tokenize_table(cts: CTSRequest, source_conn, schema: str, table_name: str, columns: list,
+        pkey_col_names: list, batch_size: int, tkgroup: str, tktemplates: list,
+        concurrency: int = 1, read_mode: str = "stream", progress: ExecutionProgress = None,
+        start_key: tuple = None, on_batch=None):
+    """
+    Tokenizes every value of the columns after start_key in a single pass: the
+    table is read once, each column is tokenized with its own template from
+    tktemplates and every batch is written back by one UPDATE for all the
+    columns. on_batch(pkeys) is called as in tokenize_column.
+    """
+    report = get_report(progress)
+    rows = report.time_iter("db_read", read_batches(source_conn, table_name, pkey_col_names,
+        columns, batch_size, read_mode, start_key, schema))
+    batches = (split_batch_pkey_columns(batch, len(columns)) for batch in rows)
+    for pkeys, tokens in tokenize_table_batches(cts, batches, tkgroup, tktemplates, concurrency):
+        with report.timer("db_write"):
+            source_conn.update_batch(table_name, pkey_col_names, columns, pkeys, tokens,
+                schema=schema)
+        Metrics.inc("rows_tokenized_total", len(pkeys), action="remediation")
+        if on_batch is not None:
+            on_batch(pkeys)
+        if progress is not None:
+            progress.add_processed(len(pkeys) * len(columns))
+
+
+def read_batches(source_conn, table_name: str, pkey_col_names: list, column, batch_size: int,
+        read_mode: str = "stream", start_key: tuple = None, schema: str = None):
+    if read_mode == "keyset":
+        return source_conn.iter_batches(table_name, pkey_col_names, column, batch_size,
+            schema=schema, start_key=start_key)
+    return source_conn.stream_batches(table_name, pkey_col_names, column, batch_size,
+        schema=schema, start_key=start_key)
+
+
+def tokenize_batches(cts: CTSRequest, batches, tkgroup: str, tktemplate: str,
+        concurrency: int = 1):
+    """
+    Yields (pkeys, tokens) for every (pkeys, data) batch, in the same order.
+    With concurrency > 1 up to that many batches are tokenized by the CTS at
+    the same time, while the caller keeps reading and writing the database.
+    The batches iterable and the consumer both run in the calling thread, so
+    the DB connection is never shared between threads. An AsyncCTSRequest
+    keeps the batches in flight in its event loop instead of a thread pool.
+    """
+    items = ((pkeys, data, tktemplate) for pkeys, data in batches)
+    yield from _tokenize_items(cts, items, tkgroup, concurrency)
+
+
+def tokenize_table_batches(cts: CTSRequest, batches, tkgroup: str, tktemplates: list,
+        concurrency: int = 1):
+    """
+    Yields (pkeys, rows) for every (pkeys, columns_data) batch, where rows[i]
+    is the tuple of the tokens of the columns of row i. Each column is sent to
+    the CTS as its own request with its own template, and the columns of up
+    to concurrency batches are in flight at the same time.
+    """
+    items = ((pkeys, data, tktemplate) for pkeys, columns_data in batches
+             for data, tktemplate in zip(columns_data, tktemplates))
+    results = _tokenize_items(cts, items, tkgroup, concurrency * len(tktemplates))
+    for columns_results in ut.chunked(results, len(tktemplates)):
+        pkeys = columns_results[0][0]
+        yield pkeys, list(zip(*(tokens for _, tokens in columns_results)))
+
+
+def _tokenize_items(cts: CTSRequest, items, tkgroup: str, concurrency: int):
+    """
+    Yields (key, tokens) for every (key, data, tktemplate) item, in order
+    """
+    if isinstance(cts, AsyncCTSRequest):
+        yield from _tokenize_in_flight(cts.submit, items, tkgroup, concurrency)
+        return
+
+    if concurrency <= 1:
+        for key, data, tktemplate in items:
+            yield key, cts.tokenize(data, tkgroup, tktemplate)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        submit = lambda data, tkgroup, tktemplate: executor.submit(cts.tokenize, data, tkgroup,
+            tktemplate)
+        yield from _tokenize_in_flight(submit, items, tkgroup, concurrency)
+
+
+def _tokenize_in_flight(submit, items, tkgroup: str, concurrency: int):
+    in_flight = deque()
+    try:
+        for key, data, tktemplate in items:
+            in_flight.append((key, submit(data, tkgroup, tktemplate)))
+            if len(in_flight) >= concurrency:
+                done_key, future = in_flight.popleft()
+                yield done_key, future.result()
+
+        while in_flight:
+            done_key, future = in_flight.popleft()
+            yield done_key, future.result()
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
 
 def get_tokenized_cols_from_comments(comments: list) -> list:
     cols = []
@@ -181,20 +448,52 @@ def get_ds_connector(bigid: BigIDAPI, config: RawConfigParser, tpa_id: str, ds_n
     ds_conn_getter.set_credentials(
         bigid.get_data_source_credentials(tpa_id, ds_name))
     connector_class, host, port, db = ds_conn_getter.get_conn_param()
+    rdb_type = ds_conn_getter.get_rdb_type()
+    connector_options = {}
+    if config.has_section("WriteStrategy"):
+        connector_options["write_strategy"] = config["WriteStrategy"].get(rdb_type)
+    if rdb_type == "rdb-mssql" and config.has_section("SQLServer"):
+        connector_options.update(config["SQLServer"])
+    if rdb_type == "rdb-mysql" and config.has_section("MySQL"):
+        connector_options.update(config["MySQL"])
     return connector_class(host, port, db,
         ds_conn_getter.get_username(config["BigID"]["encryption_key"]),
-        ds_conn_getter.get_password(config["BigID"]["encryption_key"]))
+        ds_conn_getter.get_password(config["BigID"]["encryption_key"]),
+        **connector_options)
+
 
+def get_table_size(ds_conn, table_name: str, schema: str = None) -> int:
+    """
+    Returns the number of rows of the table for progress reporting. Uses the
+    catalog statistics and only counts the rows of tables without them.
+    """
+    table_size = ds_conn.estimate_table_size(table_name, schema)
+    if table_size is None:
+        Log.info(f"No statistics for {table_name}, counting its rows")
+        table_size = get_nlines(ds_conn, table_name, schema)
+    return table_size
 
-def get_nlines(ds_conn, table_name: str) -> int:
-    query = f"SELECT COUNT(*) FROM {table_name}"
+
+def get_nlines(ds_conn, table_name: str, schema: str = None) -> int:
+    query = f"SELECT COUNT(*) FROM {ds_conn.get_source(table_name, schema)}"
     nlines = ds_conn.run_query(query, fetch_results=True)
     return nlines[0][0]
 
 
-def get_batch_pkey_data(ds_conn, table_name: str, primary_key: str, column: str,
-        offset: int, fetch_next: int) -> tuple:
-    batch = ds_conn.get_batch(table_name, primary_key, column, offset, fetch_next)
-    pkeys = [p[0] for p in batch]
-    data = [d[1] for d in batch]
+def split_batch_pkey_data(batch: list) -> tuple:
+    """
+    Splits (pk_1, ..., pk_n, value) rows into the primary key tuples and the values
+    """
+    pkeys = [tuple(row[:-1]) for row in batch]
+    data = [row[-1] for row in batch]
     return pkeys, data
+
+
+def split_batch_pkey_columns(batch: list, ncols: int) -> tuple:
+    """
+    Splits (pk_1, ..., pk_n, value_1, ..., value_ncols) rows into the primary
+    key tuples and the list of values of every column
+    """
+    pkeys = [tuple(row[:-ncols]) for row in batch]
+    columns_data = [[row[len(row) - ncols + i] for row in batch] for i in range(ncols)]
+    return pkeys, columns_data
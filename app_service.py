@@ -1,15 +1,20 @@
 import utils.utils as ut
 
+from configparser import RawConfigParser
 from bigid.bigid import BigIDAPI
+from cts.async_cts_request import AsyncCTSRequest
+from cts.batch_tuner import BatchTuner
 from cts.cts_request import CTSRequest
+from cts.token_cache import TokenCache
 from app_modules import anonymization, remediation
+from utils.jobs import ExecutionProgress
 from utils.log import Log
 
 
 class AppService:
 
-    def __init__(self):
-        self.config = ut.read_config_file("config.ini")
+    def __init__(self, config: RawConfigParser = None):
+        self.config = config if config is not None else ut.read_config_file("config.ini")
 
         # User token not used yet
         self.bigid_user_token = ut.get_bigid_user_token(self.config["BigID"]["user_token_path"])
@@ -17,6 +22,7 @@ class AppService:
     
     def initialize_from_post_params(self, arguments: dict):
         self.tpa_id = arguments["tpaId"]
+        self.update_result_callback = arguments.get("updateResultCallback")
         self.bigid = BigIDAPI(self.config, arguments["bigidBaseUrl"])
 
         action_params = arguments["actionParams"]
@@ -24,8 +30,33 @@ class AppService:
         self.validate_params()
         cts_hostname = self.config["CTS"]["hostname"]
         cts_cert_path = self.config["CTS"]["certificate"]
+        cts_pool_size = self.config["CTS"].getint("pool_size", fallback=10)
+        cts_max_in_flight = self.config["CTS"].getint("max_in_flight", fallback=16)
+        if self.params.get("CTSClient", "threads") == "async":
+            self.cts = AsyncCTSRequest(cts_hostname, self.params["CTSUsername"],
+                self.params["CTSPassword"], cts_cert_path, cts_pool_size, cts_max_in_flight,
+                self.config["CTS"].getfloat("timeout", fallback=5),
+                self.config["CTS"].getint("max_retries", fallback=3))
+            Log.info("AsyncCTSRequest initialized")
+            return
+
+        token_cache = None
+        if self.params.get("TokenCacheSize", 0) > 0:
+            token_cache = TokenCache(self.params["TokenCacheSize"],
+                self.config["CTS"].getint("token_cache_max_bytes", fallback=67108864))
+        batch_tuner = None
+        if self.config["CTS"].getboolean("adaptive_batching", fallback=True):
+            batch_tuner = BatchTuner(
+                self.config["CTS"].getint("initial_batch_size", fallback=100),
+                self.config["CTS"].getint("min_batch_size", fallback=1),
+                self.config["CTS"].getint("max_batch_size", fallback=10000),
+                self.config["CTS"].getfloat("target_latency", fallback=1.0),
+                self.config["CTS"].getint("max_payload_bytes", fallback=1048576),
+                self.config["CTS"].getint("increase_step", fallback=50))
         self.cts = CTSRequest(cts_hostname, self.params["CTSUsername"], self.params["CTSPassword"],
-            cts_cert_path)
+            cts_cert_path, cts_pool_size, cts_max_in_flight, token_cache, batch_tuner,
+            self.config["CTS"].getfloat("timeout", fallback=5),
+            self.config["CTS"].getint("max_retries", fallback=3))
         Log.info("CTSRequest initialized")
 
     def validate_params(self):
@@ -36,9 +67,84 @@ class AppService:
                 raise ValueError("BatchSize menor que 0.")
             self.params["BatchSize"] = batch_size
 
+        for param in ("CTSConcurrency", "SourceConcurrency", "TableConcurrency"):
+            if param in self.params:
+                concurrency = int(self.params[param])
+                if concurrency <= 0:
+                    Log.error(f"{param} must be greater than 0.")
+                    raise ValueError(f"{param} must be greater than 0.")
+                self.params[param] = concurrency
+
+        if "TokenCacheSize" in self.params:
+            token_cache_size = int(self.params["TokenCacheSize"] or 0)
+            if token_cache_size < 0:
+                Log.error("TokenCacheSize must not be negative.")
+                raise ValueError("TokenCacheSize must not be negative.")
+            self.params["TokenCacheSize"] = token_cache_size
+
+        if "CTSClient" in self.params and self.params["CTSClient"] not in ("threads", "async"):
+            Log.error(f"Invalid CTSClient {self.params['CTSClient']}.")
+            raise ValueError(f"Invalid CTSClient {self.params['CTSClient']}. Use threads or async.")
+
+        if self.params.get("CTSClient") == "async":
+            if self.params.get("TokenCacheSize", 0) > 0:
+                Log.error("TokenCacheSize is not supported with CTSClient async.")
+                raise ValueError("TokenCacheSize is not supported with CTSClient async. "
+                    + "Use CTSClient threads or TokenCacheSize 0.")
+            if self.config["CTS"].getboolean("adaptive_batching", fallback=True):
+                Log.warn("Adaptive batching is not supported with CTSClient async, "
+                    + "the batches are sent to the CTS as they are read.")
+
+        if "ReadMode" in self.params and self.params["ReadMode"] not in ("stream", "keyset"):
+            Log.error(f"Invalid ReadMode {self.params['ReadMode']}.")
+            raise ValueError(f"Invalid ReadMode {self.params['ReadMode']}. Use stream or keyset.")
 
-    def data_anonymization(self):
-        anonymization.run_data_anonymization(self.config, self.params, self.tpa_id, self.cts, self.bigid)
+        if "TokenizeMode" in self.params and self.params["TokenizeMode"] not in ("table", "column"):
+            Log.error(f"Invalid TokenizeMode {self.params['TokenizeMode']}.")
+            raise ValueError(f"Invalid TokenizeMode {self.params['TokenizeMode']}. Use table or column.")
+
+        if "ColumnTokentemplates" in self.params:
+            try:
+                ut.read_column_tokentemplates(self.params["ColumnTokentemplates"])
+            except ValueError as err:
+                Log.error(str(err))
+                raise
+
+
+    def report_status(self, status: dict):
+        """
+        Sends the execution status to BigID when it provided a callback URL
+        """
+        if self.update_result_callback:
+            self.bigid.update_action_status(self.update_result_callback, status)
+
+    def data_anonymization(self, progress: ExecutionProgress = None):
+        if progress is not None:
+            self.cts.report = progress.report
+        try:
+            anonymization.run_data_anonymization(self.config, self.params, self.tpa_id, self.cts,
+                self.bigid, progress)
+        finally:
+            self.finish_cts()
     
-    def data_remediation(self):
-        remediation.run_data_remediation(self.cts, self.bigid, self.config, self.params, self.tpa_id)
\ No newline at end of file
+    def data_remediation(self, progress: ExecutionProgress = None):
+        if progress is not None:
+            self.cts.report = progress.report
+        try:
+            remediation.run_data_remediation(self.cts, self.bigid, self.config, self.params,
+                self.tpa_id, progress)
+        finally:
+            self.finish_cts()
+
+    def finish_cts(self):
+        """
+        Logs the CTS stats and drops the cached clear text values of the job
+        """
+        Log.info(f"CTS connection stats: {self.cts.get_connection_stats()}")
+        if self.cts.batch_tuner is not None:
+            Log.info(f"CTS batching stats: {self.cts.batch_tuner.get_stats()}")
+        if self.cts.token_cache is not None:
+            Log.info(f"CTS token cache stats: {self.cts.token_cache.get_stats()}")
+            self.cts.token_cache.clear()
+        if isinstance(self.cts, AsyncCTSRequest):
+            self.cts.close()
\ No newline at end of file
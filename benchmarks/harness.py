@@ -0,0 +1,261 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import threading
+import time
+
+from unittest import mock
+
+import requests
+
+import utils.utils as ut
+from app_service import AppService
+from benchmarks.sqlite_conn import SQLiteConnector
+from databases.ds_connection import DataSourceConnection
+from standins.bigid_server import BigIDStandIn, SyntheticCatalog
+from standins.cts_server import CTSStandIn
+from standins.server import ServerProcess, get_ssl_context
+from utils.log import configure_log
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Action and parameters of every benchmark case
+CASES = {
+    "remediation-staging": {"action": "remediation", "write_strategy": "staging",
+                            "tokenize_mode": "table"},
+    "remediation-executemany": {"action": "remediation", "write_strategy": "executemany",
+                                "tokenize_mode": "table"},
+    "remediation-column": {"action": "remediation", "write_strategy": "staging",
+                           "tokenize_mode": "column"},
+    "anonymization": {"action": "anonymization"},
+}
+
+# Rates compared against the baseline, and whether higher is better
+METRICS = {"rows_per_sec": True, "cts_calls_per_sec": True, "peak_rss_mb": False}
+
+
+class InProcessCTS:
+    """
+    CTS client that computes the stand-in tokens without any HTTP, so the
+    read, tokenize and write pipeline can be benchmarked on its own
+    """
+    def __init__(self):
+        self.token_cache = None
+        self.batch_tuner = None
+        self.requests    = 0
+        self.values      = 0
+        self._standin    = CTSStandIn()
+        self._lock       = threading.Lock()
+
+    def tokenize(self, values, tokengroup: str, tokentemplate: str) -> list:
+        with self._lock:
+            self.requests += 1
+            self.values += len(values)
+        return [self._standin.get_token(tokengroup, tokentemplate, val).get("token", val)
+                for val in values]
+
+    def get_connection_stats(self) -> dict:
+        return {"requests": self.requests, "values": self.values}
+
+
+def seed_database(path: str, rows: int, tables: int, columns: int):
+    """
+    Creates the tables of a SyntheticCatalog with rows rows in total. Table t
+    holds the ids r with r % tables == t, as the minimization requests expect.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    col_names = [f"col_{col}" for col in range(columns)]
+    for table in range(tables):
+        conn.execute(f"CREATE TABLE table_{table} (id INTEGER PRIMARY KEY, "
+            + ", ".join(f"{col} TEXT" for col in col_names) + ")")
+        placeholders = ", ".join(["?"] * (columns + 1))
+        conn.executemany(f"INSERT INTO table_{table} VALUES ({placeholders})",
+            ((row, *[f"{col}_{row}" for col in col_names]) for row in range(table, rows, tables)))
+        conn.commit()
+    conn.close()
+
+
+def count_clear_rows(path: str, tables: int) -> int:
+    """
+    Returns the rows whose col_0 still holds its original value
+    """
+    conn = sqlite3.connect(path)
+    try:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM table_{table} "
+            + "WHERE col_0 = 'col_0_' || id").fetchone()[0] for table in range(tables))
+    finally:
+        conn.close()
+
+
+def get_config(workdir: str, cts_host: str, write_strategy: str = None):
+    config = ut.read_config_file(os.path.join(REPO_DIR, "config.ini"))
+    token_path = os.path.join(workdir, "bigid_token")
+    with open(token_path, "w", encoding="utf-8") as f:
+        f.write("benchmark-token")
+
+    config["CTS"]["hostname"] = cts_host
+    config["CTS"]["certificate"] = ""
+    config["BigID"]["user_token_path"] = token_path
+    config["BigID"]["encryption_key"] = "benchmark"
+    config["BigID"]["remediation_id"] = "benchmark"
+    config["Checkpoints"]["path"] = os.path.join(workdir, "checkpoints.db")
+    if write_strategy is not None:
+        config["WriteStrategy"]["rdb-postgresql"] = write_strategy
+    return config
+
+
+def get_action_params(case: dict, batch_size: int, concurrency: int) -> list:
+    params = {
+        "CTSUsername": "user",
+        "CTSPassword": "password",
+        "CTSTokengroup": "benchmark",
+        "CTSTokentemplate": "benchmark",
+        "BatchSize": str(batch_size),
+        "CTSConcurrency": str(concurrency),
+    }
+    if case["action"] == "remediation":
+        params["TokenizeMode"] = case["tokenize_mode"]
+    else:
+        # The ids are integer primary keys, only the PII columns are anonymized
+        params["Categories"] = "PII"
+    return [{"paramName": name, "paramValue": value} for name, value in params.items()]
+
+
+def get_cts_stats(cts_url: str) -> dict:
+    return requests.get(f"{cts_url}/standin/stats", verify=False, timeout=5).json()
+
+
+def run_case(name: str, rows: int, workdir: str, cts_mode: str = "standin",
+        cts_latency: float = 0, batch_size: int = 1000, concurrency: int = 4, tables: int = 4,
+        columns: int = 3) -> dict:
+    """
+    Seeds a SQLite database, starts the stand-ins and runs the case's action
+    in a child process of its own, so its peak memory is measured alone.
+    Returns the result of the case.
+    """
+    case = CASES[name]
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, f"{name}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    seed_start = time.perf_counter()
+    seed_database(db_path, rows, tables, columns)
+    seed_seconds = time.perf_counter() - seed_start
+
+    catalog = SyntheticCatalog(sources=1, tables=tables, columns=columns,
+        requests=rows if case["action"] == "anonymization" else 0)
+    bigid_server = ServerProcess(lambda: BigIDStandIn(catalog).create_app()).start()
+    cts_server = None
+    if cts_mode == "standin":
+        cts_server = ServerProcess(lambda: CTSStandIn(latency=cts_latency).create_app(),
+            ssl_context=get_ssl_context()).start()
+
+    try:
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_run_action, args=(queue, case, db_path, workdir,
+            bigid_server.url, cts_server.url if cts_server else None, batch_size, concurrency))
+        process.start()
+        result = queue.get()
+        process.join()
+        if "error" in result:
+            raise RuntimeError(f"Benchmark {name} failed: {result['error']}")
+        if cts_server is not None:
+            stats = get_cts_stats(cts_server.url)
+            result["cts_calls"], result["values_tokenized"] = stats["requests"], stats["values"]
+    finally:
+        bigid_server.stop()
+        if cts_server is not None:
+            cts_server.stop()
+
+    seconds = result["seconds"]
+    result.update({
+        "name": name,
+        "rows": rows,
+        "cts": cts_mode,
+        "seed_seconds": round(seed_seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1),
+        "cts_calls_per_sec": round(result["cts_calls"] / seconds, 1),
+        "clear_rows_left": count_clear_rows(db_path, tables),
+    })
+    return result
+
+
+def _run_action(queue, case: dict, db_path: str, workdir: str, bigid_url: str, cts_url: str,
+        batch_size: int, concurrency: int):
+    try:
+        configure_log("INFO", os.path.join(workdir, "log.txt"))
+        cts_host = cts_url.split("://", 1)[1] if cts_url else "localhost"
+        config = get_config(workdir, cts_host, case.get("write_strategy"))
+        service = AppService(config)
+        sqlite_conn_params = lambda ds_conn: (SQLiteConnector, "localhost", 0, db_path)
+
+        with mock.patch.object(DataSourceConnection, "get_conn_param", sqlite_conn_params):
+            service.initialize_from_post_params({"tpaId": "benchmark",
+                "bigidBaseUrl": f"{bigid_url}/api/v1/",
+                "actionParams": get_action_params(case, batch_size, concurrency)})
+            if cts_url is None:
+                service.cts = InProcessCTS()
+
+            start = time.perf_counter()
+            if case["action"] == "remediation":
+                service.data_remediation()
+            else:
+                service.data_anonymization()
+            seconds = time.perf_counter() - start
+
+        result = {"seconds": round(seconds, 3),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+        if cts_url is None:
+            result["cts_calls"] = service.cts.requests
+            result["values_tokenized"] = service.cts.values
+        queue.put(result)
+    except Exception as err:
+        queue.put({"error": repr(err)})
+
+
+def get_environment() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(),
+        "cpus": os.cpu_count(), "sqlite": sqlite3.sqlite_version}
+
+
+def compare_results(results: list, baseline: list, tolerance: float = 0.25) -> list:
+    """
+    Returns a message for every metric that is more than tolerance worse
+    than the baseline result of the same case, rows and CTS mode
+    """
+    baseline_by_key = ut.index_by(baseline, lambda res: (res["name"], res["rows"], res["cts"]))
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get((result["name"], result["rows"], result["cts"]))
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{result['name']} ({result['rows']} rows, {result['cts']} CTS): "
+                    + f"{metric} {result[metric]} vs baseline {base[metric]} ({change:+.0%})")
+    return regressions
+
+
+def read_results(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def write_results(path: str, results: list, options: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "argv": sys.argv[1:],
+            "environment": get_environment(), "options": options, "results": results}, f, indent=2)
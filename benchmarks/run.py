@@ -0,0 +1,92 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import urllib3
+
+from benchmarks.harness import CASES, SCALES, compare_results, read_results, run_case, \
+    write_results
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Remediation and anonymization throughput benchmarks")
+    parser.add_argument("--scale", choices=SCALES.keys(), default="10k",
+        help="Rows of the benchmark database")
+    parser.add_argument("--rows", type=int, help="Rows of the benchmark database, overrides --scale")
+    parser.add_argument("--cases", default=",".join(CASES.keys()),
+        help="Comma separated cases: " + ", ".join(CASES.keys()))
+    parser.add_argument("--cts", choices=("standin", "inprocess"), default="standin",
+        help="Tokenize through the CTS stand-in over HTTPS or in process")
+    parser.add_argument("--cts-latency", type=float, default=0, help="Seconds per CTS request")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4, help="CTSConcurrency parameter")
+    parser.add_argument("--tables", type=int, default=4)
+    parser.add_argument("--columns", type=int, default=3, help="Policy hit columns per table")
+    parser.add_argument("--workdir", help="Directory of the databases and logs, a temporary one by default")
+    parser.add_argument("--output", help="Results file, benchmarks/results/<time>.json by default")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="Relative change of a metric reported as a regression")
+    parser.add_argument("--update-baseline", action="store_true",
+        help="Stores the results as the new baseline")
+    args = parser.parse_args()
+    # The CTS stand-in certificate is self-signed
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    rows = args.rows or SCALES[args.scale]
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases {unknown}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="benchmarks-")
+    options = {"cts_latency": args.cts_latency, "batch_size": args.batch_size,
+        "concurrency": args.concurrency, "tables": args.tables, "columns": args.columns}
+
+    results = []
+    for case in cases:
+        print(f"Running {case} with {rows} rows...", flush=True)
+        result = run_case(case, rows, workdir, args.cts, args.cts_latency, args.batch_size,
+            args.concurrency, args.tables, args.columns)
+        print(f"  {result['seconds']}s, {result['rows_per_sec']} rows/s, "
+            + f"{result['cts_calls_per_sec']} CTS calls/s, {result['peak_rss_mb']} MB peak", flush=True)
+        results.append(result)
+
+    output = args.output or os.path.join(os.path.dirname(BASELINE_PATH), "results",
+        time.strftime("%Y%m%d-%H%M%S") + ".json")
+    write_results(output, results, options)
+    print(f"Results written to {output}")
+
+    failed = [res["name"] for res in results if res["clear_rows_left"] > 0]
+    if failed:
+        print(f"Rows left in clear text by {failed}")
+        return 1
+
+    if args.update_baseline:
+        baseline = [res for res in read_results(args.baseline)
+                    if (res["name"], res["rows"], res["cts"]) not in
+                    {(new["name"], new["rows"], new["cts"]) for new in results}] \
+            if os.path.exists(args.baseline) else []
+        write_results(args.baseline, baseline + results, options)
+        print(f"Baseline {args.baseline} updated")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to store one")
+        return 0
+
+    regressions = compare_results(results, read_results(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import sqlite3
+
+from typing import Union
+
+from databases.connection_interface import DBConnectionInterface
+from utils.log import Log
+
+
+class SQLiteConnector(DBConnectionInterface):
+    """
+    SQLite data source for the benchmarks. database is the path of the file,
+    the other connection parameters are ignored. Schemas are ignored too.
+    """
+    write_strategies = ("staging", "executemany")
+
+    def __init__(self, hostname: str, port: int, database: str, username: str, password: str,
+            *args, write_strategy: str = None, **kwargs):
+        self._database = database
+        self.set_write_strategy(write_strategy)
+        self._conn = self._new_connection()
+        # WAL lets the streaming connection read while the main one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.is_connected = True
+        Log.info(f"Connected at SQLite {self._database}")
+
+    def _new_connection(self):
+        return sqlite3.connect(self._database)
+
+    def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
+            params_mult: list = None, params: list = None):
+        cursor = self._conn.cursor()
+        if is_multiple:
+            cursor.executemany(query, params_mult)
+        else:
+            cursor.execute(query, params or [])
+        rows = cursor.fetchall() if fetch_results else None
+        Log.debug("SQLite Query execution OK")
+        self._conn.commit()
+        cursor.close()
+        if rows:
+            return rows
+
+    def get_primary_keys(self, table_name: str, schema: str = None) -> list:
+        columns = self.run_query(f"PRAGMA table_info({table_name})", fetch_results=True) or []
+        return [col[1] for col in sorted(columns, key=lambda col: col[5]) if col[5] > 0]
+
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        # sqlite_stat1 is filled by ANALYZE, its first number is the row count
+        try:
+            rows = self.run_query("SELECT stat FROM sqlite_stat1 WHERE tbl = ?",
+                fetch_results=True, params=[table_name])
+        except sqlite3.OperationalError:
+            return None
+        return int(rows[0][0].split()[0]) if rows else None
+
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        limit_str = f"LIMIT {fetch_next}" if fetch_next else ""
+        query = f"""
+            SELECT {pkeys_str}, {columns_str}
+            FROM {table_name}
+            {where_str}
+            ORDER BY {pkeys_str}
+            {limit_str}
+        """
+        return query, params
+
+    def placeholder(self, position: int) -> str:
+        return "?"
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        set_str = ", ".join(f"{col} = ?" for col in self.get_columns(column))
+        where_str = " AND ".join(f"{pkey} = ?" for pkey in primary_keys)
+        return f"""
+            UPDATE {table_name}
+            SET {set_str}
+            WHERE {where_str}
+        """
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        """
+        Loads the batch into a temporary table and applies it with a single
+        UPDATE ... FROM
+        """
+        pkeys_str = ", ".join(primary_keys)
+        join_str = " AND ".join(f"{table_name}.{pkey} = s.{pkey}" for pkey in primary_keys)
+        tokens_str = ", ".join(f"thales_token_{i}" for i in range(len(columns)))
+        select_str = ", ".join(f"{col} AS thales_token_{i}" for i, col in enumerate(columns))
+        set_str = ", ".join(f"{col} = s.thales_token_{i}" for i, col in enumerate(columns))
+        placeholders = ", ".join(["?"] * (len(primary_keys) + len(columns)))
+
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(f"""
+                CREATE TEMP TABLE thales_staging AS
+                SELECT {pkeys_str}, {select_str} FROM {table_name} LIMIT 0
+            """)
+            cursor.executemany(f"""
+                INSERT INTO thales_staging ({pkeys_str}, {tokens_str}) VALUES ({placeholders})
+            """, [(*pk, *row) for pk, row in zip(pkeys, rows)])
+            cursor.execute(f"""
+                UPDATE {table_name}
+                SET {set_str}
+                FROM thales_staging AS s
+                WHERE {join_str}
+            """)
+            cursor.execute("DROP TABLE thales_staging")
+            self._conn.commit()
+            Log.debug(f"SQLite staging update of {len(rows)} rows OK")
+        except Exception as err:
+            self._conn.rollback()
+            Log.error(f"Error while running SQLite staging update: {err}")
+            raise
+        finally:
+            cursor.close()
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        conn = self._new_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.arraysize = batch_size
+            cursor.execute(query, params or [])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+        finally:
+            conn.close()
+
+    def close_connection(self):
+        if self.is_connected:
+            self._conn.close()
+            self.is_connected = False
+            Log.info(f"SQLite closed connection {self._database}")
@@ -1,10 +1,14 @@
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from configparser import RawConfigParser
 from typing import Union
 
 import utils.utils as ut
+from utils.cache import TTLCache
 from utils.log import Log
+from utils.metrics import track_calls
 from utils.exceptions import BigIDAPIException
 from databases.ds_connection import DataSourceConnection
 
@@ -16,6 +20,13 @@ class BigIDAPI:
         self._base_url    = base_url
         self._access_token_h_duration = 23     # Access token duration in hours
         self._proxies = ut.get_proxy_from_config(self._config)
+        # Keep-alive session shared by all BigIDAPI objects of this worker
+        self._session = ut.get_pooled_session(f"bigid:{self._base_url}",
+            self._config.getint("BigID", "pool_size", fallback=10), self._proxies)
+        self._max_concurrency = self._config.getint("BigID", "max_concurrency", fallback=8)
+        self._token_lock = threading.Lock()
+        # Tags, data source connections and credentials are looked up once per run
+        self._cache = TTLCache(self._config.getfloat("BigID", "cache_ttl", fallback=300))
 
         self._access_token_time        = None
         self._access_token             = None
@@ -23,13 +34,15 @@ class BigIDAPI:
 
         self._update_session_token()
 
+    @track_calls("bigid_request")
     def _update_session_token(self):
         token_url = f"{self._base_url}refresh-access-token"
         headers = {
             "Accept": "application/json",
             "Authorization": self._user_token
         }
-        get_response = ut.json_get_request(token_url, headers, self._proxies)
+        get_response = ut.json_get_request(token_url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error(f"BigID session token HTTP {get_response.status_code}: {get_response.text}")
@@ -41,20 +54,44 @@ class BigIDAPI:
         Log.info("BigID session token updated")
 
     def validate_session_token(self):
-        if time.time() - self._access_token_time > self._access_token_h_duration * 3600:
-            self._update_session_token()
+        with self._token_lock:
+            if time.time() - self._access_token_time > self._access_token_h_duration * 3600:
+                self._update_session_token()
+
+    def _fan_out(self, func, items: list) -> dict:
+        """
+        Calls func for every distinct item with up to max_concurrency requests
+        at the same time and returns the results keyed by item. The first
+        failure is raised.
+        """
+        items = list(dict.fromkeys(items))
+        if len(items) <= 1 or self._max_concurrency <= 1:
+            return {item: func(item) for item in items}
+        with ThreadPoolExecutor(max_workers=min(self._max_concurrency, len(items))) as executor:
+            return dict(zip(items, executor.map(func, items)))
 
     def update_minimization_requests(self, offset: int, fetch_next: int) -> dict:
+        min_requests, _ = self.get_minimization_requests_page(offset, fetch_next)
+        return min_requests
+
+    @track_calls("bigid_request")
+    def get_minimization_requests_page(self, offset: int, fetch_next: int) -> tuple:
+        """
+        Returns the minimization requests of a page and the total number of
+        pending objects. Objects are sorted by requestId, so the objects of a
+        request are in consecutive pages.
+        """
         self.validate_session_token()
         url = f'{self._base_url}data-minimization/objects?skip={offset}&limit={fetch_next}' +\
-            '&requireTotalCount=true&sort=[{"field":"name","order":"asc"}]' +\
+            '&requireTotalCount=true&sort=[{"field":"requestId","order":"asc"},{"field":"_id","order":"asc"}]' +\
             '&filter=[{"field":"state","value":["Pending"],"operator":"in"},' +\
                     '{"field":"markedAs","value":["Delete Manually"],"operator":"in"}]'
         headers = {
             "Accept": "application/json",
             "Authorization": self._access_token
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID minimization request failed with status code "
@@ -79,11 +116,12 @@ class BigIDAPI:
 
         #self._minimization_requests = min_requests
         Log.info(f"Got {len(min_requests)} minimization requests from BigID")
-        return min_requests
+        return min_requests, get_response["data"].get("totalCount")
 
     #def get_minimization_requests(self) -> list:
     #    return self._minimization_requests
 
+    @track_calls("bigid_request")
     def get_sar_report(self, request_id: str) -> list:
         self.validate_session_token()
 
@@ -92,7 +130,8 @@ class BigIDAPI:
             "Accept": "application/json",
             "Authorization": self._access_token
         }
-        get_response = ut.json_get_request(sar_url, headers, self._proxies)
+        get_response = ut.json_get_request(sar_url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID sar report failed with status code "
@@ -104,14 +143,35 @@ class BigIDAPI:
         Log.info(f"Got sar report from BigID for {request_id=}")
         return get_response["records"]
 
+    def get_sar_reports(self, request_ids: list) -> dict:
+        """
+        Returns the SAR report records of every request, fetched in parallel
+        """
+        return self._fan_out(self.get_sar_report, request_ids)
+
+    def invalidate_cache(self, key: tuple = None):
+        """
+        Drops a cached lookup, e.g. ("tags",), ("ds_connection", name) or
+        ("credentials", tpa_id, name), or the whole cache if key is None
+        """
+        self._cache.invalidate(key)
+        if key == ("tags",):
+            self._cache.invalidate(("tags_index",))
+
     def get_data_source_conn_from_source_name(self, data_source_name: str) -> DataSourceConnection:
+        return self._cache.get_or_load(("ds_connection", data_source_name),
+            lambda: self._get_data_source_conn_from_source_name(data_source_name))
+
+    @track_calls("bigid_request")
+    def _get_data_source_conn_from_source_name(self, data_source_name: str) -> DataSourceConnection:
         self.validate_session_token()
         url = f"{self._base_url}ds_connections/{data_source_name}"
         headers = {
             "Accept": "application/json",
             "Authorization": self._access_token
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID data source request failed with status code"
@@ -125,6 +185,20 @@ class BigIDAPI:
         conn_type = get_response["ds_connection"]["type"]
         return DataSourceConnection(rdb_url, conn_type, rdb_name)
 
+    def get_data_source_conns(self, tpa_id: str, data_source_names: list) -> dict:
+        """
+        Returns the connection of every data source, with its credentials set,
+        fetched in parallel
+        """
+        def get_conn(data_source_name: str) -> DataSourceConnection:
+            ds_conn_getter = self.get_data_source_conn_from_source_name(data_source_name)
+            ds_conn_getter.set_credentials(
+                self.get_data_source_credentials(tpa_id, data_source_name))
+            return ds_conn_getter
+
+        return self._fan_out(get_conn, data_source_names)
+
+    @track_calls("bigid_request")
     def get_all_data_sources(self, enabled: Union[bool, None] = None) -> list:
         """
         Returns all data sources available. If enabled is None, all are returned.
@@ -137,7 +211,8 @@ class BigIDAPI:
             "Accept": "application/json",
             "Authorization": self._access_token
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID data source list request failed with "
@@ -153,6 +228,7 @@ class BigIDAPI:
         else:
             return list(filter(lambda x: x["enabled"] == "no", get_response))
 
+    @track_calls("bigid_request")
     def get_data_sources_policy_hit(self) -> list:
         self.validate_session_token()
         url = f"{self._base_url}proxy/tpa/api/{self._config['BigID']['remediation_id']}/datasource/auditor-datasource"
@@ -161,7 +237,8 @@ class BigIDAPI:
             "Authorization": self._access_token,
             "Accept-version": "v1"
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID policy hit data source list request failed with "
@@ -172,6 +249,7 @@ class BigIDAPI:
         get_response = get_response.json()["results"]
         return list(filter(lambda x: len(x["policyHit"]) > 0, get_response))
 
+    @track_calls("bigid_request")
     def get_all_remediation_objects(self) -> list:
         self.validate_session_token()
         url = f"{self._base_url}proxy/tpa/api/{self._config['BigID']['remediation_id']}/object"
@@ -180,7 +258,8 @@ class BigIDAPI:
             "Authorization": self._access_token,
             "Accept-version": "v1"
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID policy hit data source list request failed with "
@@ -190,6 +269,7 @@ class BigIDAPI:
 
         return get_response.json()["results"]
 
+    @track_calls("bigid_request")
     def get_remediation_objects_by_source(self, source_name: str) -> list:
         """
         Gets remediation objects as they are seen when you click 
@@ -208,7 +288,8 @@ class BigIDAPI:
             "Accept-version": "v1",
             "filterV2": f'[{{"value": ["{source_name}"], "field": "source", "operator": "in"}}]'
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID remediation objects request failed with "
@@ -218,6 +299,14 @@ class BigIDAPI:
 
         return get_response.json()["results"]
 
+    def get_remediation_objects_by_fqn(self, source_name: str) -> dict:
+        """
+        Returns the remediation objects of the source keyed by fully qualified name
+        """
+        return ut.index_by(self.get_remediation_objects_by_source(source_name),
+            lambda obj: obj["fullyQualifiedName"])
+
+    @track_calls("bigid_request")
     def get_remediation_objects_by_source_columns(self, source_name: str) -> list:
         """
         Gets remediation objects as they are seen when you click columns option
@@ -237,7 +326,8 @@ class BigIDAPI:
             "Authorization": self._access_token,
             "Accept-version": "v1"
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID remediation objects col request failed with "
@@ -247,6 +337,7 @@ class BigIDAPI:
 
         return get_response.json()["results"]
 
+    @track_calls("bigid_request")
     def get_object_comments(self, obj_id: str) -> list:
         self.validate_session_token()
 
@@ -261,7 +352,8 @@ class BigIDAPI:
             "Authorization": self._access_token,
             "Accept-version": "v1"
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID object comments request failed with "
@@ -272,9 +364,27 @@ class BigIDAPI:
         return get_response.json()
 
     def get_bigid_tags(self) -> list:
-            """
-            Get all tags stored in BigID
-            """
+        """
+        Get all tags stored in BigID
+        """
+        return list(self._cache.get_or_load(("tags",), self._get_bigid_tags))
+
+    def get_tags_index(self) -> dict:
+        """
+        Returns the tags keyed by (tagName, tagValue). (tagName, None) holds the
+        first tag with that name, whatever its value.
+        """
+        def build_index() -> dict:
+            index = {}
+            for tag in self.get_bigid_tags():
+                index.setdefault((tag["tagName"], tag["tagValue"]), tag)
+                index.setdefault((tag["tagName"], None), tag)
+            return index
+
+        return self._cache.get_or_load(("tags_index",), build_index)
+
+    @track_calls("bigid_request")
+    def _get_bigid_tags(self) -> list:
             self.validate_session_token()
 
             url = f"{self._base_url}data-catalog/tags/all-pairs"
@@ -282,7 +392,8 @@ class BigIDAPI:
                 "Accept": "application/json",
                 "Authorization": self._access_token
             }
-            get_response = ut.json_get_request(url, headers, self._proxies)
+            get_response = ut.json_get_request(url, headers, self._proxies,
+                session=self._session)
             tags = get_response.json()["data"]
 
             if get_response.status_code != 200:
@@ -294,6 +405,7 @@ class BigIDAPI:
             return tags
 
 
+    @track_calls("bigid_request")
     def get_object_tags(self, object_name: str) -> list:
         """
         Object name is the fully qualified name
@@ -311,7 +423,8 @@ class BigIDAPI:
             "Authorization": self._access_token,
             "Accept-version": "v1"
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
         tags = get_response.json()["basicDetails"]["tags"]
 
         if get_response.status_code != 200:
@@ -324,6 +437,14 @@ class BigIDAPI:
 
 
 
+    def get_objects_tags(self, object_names: list) -> dict:
+        """
+        Returns the tags of every object, keyed by fully qualified name and
+        fetched in parallel
+        """
+        return self._fan_out(self.get_object_tags, object_names)
+
+    @track_calls("bigid_request")
     def create_main_tag(self, tag_name: str, tag_description: str = "") -> str:
         """
         Make sure the tag does not exist before running. Will return the new tag's
@@ -347,7 +468,8 @@ class BigIDAPI:
             "type": "TAG",
             "description": tag_description
         }
-        post_response = ut.json_post_request(url, headers, content, self._proxies)
+        post_response = ut.json_post_request(url, headers, content, self._proxies,
+            session=self._session)
 
         if post_response.status_code != 200:
             Log.info(post_response.text)
@@ -357,8 +479,20 @@ class BigIDAPI:
                 + f" with status code {post_response.status_code}")
 
         post_response = post_response.json()
+        self._add_cached_tag({"tagName": tag_name, "tagId": post_response["_id"],
+            "tagValue": None, "valueId": None})
         return post_response["_id"]
 
+    def _add_cached_tag(self, tag: dict):
+        """
+        Writes a tag created by this run through to the cached tag list
+        """
+        tags = self._cache.get(("tags",))
+        if tags is not None:
+            self._cache.set(("tags",), tags + [tag])
+        self._cache.invalidate(("tags_index",))
+
+    @track_calls("bigid_request")
     def create_sub_tag(self, subtag_name: str, parent_id: str,
             subtag_description: str = "") -> tuple:
         """
@@ -384,7 +518,8 @@ class BigIDAPI:
             "description": subtag_description,
             "parentId": parent_id
         }
-        post_response = ut.json_post_request(url, headers, content, self._proxies)
+        post_response = ut.json_post_request(url, headers, content, self._proxies,
+            session=self._session)
 
         if post_response.status_code != 200:
             Log.error("BigID create subtag request failed with "
@@ -393,8 +528,16 @@ class BigIDAPI:
                 + f" with status code {post_response.status_code}")
 
         post_response = post_response.json()
+        parent_names = [tag["tagName"] for tag in self._cache.get(("tags",), [])
+                        if tag["tagId"] == parent_id]
+        if parent_names:
+            self._add_cached_tag({"tagName": parent_names[0], "tagId": parent_id,
+                "tagValue": subtag_name, "valueId": post_response["_id"]})
+        else:
+            self.invalidate_cache(("tags",))
         return (post_response["_id"], post_response["parent_id"])
 
+    @track_calls("bigid_request")
     def add_tag(self, fully_qual_name: str, source_name: str, tag_id: str,
             value_id: str) -> str:
         """
@@ -429,7 +572,8 @@ class BigIDAPI:
                 }
             ]
         }
-        post_response = ut.json_post_request(url, headers, content, self._proxies)
+        post_response = ut.json_post_request(url, headers, content, self._proxies,
+            session=self._session)
 
         if post_response.status_code != 200:
             Log.error("BigID add tags request failed with "
@@ -437,6 +581,7 @@ class BigIDAPI:
             raise BigIDAPIException("BigID add tags request failed"
                 + f" with status code {post_response.status_code}")
 
+    @track_calls("bigid_request")
     def add_comment(self, comment: str, annotation_id: str):
         self.validate_session_token()
 
@@ -455,7 +600,8 @@ class BigIDAPI:
         content = {
             "comment": comment
         }
-        post_response = ut.json_post_request(url, headers, content, self._proxies)
+        post_response = ut.json_post_request(url, headers, content, self._proxies,
+            session=self._session)
 
         if post_response.status_code != 200:
             Log.error("BigID submit comment request failed with "
@@ -464,13 +610,19 @@ class BigIDAPI:
                 + f" with status code {post_response.status_code}")
 
     def get_data_source_credentials(self, tpa_id: str, data_source_name: str) -> dict:
+        return self._cache.get_or_load(("credentials", tpa_id, data_source_name),
+            lambda: self._get_data_source_credentials(tpa_id, data_source_name))
+
+    @track_calls("bigid_request")
+    def _get_data_source_credentials(self, tpa_id: str, data_source_name: str) -> dict:
         self.validate_session_token()
         url = f"{self._base_url}tpa/{tpa_id}/credentials/{data_source_name}"
         headers = {
             "Accept": "application/json",
             "Authorization": self._access_token
         }
-        get_response = ut.json_get_request(url, headers, self._proxies)
+        get_response = ut.json_get_request(url, headers, self._proxies,
+            session=self._session)
 
         if get_response.status_code != 200:
             Log.error("BigID data source credentials request failed with "
@@ -481,6 +633,7 @@ class BigIDAPI:
         get_response = get_response.json()
         return get_response
     
+    @track_calls("bigid_request")
     def set_minimization_request_action(self, request_id: str, action_type: str,
             secondary_ids: Union[str, list] = None):
         self.validate_session_token()
@@ -513,7 +666,8 @@ class BigIDAPI:
                 "value": secondary_ids
             })
 
-        post_response = ut.json_post_request(url, headers, content, self._proxies).json()
+        post_response = ut.json_post_request(url, headers, content, self._proxies,
+            session=self._session).json()
 
         if post_response["statusCode"] != 200:
             Log.error("BigID minimization action request failed with "
@@ -521,3 +675,22 @@ class BigIDAPI:
             raise BigIDAPIException("BigID minimization action request failed"
                 + f" with status code {post_response['statusCode']}: {post_response['message']}")
 
+    @track_calls("bigid_request")
+    def update_action_status(self, callback_url: str, status: dict):
+        """
+        Reports the status of an asynchronous action execution to the
+        updateResultCallback URL BigID sent with the execute request
+        """
+        self.validate_session_token()
+        headers = {
+            "Accept": "application/json",
+            "Authorization": self._access_token
+        }
+        put_response = ut.json_put_request(callback_url, headers, status, self._proxies,
+            session=self._session)
+
+        if put_response.status_code != 200:
+            Log.error("BigID action status update failed with "
+                + f"status code {put_response.status_code}: {put_response.text}")
+            raise BigIDAPIException("BigID action status update failed"
+                + f" with status code {put_response.status_code}: {put_response.text}")
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import ssl
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Union
+
+import aiohttp
+
+from cts.cts_request import get_tokenize_content, parse_tokenize_response, record_tokenize_request
+from utils.exceptions import CTSException, CTSOverloadedException
+from utils.log import Log
+
+
+class AsyncCTSRequest:
+    """
+    asyncio variant of CTSRequest on a keep-alive aiohttp session. Up to
+    max_in_flight tokenize requests are sent at the same time. Synchronous
+    code can use submit(), which runs the requests in an event loop thread
+    owned by this object, so a single worker keeps many batches in flight.
+    """
+    def __init__(self, cts_hostname: str, cts_username: str,
+                cts_password: str, cts_certificate_path: str = None,
+                pool_size: int = 10, max_in_flight: int = 16, timeout: float = 5,
+                max_retries: int = 3):
+        self._base_url = "https://" + cts_hostname + "/vts/rest/v2.0/"
+        self._header = {
+            "Authorization": aiohttp.BasicAuth(cts_username, cts_password).encode(),
+            "user-agent": "mozilla/4.0",
+            "v_content-type": "application/json"
+        }
+        self._ssl = False
+        if cts_certificate_path and os.path.isfile(cts_certificate_path):
+            self._ssl = ssl.create_default_context(cafile=cts_certificate_path)
+
+        self._pool_size     = pool_size
+        self._max_in_flight = max_in_flight
+        self._timeout       = timeout
+        self._max_retries   = max_retries
+        self._session       = None
+        self._semaphore     = None
+        self._loop          = None
+        self._loop_thread   = None
+        self._loop_lock     = threading.Lock()
+        self._requests      = 0
+
+        # Same interface as CTSRequest, these are not supported by the async client
+        self.token_cache = None
+        self.batch_tuner = None
+        # RunReport of the execution, records the latency of every request
+        self.report      = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created inside the running loop, which the session and semaphore are bound to
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size, ssl=self._ssl),
+                headers=self._header,
+                timeout=aiohttp.ClientTimeout(total=self._timeout))
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return self._session
+
+    def get_connection_stats(self) -> dict:
+        return {"requests": self._requests}
+
+    async def _make_request(self, content: list, method: str) -> Union[list, dict]:
+        session = self._get_session()
+        async with self._semaphore:
+            self._requests += 1
+            async with session.post(self._base_url + method, json=content) as response:
+                text = await response.text()
+                if response.status >= 500:
+                    raise CTSOverloadedException("CTS Request failed with status code "
+                        + f"{response.status}: {text}")
+                if response.status != 200:
+                    raise CTSException("CTS Request failed with status code "
+                        + f"{response.status}: {text}")
+                return await response.json(content_type=None)
+
+    async def tokenize(self, values: Union[str, list], tokengroup: str, tokentemplate: str) -> list:
+
+        if values == "" or values is None:
+            return [values]
+        if values == []:
+            return []
+
+        content = get_tokenize_content(values, tokengroup, tokentemplate)
+        retries = 0
+        while True:
+            start, error = time.perf_counter(), None
+            try:
+                response = await self._make_request(content, "tokenize")
+                return parse_tokenize_response(response, values)
+            except Exception as err:
+                error = err
+                if not isinstance(err, (CTSOverloadedException, asyncio.TimeoutError,
+                        aiohttp.ClientConnectionError)):
+                    raise
+            finally:
+                record_tokenize_request("async", len(content), time.perf_counter() - start, error,
+                    self.report)
+
+            retries += 1
+            if retries > self._max_retries:
+                raise CTSException(f"CTS Request failed after {retries} attempts: {error}") from error
+            await asyncio.sleep(0.2 * 2 ** (retries - 1))
+
+    def submit(self, values: Union[str, list], tokengroup: str, tokentemplate: str) -> Future:
+        """
+        Schedules tokenize in the event loop thread and returns a
+        concurrent.futures.Future with the tokens
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever,
+                    name="cts-async", daemon=True)
+                self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(
+            self.tokenize(values, tokengroup, tokentemplate), self._loop)
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def close(self):
+        """
+        Closes the session and stops the event loop thread started by submit()
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = None
+            Log.info(f"Closed async CTS client after {self._requests} requests")
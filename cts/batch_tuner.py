@@ -0,0 +1,55 @@
+import threading
+
+
+class BatchTuner:
+    """
+    Picks the number of values sent in each tokenize request. The size grows
+    by increase_step while requests answer under the target latency and is
+    halved when they are slower, time out or the CTS answers with a 5xx.
+    """
+    def __init__(self, initial_batch_size: int = 100, min_batch_size: int = 1,
+            max_batch_size: int = 10000, target_latency: float = 1.0,
+            max_payload_bytes: int = 1048576, increase_step: int = 50):
+        self.min_batch_size    = min_batch_size
+        self.max_batch_size    = max_batch_size
+        self.target_latency    = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self.increase_step     = increase_step
+
+        self._batch_size = max(min_batch_size, min(initial_batch_size, max_batch_size))
+        self._lock       = threading.Lock()
+        self._requests   = 0
+        self._values     = 0
+        self._seconds    = 0.0
+        self._failures   = 0
+
+    def get_batch_size(self) -> int:
+        with self._lock:
+            return self._batch_size
+
+    def record_success(self, nvalues: int, latency: float):
+        with self._lock:
+            self._requests += 1
+            self._values += nvalues
+            self._seconds += latency
+            if latency > self.target_latency:
+                self._batch_size = max(self.min_batch_size, self._batch_size // 2)
+            elif latency < self.target_latency / 2 and nvalues >= self._batch_size:
+                # Only grow when the request was actually limited by the batch size
+                self._batch_size = min(self.max_batch_size, self._batch_size + self.increase_step)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._batch_size = max(self.min_batch_size, self._batch_size // 2)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "batch_size": self._batch_size,
+                "requests": self._requests,
+                "values": self._values,
+                "failures": self._failures,
+                "avg_latency": self._seconds / self._requests if self._requests else 0,
+                "throughput": self._values / self._seconds if self._seconds else 0
+            }
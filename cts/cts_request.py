@@ -1,16 +1,26 @@
 import os
 import json
+import threading
+import time
+
+import requests
 
 from http.client import HTTPConnection
 from typing import Union
 
-from utils.exceptions import CTSException
-from utils.utils import json_post_request
+from cts.batch_tuner import BatchTuner
+from cts.token_cache import TokenCache
+from utils.exceptions import CTSException, CTSOverloadedException
+from utils.metrics import Metrics
+from utils.reports import RunReport
+from utils.utils import json_post_request, get_pooled_session, get_session_stats
 
 
 class CTSRequest:
     def __init__(self, cts_hostname: str, cts_username: str,
-                cts_password: str, cts_certificate_path: str = None):
+                cts_password: str, cts_certificate_path: str = None,
+                pool_size: int = 10, max_in_flight: int = 16, token_cache: TokenCache = None,
+                batch_tuner: BatchTuner = None, timeout: float = 5, max_retries: int = 3):
         self._base_url = "https://" + cts_hostname + "/vts/rest/v2.0/"
         self._cts_username = cts_username
         self._cts_password = cts_password
@@ -23,14 +33,39 @@ class CTSRequest:
         if cts_certificate_path != '' and os.path.isfile(cts_certificate_path):
             self._verify = cts_certificate_path
 
+        # Keep-alive session shared by all CTSRequest objects of this worker
+        self._session = get_pooled_session(f"cts:{self._base_url}", pool_size)
+        # Caps the requests sent at the same time by all the threads of an execution
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        # Opt-in, only for deterministic token templates
+        self.token_cache = token_cache
+        # Splits tokenize calls to keep each request under the target latency
+        self.batch_tuner = batch_tuner
+        # RunReport of the execution, records the latency of every request
+        self.report = None
+        self._timeout = timeout
+        self._max_retries = max_retries
+
         HTTPConnection._http_vsn_str = "HTTP/1.1"
 
+    def get_connection_stats(self) -> dict:
+        """
+        Returns the number of connections newly opened and reused by the
+        pooled session since the worker started.
+        """
+        return get_session_stats(self._session)
+
     def _make_request(self, content: str, method: str) -> Union[list, dict]:
         url = self._base_url + method
-        self._header["Content-Length"] = str(len(content))
-        response = json_post_request(url, self._header, content, proxies=None, verify=self._verify,
-            username=self._cts_username, password=self._cts_password)
+        header = {**self._header, "Content-Length": str(len(content))}
+        with self._in_flight:
+            response = json_post_request(url, header, content, proxies=None, verify=self._verify,
+                username=self._cts_username, password=self._cts_password, session=self._session,
+                timeout=self._timeout)
 
+        if response.status_code >= 500:
+            raise CTSOverloadedException("CTS Request failed with status code "
+                + f"{response.status_code}: {response.text}")
         if response.status_code != 200:
             raise CTSException("CTS Request failed with status code "
                 + f"{response.status_code}: {response.text}")
@@ -38,26 +73,121 @@ class CTSRequest:
         return response.json()
 
     def tokenize(self, values: Union[str, list], tokengroup: str, tokentemplate: str) -> list:
+        """
+        Tokenizes the values. With a token cache, each distinct value of the
+        batch is sent to the CTS only once and only if it is not cached.
+        """
+        if self.token_cache is None or not isinstance(values, list) or values == []:
+            return self._tokenize(values, tokengroup, tokentemplate)
+
+        distinct = list(dict.fromkeys(values))
+        tokens = self.token_cache.get_many(tokengroup, tokentemplate, distinct)
+        missing = [val for val in distinct if val not in tokens]
+        if missing:
+            missing_tokens = self._tokenize(missing, tokengroup, tokentemplate)
+            if len(missing_tokens) != len(missing):
+                raise CTSException(f"CTS returned {len(missing_tokens)} tokens for "
+                    + f"{len(missing)} values")
+            new_tokens = dict(zip(missing, missing_tokens))
+            self.token_cache.put_many(tokengroup, tokentemplate, new_tokens)
+            tokens.update(new_tokens)
+
+        return [tokens[val] for val in values]
+
+    def _tokenize(self, values: Union[str, list], tokengroup: str, tokentemplate: str) -> list:
+        if self.batch_tuner is None or not isinstance(values, list):
+            return self._tokenize_request(values, tokengroup, tokentemplate)
+
+        tokens, start, retries = [], 0, 0
+        while start < len(values):
+            chunk = self._next_chunk(values, start, tokengroup, tokentemplate)
+            begin = time.monotonic()
+            try:
+                chunk_tokens = self._tokenize_request(chunk, tokengroup, tokentemplate)
+            except (CTSOverloadedException, requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError) as err:
+                self.batch_tuner.record_failure()
+                retries += 1
+                if retries > self._max_retries:
+                    raise CTSException(f"CTS Request failed after {retries} attempts: {err}") from err
+                time.sleep(0.2 * 2 ** (retries - 1))
+                continue
+
+            self.batch_tuner.record_success(len(chunk), time.monotonic() - begin)
+            tokens.extend(chunk_tokens)
+            start += len(chunk)
+            retries = 0
+
+        return tokens
+
+    def _next_chunk(self, values: list, start: int, tokengroup: str, tokentemplate: str) -> list:
+        """
+        Returns the values of the next request, limited by the tuned batch size
+        and by the payload byte budget
+        """
+        batch_size = self.batch_tuner.get_batch_size()
+        overhead = len(tokengroup) + len(tokentemplate) + 60
+        end, payload = start, 0
+        while end < len(values) and end - start < batch_size:
+            payload += len(str(values[end])) + overhead
+            if payload > self.batch_tuner.max_payload_bytes and end > start:
+                break
+            end += 1
+        return values[start:end]
+
+    def _tokenize_request(self, values: Union[str, list], tokengroup: str, tokentemplate: str) -> list:
 
         if values == "" or values is None:
             return [values]
         if values == []:
             return []
-        if isinstance(values, str):
-            to_tokenize_array = [{"tokengroup": tokengroup, "data": values, "tokentemplate": tokentemplate}]
-        else:
-            to_tokenize_array = [{"tokengroup": tokengroup, "data": val, "tokentemplate": tokentemplate} for val in values]
-
-        response = self._make_request(to_tokenize_array, "tokenize")
-        tokens = []
-        if isinstance(response, dict) and "reason" in response:
-            raise CTSException(response["reason"])
-        for resp, val in zip(response, values):
-            if resp["status"] == "error":
-                if resp["reason"].startswith("After accounting for keepleft") or val is None:
-                    tokens.append(val)
-                    continue
-            tokens.append(resp["token"])
 
-        return tokens
+        start, error = time.perf_counter(), None
+        try:
+            response = self._make_request(get_tokenize_content(values, tokengroup, tokentemplate),
+                "tokenize")
+            return parse_tokenize_response(response, values)
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            record_tokenize_request("threads", 1 if isinstance(values, str) else len(values),
+                time.perf_counter() - start, error, self.report)
+
+
+def record_tokenize_request(client: str, nvalues: int, seconds: float, error: Exception = None,
+        report: RunReport = None):
+    Metrics.observe("cts_request_seconds", seconds, client=client)
+    Metrics.observe("cts_batch_size", nvalues, client=client)
+    if error is not None:
+        Metrics.inc("cts_request_errors_total", client=client, error=type(error).__name__)
+    if report is not None:
+        report.observe_cts(seconds, nvalues, error is not None)
+
+
+def get_tokenize_content(values: Union[str, list], tokengroup: str, tokentemplate: str) -> list:
+    if isinstance(values, str):
+        return [{"tokengroup": tokengroup, "data": values, "tokentemplate": tokentemplate}]
+    return [{"tokengroup": tokengroup, "data": val, "tokentemplate": tokentemplate} for val in values]
+
+
+def parse_tokenize_response(response: Union[list, dict], values: Union[str, list]) -> list:
+    """
+    Returns the tokens of a tokenize response. Values the template cannot
+    tokenize because of keepleft, and None values, are returned unchanged.
+    """
+    if isinstance(values, str):
+        values = [values]
+    tokens = []
+    if isinstance(response, dict) and "reason" in response:
+        raise CTSException(response["reason"])
+    if len(response) != len(values):
+        raise CTSException(f"CTS returned {len(response)} tokens for {len(values)} values")
+    for resp, val in zip(response, values):
+        if resp["status"] == "error":
+            if resp["reason"].startswith("After accounting for keepleft") or val is None:
+                tokens.append(val)
+                continue
+        tokens.append(resp["token"])
 
+    return tokens
@@ -0,0 +1,76 @@
+import threading
+
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of the tokens returned by the CTS, keyed by
+    (tokengroup, tokentemplate, value). Only valid for deterministic token
+    templates. It is created per execution and cleared when it finishes, so
+    no clear text values are kept after the job.
+    """
+    def __init__(self, max_entries: int, max_bytes: int = 67108864):
+        self._max_entries = max_entries
+        self._max_bytes   = max_bytes
+        self._entries     = OrderedDict()
+        self._lock        = threading.Lock()
+        self.nbytes       = 0
+        self.hits         = 0
+        self.misses       = 0
+        self.evictions    = 0
+
+    @staticmethod
+    def _entry_size(key: tuple, token) -> int:
+        return len(str(key[2])) + len(str(token))
+
+    def get_many(self, tokengroup: str, tokentemplate: str, values: list) -> dict:
+        """
+        Returns the cached token of each value found in the cache
+        """
+        found = {}
+        with self._lock:
+            for val in values:
+                key = (tokengroup, tokentemplate, val)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[val] = self._entries[key]
+            self.hits += len(found)
+            self.misses += len(values) - len(found)
+        return found
+
+    def put_many(self, tokengroup: str, tokentemplate: str, tokens: dict):
+        """
+        Adds the {value: token} pairs, evicting the least recently used
+        entries beyond max_entries or max_bytes
+        """
+        with self._lock:
+            for val, token in tokens.items():
+                key = (tokengroup, tokentemplate, val)
+                if key in self._entries:
+                    self.nbytes -= self._entry_size(key, self._entries.pop(key))
+                self._entries[key] = token
+                self.nbytes += self._entry_size(key, token)
+
+            while self._entries and (len(self._entries) > self._max_entries
+                    or self.nbytes > self._max_bytes):
+                key, token = self._entries.popitem(last=False)
+                self.nbytes -= self._entry_size(key, token)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0
+            }
@@ -1,4 +1,15 @@
+import time
+
+from typing import Union
+
+from utils.metrics import Metrics
+
+
 class DBConnectionInterface:
+    # Strategies update_batch can write values back with. The first one is the default
+    write_strategies = ("executemany",)
+    write_strategy = "executemany"
+
     def _connect(self):
         raise NotImplementedError("Implement connect method")
     
@@ -6,11 +17,193 @@ class DBConnectionInterface:
                 target_col_val: str, unique_id_col: str, unique_id_val: str) -> str:
         raise NotImplementedError("Implement get_update_query method")
     
-    def get_batch(self, table_name: str, primary_key: str, column: str,
-            offset: int, fetch_next: int) -> list:
-        raise NotImplementedError("Implement get_batch method")
+    @staticmethod
+    def get_columns(column: Union[str, list]) -> list:
+        """
+        Returns column as a list. The batch methods take one column name or a
+        list of columns read and written together.
+        """
+        return [column] if isinstance(column, str) else list(column)
+
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        """
+        Returns the query (and its params) that selects (pk_1, ..., pk_n, column)
+        ordered by the primary keys, strictly after last_key if it is given and
+        limited to fetch_next rows if it is given.
+        """
+        raise NotImplementedError("Implement get_select_query method")
+
+    def get_batch_after(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple, fetch_next: int, schema: str = None) -> list:
+        """
+        Returns up to fetch_next rows (pk_1, ..., pk_n, column) ordered by the
+        primary keys and strictly after last_key. If last_key is None, starts
+        from the first row.
+        """
+        query, params = self.get_select_query(table_name, primary_keys, column,
+            last_key, fetch_next, schema)
+        return self.run_query(query, fetch_results=True, params=params)
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        """
+        Runs a SELECT and yields its rows in lists of up to batch_size, holding
+        a single batch in memory. The rows are read through a dedicated
+        connection, so run_query can keep updating and committing on the main
+        connection while the stream is open.
+        """
+        raise NotImplementedError("Implement stream_query method")
+
+    def placeholder(self, position: int) -> str:
+        """
+        Returns the bind parameter marker for the 1-based position
+        """
+        raise NotImplementedError("Implement placeholder method")
+
+    def get_source(self, table_name: str, schema: str = None) -> str:
+        """
+        Returns the table name qualified by its schema, as the read and update
+        queries refer to it
+        """
+        return f"{schema}.{table_name}" if schema else table_name
+
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        """
+        Returns the number of rows of the table from the catalog statistics,
+        without scanning it, or None when the table has no statistics. Only
+        meant for progress reporting, the estimate may be stale.
+        """
+        raise NotImplementedError("Implement estimate_table_size method")
+
+    def get_keyset_condition(self, primary_keys: list, last_key: tuple) -> tuple:
+        """
+        Returns the WHERE condition that selects the rows after last_key in
+        primary key order and its parameters. Composite keys are expanded to
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ..., which every supported
+        database can answer with a primary key index range scan.
+        """
+        conditions, params = [], []
+        for i, pkey in enumerate(primary_keys):
+            terms = []
+            for prev_pkey, prev_val in zip(primary_keys[:i], last_key[:i]):
+                params.append(prev_val)
+                terms.append(f"{prev_pkey} = {self.placeholder(len(params))}")
+            params.append(last_key[i])
+            terms.append(f"{pkey} > {self.placeholder(len(params))}")
+            conditions.append("(" + " AND ".join(terms) + ")")
+        return " OR ".join(conditions), params
+
+    def iter_batches(self, table_name: str, primary_keys: list, column: Union[str, list],
+            batch_size: int, schema: str = None, start_key: tuple = None):
+        """
+        Yields batches of (pk_1, ..., pk_n, column) rows using keyset (seek)
+        pagination, so every batch costs the same no matter how deep into the
+        table it is. Stops at the first batch smaller than batch_size.
+        """
+        connector = type(self).__name__
+        last_key = start_key
+        while True:
+            with Metrics.timer("db_read_seconds", connector=connector):
+                batch = self.get_batch_after(table_name, primary_keys, column, last_key,
+                    batch_size, schema) or []
+            if batch:
+                Metrics.inc("db_read_rows_total", len(batch), connector=connector)
+                yield batch
+            if len(batch) < batch_size:
+                return
+            last_key = tuple(batch[-1][:len(primary_keys)])
+
+    def stream_batches(self, table_name: str, primary_keys: list, column: Union[str, list],
+            batch_size: int, schema: str = None, start_key: tuple = None):
+        """
+        Yields the same batches as iter_batches, but reads the whole column with
+        a single ordered query through a streaming cursor.
+        """
+        connector = type(self).__name__
+        query, params = self.get_select_query(table_name, primary_keys, column,
+            start_key, schema=schema)
+        batches = self.stream_query(query, params, batch_size)
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    return
+                Metrics.observe("db_read_seconds", time.perf_counter() - start, connector=connector)
+                Metrics.inc("db_read_rows_total", len(batch), connector=connector)
+                yield batch
+        finally:
+            batches.close()
+
+    def set_write_strategy(self, strategy: str = None):
+        if not strategy:
+            strategy = self.write_strategies[0]
+        if strategy not in self.write_strategies:
+            raise ValueError(f"{type(self).__name__} does not support the {strategy} write"
+                + f" strategy. Supported strategies: {', '.join(self.write_strategies)}")
+        self.write_strategy = strategy
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        """
+        Returns the UPDATE that sets the columns to the first parameters, one
+        per column, in the row identified by the primary keys, given as the
+        following parameters.
+        """
+        raise NotImplementedError("Implement get_update_batch_query method")
+
+    def quote_identifier(self, name: str) -> str:
+        """
+        Returns the column name quoted as it was reported by BigID
+        """
+        return f"\"{name}\""
+
+    def get_anonymization_update_query(self, table_name: str, target_cols: list,
+            unique_id_col: str, schema: str = None) -> str:
+        """
+        Returns the UPDATE that sets target_cols to the first parameters in the
+        row where they still have their original values, given next, and the
+        unique id column has the last parameter.
+        """
+        source = f"{schema}.{table_name}" if schema else table_name
+        ncols = len(target_cols)
+        set_str = ", ".join(f"{self.quote_identifier(col)} = {self.placeholder(i + 1)}"
+            for i, col in enumerate(target_cols))
+        where_str = " AND ".join(f"{self.quote_identifier(col)} = {self.placeholder(ncols + i + 1)}"
+            for i, col in enumerate(target_cols))
+        return f"""
+            UPDATE {source} SET
+            {set_str}
+            WHERE {where_str} AND {self.quote_identifier(unique_id_col)} = {self.placeholder(2 * ncols + 1)}
+        """
+
+    def update_batch(self, table_name: str, primary_keys: list, column: Union[str, list],
+            pkeys: list, values: list, schema: str = None):
+        """
+        Sets column to values[i] in the row whose primary key is pkeys[i], with
+        the connector's write strategy. With a list of columns, values[i] is the
+        tuple of the row's values, in the same order. "executemany" runs one
+        parameterized UPDATE per row, any other strategy bulk loads the rows
+        into a staging table and applies them with a single set-based UPDATE.
+        """
+        columns = self.get_columns(column)
+        rows = [(val,) for val in values] if isinstance(column, str) else values
+        labels = {"connector": type(self).__name__, "strategy": self.write_strategy}
+        with Metrics.timer("db_write_seconds", **labels):
+            if self.write_strategy == "executemany":
+                query = self.get_update_batch_query(table_name, primary_keys, columns, schema)
+                params_mult = [(*row, *pk) for pk, row in zip(pkeys, rows)]
+                self.run_query(query, is_multiple=True, params_mult=params_mult)
+            else:
+                self._update_batch_staging(table_name, primary_keys, columns, pkeys, rows, schema)
+        Metrics.inc("db_write_rows_total", len(pkeys), **labels)
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        raise NotImplementedError("Implement _update_batch_staging method")
 
-    def run_query(self, query: str):
+    def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
+            params_mult: list = None, params: list = None):
         raise NotImplementedError("Implement run_query method")
 
     def close_connection(self):
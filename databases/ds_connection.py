@@ -3,7 +3,6 @@ import hashlib
 from databases.mysql_conn import MySQLConnector
 from databases.oracle_conn import OracleConnector
 from databases.postgresql_conn import PostgreSQLConnector
-#from databases.sqlserver_conn import SQLServerConnector
 from Cryptodome.Cipher import AES
 from base64 import b64decode
 from utils.log import Log
@@ -20,6 +19,9 @@ class DataSourceConnection:
         self._rdb_name    = rdb_name
         self._credentials = None
 
+    def get_rdb_type(self) -> str:
+        return self._rdb_type
+
     def set_credentials(self, credentials: dict):
         self._credentials = credentials
     
@@ -71,8 +73,8 @@ class DataSourceConnection:
             return self._get_oracle_conn_params()
         elif self._rdb_type == "rdb-postgresql":
             return self._get_postgresql_conn_params()
-        elif self._rdb_type == "mssql-oracle":
-            return self._get_oracle_conn_params()
+        elif self._rdb_type == "rdb-mssql":
+            return self._get_sqlserver_conn_params()
         else:
             raise NotImplementedError("DataSourceConnection does not"
                 + f"support {self._rdb_type} yet. Implement it!")
@@ -103,4 +105,15 @@ class DataSourceConnection:
         port, sid = port_sid.split("/")
         port = int(port)
         return (PostgreSQLConnector, hostname, port, sid)
-    
+
+    def _get_sqlserver_conn_params(self) -> list:
+        """
+        SQL Server URL format: <IP|hostname>:<port>
+        """
+        # pyodbc needs the unixODBC libraries, only load it for SQL Server sources
+        from databases.sqlserver_conn import SQLServerConnector
+
+        hostname, port = self._rdb_url.split(":")
+        port = int(port)
+        database = self._rdb_name
+        return (SQLServerConnector, hostname, port, database)
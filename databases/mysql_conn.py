@@ -9,27 +9,27 @@ from utils.exceptions import MySQLConnectorException
 
 
 class MySQLConnector(DBConnectionInterface):
+    write_strategies = ("staging", "executemany")
+
     def __init__(self, hostname: str, port: int, database: str,
-            username: str, password: str, *args, **kwargs):
-        self._hostname = hostname
-        self._port     = port
-        self._database = database
-        self._username = username
-        self._password = password
+            username: str, password: str, *args, write_strategy: str = None,
+            net_write_timeout: int = 3600, **kwargs):
+        self._hostname          = hostname
+        self._port              = port
+        self._database          = database
+        self._username          = username
+        self._password          = password
+        self._net_write_timeout = int(net_write_timeout)
 
         self.is_connected = False
+        self.set_write_strategy(write_strategy)
 
         self._connect()
 
 
     def _connect(self):
         try:
-            self._connection = mysql.connector.connect(host=self._hostname,
-                                                       port=self._port,
-                                                       database=self._database,
-                                                       user=self._username,
-                                                       password=self._password,
-                                                       connection_timeout=5)
+            self._connection = self._new_connection()
             if self._connection.is_connected():
                 Log.info(f"Connected at MySQL {self._username}@"
                     + f"{self._hostname}:{self._port}/{self._database}")
@@ -41,19 +41,29 @@ class MySQLConnector(DBConnectionInterface):
             self.is_connected = False
             raise MySQLConnectorException(err) from err
 
+    def _new_connection(self):
+        return mysql.connector.connect(host=self._hostname,
+                                       port=self._port,
+                                       database=self._database,
+                                       user=self._username,
+                                       password=self._password,
+                                       connection_timeout=5)
+
     def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
-            params_mult: list = None):
+            params_mult: list = None, params: list = None):
         try:
             if self._connection.is_connected():
                 cursor = self._connection.cursor(buffered=True)
 
                 if is_multiple:
                     cursor.executemany(query, params_mult)
+                elif params:
+                    cursor.execute(query, params)
                 else:
                     cursor.execute(query)
 
                 rows = cursor.fetchall() if fetch_results else None
-                Log.info("MySQL Query execution OK")
+                Log.debug("MySQL Query execution OK")
                 self._connection.commit()
                 cursor.close()
                 if rows:
@@ -64,7 +74,7 @@ class MySQLConnector(DBConnectionInterface):
             raise MySQLConnectorException(err) from err
 
     def get_primary_keys(self, table_name: str, schema: str = None) -> list:
-        source = f"{schema}.{table_name}" if schema else table_name
+        source = self.get_source(table_name, schema)
         query = f"""
             SHOW KEYS FROM {source} WHERE Key_name = 'PRIMARY'
         """
@@ -73,6 +83,16 @@ class MySQLConnector(DBConnectionInterface):
             return [pk[4] for pk in pkey_list]
         return []
 
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        query = """
+            SELECT TABLE_ROWS FROM information_schema.TABLES
+            WHERE TABLE_NAME = %s AND TABLE_SCHEMA = COALESCE(%s, DATABASE())
+        """
+        rows = self.run_query(query, fetch_results=True, params=[table_name, schema])
+        if rows and rows[0][0] is not None:
+            return int(rows[0][0])
+        return None
+
     def get_update_query(self, schema: str, table_name: str, token: Union[str, list],
             target_col: Union[str, list], target_col_val: Union[str, list],
             unique_id_col: str, unique_id_val: str):
@@ -93,16 +113,119 @@ class MySQLConnector(DBConnectionInterface):
         """
         return query
     
-    def get_batch(self, table_name: str, primary_key: str, column: str, offset: int,
-            fetch_next: int, schema: str = None) -> list:
-        source = f"{schema}.{table_name}" if schema else table_name
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        limit_str = f"LIMIT {fetch_next}" if fetch_next else ""
         query = f"""
-            SELECT {primary_key}, {column}
+            SELECT {pkeys_str}, {columns_str}
             FROM {source}
-            ORDER BY {primary_key}
-            LIMIT {fetch_next} OFFSET {offset}
+            {where_str}
+            ORDER BY {pkeys_str}
+            {limit_str}
+        """
+        return query, params
+
+    def placeholder(self, position: int) -> str:
+        return "%s"
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        source = self.get_source(table_name, schema)
+        columns = self.get_columns(column)
+        set_str = ", ".join(f"{col} = {self.placeholder(i + 1)}" for i, col in enumerate(columns))
+        where_str = " AND ".join(f"{pkey} = {self.placeholder(len(columns) + i + 1)}"
+            for i, pkey in enumerate(primary_keys))
+        return f"""
+            UPDATE {source}
+            SET {set_str}
+            WHERE {where_str}
+        """
+
+    def quote_identifier(self, name: str) -> str:
+        return f"`{name}`"
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        """
+        Loads the batch into a temporary table with a multi-row INSERT (the
+        connector rewrites executemany INSERTs into one statement) and applies
+        it with a single UPDATE ... JOIN
+        """
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        join_str = " AND ".join(f"t.{pkey} = s.{pkey}" for pkey in primary_keys)
+        tokens_str = ", ".join(f"thales_token_{i}" for i in range(len(columns)))
+        select_str = ", ".join(f"{col} AS thales_token_{i}" for i, col in enumerate(columns))
+        set_str = ", ".join(f"t.{col} = s.thales_token_{i}" for i, col in enumerate(columns))
+        placeholders = ", ".join(self.placeholder(i + 1)
+            for i in range(len(primary_keys) + len(columns)))
+
+        try:
+            if self._connection.is_connected():
+                cursor = self._connection.cursor()
+                cursor.execute("DROP TEMPORARY TABLE IF EXISTS thales_staging")
+                cursor.execute(f"""
+                    CREATE TEMPORARY TABLE thales_staging AS
+                    SELECT {pkeys_str}, {select_str} FROM {source} LIMIT 0
+                """)
+                cursor.executemany(f"""
+                    INSERT INTO thales_staging ({pkeys_str}, {tokens_str}) VALUES ({placeholders})
+                """, [(*pk, *row) for pk, row in zip(pkeys, rows)])
+                cursor.execute(f"""
+                    UPDATE {source} AS t
+                    JOIN thales_staging AS s ON {join_str}
+                    SET {set_str}
+                """)
+                cursor.execute("DROP TEMPORARY TABLE thales_staging")
+                self._connection.commit()
+                cursor.close()
+                Log.info(f"MySQL staging update of {len(rows)} rows OK")
+
+        except Error as err:
+            self._connection.rollback()
+            Log.error(f"Error while running MySQL staging update: {err}")
+            raise MySQLConnectorException(err) from err
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        """
+        The server aborts an unbuffered read when it cannot send the next rows
+        for net_write_timeout seconds, 60 by default, which happens while the
+        consumer tokenizes and writes a batch. The streaming session raises it
+        to the net_write_timeout of the connector, the longest a batch may take.
         """
-        return self.run_query(query, fetch_results=True)
+        try:
+            conn = self._new_connection()
+        except Error as err:
+            Log.error(f"Error while opening MySQL streaming connection: {err}")
+            raise MySQLConnectorException(err) from err
+
+        try:
+            session_cursor = conn.cursor()
+            session_cursor.execute(f"SET SESSION net_write_timeout = {self._net_write_timeout}")
+            session_cursor.close()
+
+            # Unbuffered cursors read the rows from the socket as they are fetched
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+
+        except Error as err:
+            Log.error(f"Error while streaming MySQL query: {err}")
+            raise MySQLConnectorException(err) from err
+        finally:
+            conn.close()
 
 
     def close_connection(self):
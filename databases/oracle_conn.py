@@ -8,8 +8,11 @@ from utils.exceptions import OracleConnectorException
 
 
 class OracleConnector(DBConnectionInterface):
+    # executemany already sends the whole batch as a single array DML call
+    write_strategies = ("executemany",)
+
     def __init__(self, hostname: str, port: int, sid: str,
-            username: str, password: str, *args, **kwargs):
+            username: str, password: str, *args, write_strategy: str = None, **kwargs):
         self._hostname = hostname
         self._port     = port
         self._sid      = sid
@@ -17,15 +20,14 @@ class OracleConnector(DBConnectionInterface):
         self._password = password
 
         self.is_connected = False
+        self.set_write_strategy(write_strategy)
 
         self._connect()
 
 
     def _connect(self):
         try:
-            self._conn = oracledb.connect(user=self._username,
-                                    password=self._password,
-                                    dsn=f"{self._hostname}:{self._port}/{self._sid}")
+            self._conn = self._new_connection()
             Log.info(f"Connected at Oracle {self._username}@{self._hostname}:"
                 + f"{self._port}/{self._sid}")
             self.is_connected = True
@@ -36,6 +38,11 @@ class OracleConnector(DBConnectionInterface):
             self.is_connected = False
             raise OracleConnectorException(err) from err
 
+    def _new_connection(self):
+        return oracledb.connect(user=self._username,
+                                password=self._password,
+                                dsn=f"{self._hostname}:{self._port}/{self._sid}")
+
     def run_query_old(self, query: str, fetch_results: bool = False):
         if self.is_connected:
             try:
@@ -54,18 +61,20 @@ class OracleConnector(DBConnectionInterface):
             Log.warn("Oracle connection is not established. Will not execute query")
 
     def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
-            params_mult: list = None):
+            params_mult: list = None, params: list = None):
         if self.is_connected:
             try:
                 cursor = self._conn.cursor()
 
                 if is_multiple:
                     cursor.executemany(query, params_mult)
+                elif params:
+                    cursor.execute(query, params)
                 else:
                     cursor.execute(query)
 
                 rows = cursor.fetchall() if fetch_results else None
-                Log.info("Oracle Query execution OK")
+                Log.debug("Oracle Query execution OK")
                 self._conn.commit()
                 cursor.close()
                 if rows:
@@ -93,6 +102,17 @@ class OracleConnector(DBConnectionInterface):
             return [pk[1] for pk in pkey_list]
         return []
 
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        if schema:
+            rows = self.run_query("SELECT num_rows FROM all_tables WHERE table_name = :1 AND owner = :2",
+                fetch_results=True, params=[table_name.upper(), schema.upper()])
+        else:
+            rows = self.run_query("SELECT num_rows FROM user_tables WHERE table_name = :1",
+                fetch_results=True, params=[table_name.upper()])
+        if rows and rows[0][0] is not None:
+            return int(rows[0][0])
+        return None
+
     def get_update_query(self, table_name: str, token: Union[str, list],
             target_col: Union[str, list], target_col_val: Union[str, list],
             unique_id_col: str, unique_id_val: str, schema: str = None):
@@ -114,17 +134,69 @@ class OracleConnector(DBConnectionInterface):
         return query
 
     
-    def get_batch(self, table_name: str, primary_key: str, column: str, offset: int,
-            fetch_next: int, schema: str = None) -> list:
-        source = f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        limit_str = f"FETCH FIRST {fetch_next} ROWS ONLY" if fetch_next else ""
         query = f"""
-            SELECT {primary_key}, {column}
+            SELECT {pkeys_str}, {columns_str}
             FROM {source}
-            ORDER BY {primary_key}
-            OFFSET {offset} ROWS FETCH NEXT {fetch_next} ROWS ONLY
+            {where_str}
+            ORDER BY {pkeys_str}
+            {limit_str}
         """
-        Log.info(query)
-        return self.run_query(query, fetch_results=True)
+        return query, params
+
+    def placeholder(self, position: int) -> str:
+        return f":{position}"
+
+    def get_source(self, table_name: str, schema: str = None) -> str:
+        return f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        source = self.get_source(table_name, schema)
+        columns = self.get_columns(column)
+        set_str = ", ".join(f"{col} = {self.placeholder(i + 1)}" for i, col in enumerate(columns))
+        where_str = " AND ".join(f"{pkey} = {self.placeholder(len(columns) + i + 1)}"
+            for i, pkey in enumerate(primary_keys))
+        return f"""
+            UPDATE {source}
+            SET {set_str}
+            WHERE {where_str}
+        """
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        try:
+            conn = self._new_connection()
+        except Exception as err:
+            Log.error(f"Error while opening Oracle streaming connection: {err}")
+            raise OracleConnectorException(err) from err
+
+        try:
+            cursor = conn.cursor()
+            # Fetch the rows in round trips of batch_size
+            cursor.arraysize = batch_size
+            cursor.prefetchrows = batch_size + 1
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+
+        except Exception as err:
+            Log.error(f"Error while streaming Oracle query: {err}")
+            raise OracleConnectorException(err) from err
+        finally:
+            conn.close()
     
     def close_connection(self):
         if self.is_connected:
@@ -1,3 +1,4 @@
+import io
 import psycopg2
 
 from typing import Union
@@ -7,8 +8,10 @@ from utils.log import Log
 from utils.exceptions import PostgreSQLConnectorException
 
 class PostgreSQLConnector (DBConnectionInterface):
+    write_strategies = ("copy", "executemany")
+
     def __init__(self, hostname: str, port: int, sid: str,
-            username: str, password: str, *args, **kwargs):
+            username: str, password: str, *args, write_strategy: str = None, **kwargs):
         self._hostname = hostname
         self._port     = port
         self._sid     = sid
@@ -16,12 +19,13 @@ class PostgreSQLConnector (DBConnectionInterface):
         self._password = password
 
         self.is_connected = False
+        self.set_write_strategy(write_strategy)
 
         self._connect()
 
     def _connect(self):
         try: 
-            self._conn = psycopg2.connect(host=self._hostname, user=self._username, password = self._password)
+            self._conn = self._new_connection()
             Log.info(f"Connected at PostgreSQL {self._username}@{self._hostname}:"
                      + f"{self._port}/{self._sid}")
             self.is_connected = True
@@ -32,6 +36,9 @@ class PostgreSQLConnector (DBConnectionInterface):
             self.is_connected = False
             raise PostgreSQLConnectorException(err) from err
         
+    def _new_connection(self):
+        return psycopg2.connect(host=self._hostname, user=self._username, password = self._password)
+
     def run_query_old(self, query: str, fetch_results: bool = False):
         if self.is_connected:
             try:
@@ -50,23 +57,25 @@ class PostgreSQLConnector (DBConnectionInterface):
             Log.warn("PostgreSQL connection is not established. Will not execute query")
 
     def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
-            params_mult: list = None):
+            params_mult: list = None, params: list = None):
         if self.is_connected:
             try:
                 cursor = self._conn.cursor()
 
                 if is_multiple:
                     cursor.executemany(query, params_mult)
+                elif params:
+                    cursor.execute(query, params)
                 else:
                     cursor.execute(query)
 
                 rows = cursor.fetchall() if fetch_results else None
-                Log.info("PostgreSQL Query execution OK")
+                Log.debug("PostgreSQL Query execution OK")
                 self._conn.commit()
-                Log.info("PostgreSQL Commit OK")
+                Log.debug("PostgreSQL Commit OK")
                 cursor.close()
-                Log.info("PostgreSQL Cursor closed")
-                Log.info(query)
+                Log.debug("PostgreSQL Cursor closed")
+                Log.debug(query)
                 if rows:
                     return rows
 
@@ -91,6 +100,20 @@ class PostgreSQLConnector (DBConnectionInterface):
             return [pk[0] for pk in pkey_list]
         return []
 
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        schema_str = "AND n.nspname = %s" if schema else "AND pg_table_is_visible(c.oid)"
+        query = f"""
+            SELECT c.reltuples::bigint
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relname = %s {schema_str}
+        """
+        params = [table_name.lower(), schema.lower()] if schema else [table_name.lower()]
+        rows = self.run_query(query, fetch_results=True, params=params)
+        # reltuples is -1 (or 0 on older versions) until the table is vacuumed or analyzed
+        if rows and rows[0][0] is not None and rows[0][0] > 0:
+            return int(rows[0][0])
+        return None
+
     def get_update_query(self, table_name: str, token: Union[str, list],
             target_col: Union[str, list], target_col_val: Union[str, list],
             unique_id_col: str, unique_id_val: str, schema: str = None):
@@ -111,20 +134,125 @@ class PostgreSQLConnector (DBConnectionInterface):
         """
         return query
 
-    def get_batch(self, table_name: str, primary_key: str, column: str, offset: int,
-            fetch_next: int, schema: str = None) -> list:
-        source = f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        limit_str = f"FETCH FIRST {fetch_next} ROWS ONLY" if fetch_next else ""
         query = f"""
-            SELECT {primary_key}, {column}
+            SELECT {pkeys_str}, {columns_str}
             FROM {source}
-            ORDER BY {primary_key}
-            OFFSET {offset} ROWS FETCH NEXT {fetch_next} ROWS ONLY
+            {where_str}
+            ORDER BY {pkeys_str}
+            {limit_str}
+        """
+        return query, params
+
+    def placeholder(self, position: int) -> str:
+        return "%s"
+
+    def get_source(self, table_name: str, schema: str = None) -> str:
+        return f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        source = self.get_source(table_name, schema)
+        columns = self.get_columns(column)
+        set_str = ", ".join(f"{col} = {self.placeholder(i + 1)}" for i, col in enumerate(columns))
+        where_str = " AND ".join(f"{pkey} = {self.placeholder(len(columns) + i + 1)}"
+            for i, pkey in enumerate(primary_keys))
+        return f"""
+            UPDATE {source}
+            SET {set_str}
+            WHERE {where_str}
         """
-        Log.info(query)
-        return self.run_query(query, fetch_results=True)
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        """
+        Loads the batch with COPY FROM STDIN into a temporary table dropped at
+        commit and applies it with a single UPDATE ... FROM
+        """
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        join_str = " AND ".join(f"t.{pkey} = s.{pkey}" for pkey in primary_keys)
+        tokens_str = ", ".join(f"thales_token_{i}" for i in range(len(columns)))
+        select_str = ", ".join(f"{col} AS thales_token_{i}" for i, col in enumerate(columns))
+        set_str = ", ".join(f"{col} = s.thales_token_{i}" for i, col in enumerate(columns))
+
+        buffer = io.StringIO()
+        for pk, row in zip(pkeys, rows):
+            buffer.write("\t".join(copy_escape(field) for field in (*pk, *row)) + "\n")
+        buffer.seek(0)
+
+        if self.is_connected:
+            try:
+                cursor = self._conn.cursor()
+                cursor.execute(f"""
+                    CREATE TEMP TABLE thales_staging ON COMMIT DROP AS
+                    SELECT {pkeys_str}, {select_str} FROM {source} WITH NO DATA
+                """)
+                cursor.copy_expert(f"COPY thales_staging ({pkeys_str}, {tokens_str}) FROM STDIN",
+                    buffer)
+                cursor.execute(f"""
+                    UPDATE {source} AS t
+                    SET {set_str}
+                    FROM thales_staging AS s
+                    WHERE {join_str}
+                """)
+                self._conn.commit()
+                cursor.close()
+                Log.info(f"PostgreSQL COPY update of {len(rows)} rows OK")
+
+            except Exception as err:
+                self._conn.rollback()
+                Log.error(f"Error while running PostgreSQL COPY update: {err}")
+                raise PostgreSQLConnectorException(err) from err
+        else:
+            Log.warn("PostgreSQL connection is not established. Will not execute query")
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        try:
+            conn = self._new_connection()
+        except Exception as err:
+            Log.error(f"Error while opening PostgreSQL streaming connection: {err}")
+            raise PostgreSQLConnectorException(err) from err
+
+        try:
+            # Named cursors are kept on the server and fetched batch_size rows at a time
+            cursor = conn.cursor(name="thales_stream")
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+
+        except Exception as err:
+            Log.error(f"Error while streaming PostgreSQL query: {err}")
+            raise PostgreSQLConnectorException(err) from err
+        finally:
+            conn.close()
     
     def close_connection(self):
         if self.is_connected:
             self._conn.close()
             Log.info(f"PostgreSQL closed connection {self._username}@"
                 + f"{self._hostname}:{self._port}/{self._sid}")
+
+
+def copy_escape(value) -> str:
+    """
+    Formats a value for COPY's text format
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t")\
+        .replace("\n", "\\n").replace("\r", "\\r")
@@ -7,8 +7,11 @@ from utils.log import Log
 from utils.exceptions import SQLServerConnectorException
 
 class SQLServerConnector (DBConnectionInterface):
-    def __init__(self, driver:str, hostname: str, port: int, database: str,
-            username: str, password: str, encrypt: str, *args, **kwargs):
+    write_strategies = ("staging", "executemany")
+
+    def __init__(self, hostname: str, port: int, database: str,
+            username: str, password: str, *args, driver: str = "ODBC Driver 18 for SQL Server",
+            encrypt: str = "yes", write_strategy: str = None, **kwargs):
         self._hostname = hostname
         self._port     = port
         self._database      = database
@@ -18,12 +21,13 @@ class SQLServerConnector (DBConnectionInterface):
         self._encrypt = encrypt
 
         self.is_connected = False
+        self.set_write_strategy(write_strategy)
 
         self._connect()
 
     def _connect(self):
         try: 
-            self._conn = pyodbc.connect(DRIVER=self._driver, SERVER=self._hostname,DATABASE=self._database,ENCRYPT=self._encrypt,UID=self._username, PWD=self._password)            
+            self._conn = self._new_connection()
             Log.info(f"Connected at SQLServer {self._username}@{self._hostname}:"
                      + f"{self._port}/{self._database}")
             self.is_connected = True
@@ -34,6 +38,9 @@ class SQLServerConnector (DBConnectionInterface):
             self.is_connected = False
             raise SQLServerConnectorException(err) from err
         
+    def _new_connection(self):
+        return pyodbc.connect(DRIVER=self._driver, SERVER=f"{self._hostname},{self._port}",DATABASE=self._database,ENCRYPT=self._encrypt,UID=self._username, PWD=self._password)
+
     def run_query_old(self, query: str, fetch_results: bool = False):
         if self.is_connected:
             try:
@@ -52,18 +59,22 @@ class SQLServerConnector (DBConnectionInterface):
             Log.warn("SQLServer connection is not established. Will not execute query")
 
     def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
-            params_mult: list = None):
+            params_mult: list = None, params: list = None):
         if self.is_connected:
             try:
                 cursor = self._conn.cursor()
 
                 if is_multiple:
+                    # Sends all parameter sets in a single round trip
+                    cursor.fast_executemany = True
                     cursor.executemany(query, params_mult)
+                elif params:
+                    cursor.execute(query, params)
                 else:
                     cursor.execute(query)
 
                 rows = cursor.fetchall() if fetch_results else None
-                Log.info("SQLServer Query execution OK")
+                Log.debug("SQLServer Query execution OK")
                 self._conn.commit()
                 cursor.close()
                 if rows:
@@ -76,21 +87,35 @@ class SQLServerConnector (DBConnectionInterface):
             Log.warn("SQLServer connection is not established. Will not execute query")
 
     def get_primary_keys(self, table_name: str, schema: str = None):
-        source = table_name.upper()
+        schema_str = f"AND kcu.TABLE_SCHEMA = '{schema}'" if schema else ""
         query = f"""
-            SELECT cols.table_name, cols.column_name, cols.position, cons.status, cons.owner
-            FROM all_constraints cons, all_cons_columns cols
-            WHERE cols.table_name = '{source}'
-            AND cons.constraint_type = 'P'
-            AND cons.constraint_name = cols.constraint_name
-            AND cons.owner = cols.owner
-            ORDER BY cols.table_name, cols.position
+            SELECT kcu.TABLE_NAME, kcu.COLUMN_NAME, kcu.ORDINAL_POSITION
+            FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+            JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE kcu
+            ON tc.CONSTRAINT_NAME = kcu.CONSTRAINT_NAME
+            AND tc.CONSTRAINT_SCHEMA = kcu.CONSTRAINT_SCHEMA
+            WHERE tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+            AND kcu.TABLE_NAME = '{table_name}' {schema_str}
+            ORDER BY kcu.ORDINAL_POSITION
         """
         pkey_list = self.run_query(query, fetch_results = True)
         if pkey_list:
             return [pk[1] for pk in pkey_list]
         return []
 
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        query = """
+            SELECT SUM(p.rows)
+            FROM sys.partitions p
+            JOIN sys.tables t ON t.object_id = p.object_id
+            JOIN sys.schemas s ON s.schema_id = t.schema_id
+            WHERE t.name = ? AND s.name = COALESCE(?, SCHEMA_NAME()) AND p.index_id IN (0, 1)
+        """
+        rows = self.run_query(query, fetch_results=True, params=[table_name, schema])
+        if rows and rows[0][0] is not None:
+            return int(rows[0][0])
+        return None
+
     def get_update_query(self, table_name: str, token: Union[str, list],
             target_col: Union[str, list], target_col_val: Union[str, list],
             unique_id_col: str, unique_id_val: str, schema: str = None):
@@ -111,17 +136,121 @@ class SQLServerConnector (DBConnectionInterface):
         """
         return query
 
-    def get_batch(self, table_name: str, primary_key: str, column: str, offset: int,
-            fetch_next: int, schema: str = None) -> list:
-        source = f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        top_str = f"TOP ({fetch_next}) " if fetch_next else ""
         query = f"""
-            SELECT {primary_key}, {column}
+            SELECT {top_str}{pkeys_str}, {columns_str}
             FROM {source}
-            ORDER BY {primary_key}
-            OFFSET {offset} ROWS FETCH NEXT {fetch_next} ROWS ONLY
+            {where_str}
+            ORDER BY {pkeys_str}
         """
-        Log.info(query)
-        return self.run_query(query, fetch_results=True)
+        return query, params
+
+    def placeholder(self, position: int) -> str:
+        return "?"
+
+    def get_source(self, table_name: str, schema: str = None) -> str:
+        return f"{schema.upper()}.{table_name.upper()}" if schema else table_name.upper()
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        source = self.get_source(table_name, schema)
+        columns = self.get_columns(column)
+        set_str = ", ".join(f"{col} = {self.placeholder(i + 1)}" for i, col in enumerate(columns))
+        where_str = " AND ".join(f"{pkey} = {self.placeholder(len(columns) + i + 1)}"
+            for i, pkey in enumerate(primary_keys))
+        return f"""
+            UPDATE {source}
+            SET {set_str}
+            WHERE {where_str}
+        """
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        """
+        Loads the batch into a session temporary table with fast_executemany
+        and applies it with a single UPDATE ... FROM
+        """
+        source = self.get_source(table_name, schema)
+        pkeys_str = ", ".join(primary_keys)
+        join_str = " AND ".join(f"t.{pkey} = s.{pkey}" for pkey in primary_keys)
+        tokens_str = ", ".join(f"thales_token_{i}" for i in range(len(columns)))
+        set_str = ", ".join(f"t.{col} = s.thales_token_{i}" for i, col in enumerate(columns))
+        placeholders = ", ".join(self.placeholder(i + 1)
+            for i in range(len(primary_keys) + len(columns)))
+
+        if self.is_connected:
+            try:
+                cursor = self._conn.cursor()
+                cursor.execute(self.get_staging_table_query(source, primary_keys, columns))
+                cursor.fast_executemany = True
+                cursor.executemany(f"""
+                    INSERT INTO #thales_staging ({pkeys_str}, {tokens_str}) VALUES ({placeholders})
+                """, [(*pk, *row) for pk, row in zip(pkeys, rows)])
+                cursor.execute(f"""
+                    UPDATE t
+                    SET {set_str}
+                    FROM {source} AS t
+                    JOIN #thales_staging AS s ON {join_str}
+                """)
+                cursor.execute("DROP TABLE #thales_staging")
+                self._conn.commit()
+                cursor.close()
+                Log.info(f"SQLServer staging update of {len(rows)} rows OK")
+
+            except Exception as err:
+                self._conn.rollback()
+                Log.error(f"Error while running SQLServer staging update: {err}")
+                raise SQLServerConnectorException(err) from err
+        else:
+            Log.warn("SQLServer connection is not established. Will not execute query")
+
+    def get_staging_table_query(self, source: str, primary_keys: list, columns: list) -> str:
+        """
+        Returns the SELECT ... INTO creating the empty #thales_staging table. A
+        column selected as is keeps its IDENTITY property, which would reject
+        the primary keys inserted into the staging table, so every column is
+        selected through ISNULL, an expression of the same type.
+        """
+        pkeys_str = ", ".join(f"ISNULL({pkey}, {pkey}) AS {pkey}" for pkey in primary_keys)
+        select_str = ", ".join(f"ISNULL({col}, {col}) AS thales_token_{i}"
+                               for i, col in enumerate(columns))
+        return f"""
+            SELECT {pkeys_str}, {select_str}
+            INTO #thales_staging FROM {source} WHERE 1 = 0
+        """
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        try:
+            conn = self._new_connection()
+        except Exception as err:
+            Log.error(f"Error while opening SQLServer streaming connection: {err}")
+            raise SQLServerConnectorException(err) from err
+
+        try:
+            cursor = conn.cursor()
+            cursor.arraysize = batch_size
+            cursor.execute(query, params or [])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+            cursor.close()
+
+        except Exception as err:
+            Log.error(f"Error while streaming SQLServer query: {err}")
+            raise SQLServerConnectorException(err) from err
+        finally:
+            conn.close()
     
     def close_connection(self):
         if self.is_connected:
@@ -1,5 +1,19 @@
 import unittest
 from test.utils_test import UtilsTest
+from test.remediation_test import RemediationTest
+from test.connection_interface_test import ConnectionInterfaceTest
+from test.jobs_test import JobsTest
+from test.log_test import LogTest
+from test.cts_test import CTSTest
+from test.bigid_test import BigIDTest
+from test.anonymization_test import AnonymizationTest
+from test.standins_test import CTSStandInTest, BigIDStandInTest
+from test.benchmarks_test import BenchmarksTest
+from test.metrics_test import MetricsTest
+from test.profiling_test import ProfilingTest
+from test.reports_test import ReportsTest
+from test.connectors_test import ConnectorsTest
+from test.checkpoints_test import CheckpointsTest
 
 unittest.main()
 
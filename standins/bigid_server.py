@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from standins.server import run_app
+
+
+class SyntheticCatalog:
+    """
+    Generated BigID catalog: sources data sources with tables tables each, of
+    an "id" primary key and columns policy hit columns col_0, col_1, ... and
+    requests pending minimization requests of objects_per_request tables.
+    Request r points at the row id = r of its tables, so a database seeded
+    with rows 0..requests-1 holds every value of the SAR reports.
+    """
+    def __init__(self, sources: int = 1, tables: int = 10, columns: int = 3, requests: int = 100,
+            objects_per_request: int = 1, ds_type: str = "rdb-postgresql",
+            rdb_url: str = "localhost:5432/postgres", schema: str = "public",
+            username: str = "user", password: str = "password"):
+        self.sources             = sources
+        self.tables              = tables
+        self.columns             = columns
+        self.requests            = requests
+        self.objects_per_request = min(objects_per_request, tables)
+        self.ds_type             = ds_type
+        self.rdb_url             = rdb_url
+        self.schema              = schema
+        self.username            = username
+        self.password            = password
+
+    def get_source_name(self, source: int) -> str:
+        return f"source_{source}"
+
+    def get_table_name(self, table: int) -> str:
+        return f"table_{table}"
+
+    def get_column_names(self) -> list:
+        return [f"col_{col}" for col in range(self.columns)]
+
+    def get_fqn(self, source: int, table: int) -> str:
+        return f"{self.get_source_name(source)}.{self.schema}.{self.get_table_name(table)}"
+
+    def get_request_id(self, request: int) -> str:
+        # Zero padded so the ids sort like the requests
+        return f"req_{request:08d}"
+
+    def get_request_tables(self, request: int) -> tuple:
+        """
+        Returns the source of the request and the tables of its objects
+        """
+        first = request * self.objects_per_request
+        return request % self.sources, [(first + obj) % self.tables
+                                        for obj in range(self.objects_per_request)]
+
+    def get_delete_queries(self, request: int) -> list:
+        source, tables = self.get_request_tables(request)
+        request_id = self.get_request_id(request)
+        return [{"_id": f"{request_id}_{obj}", "requestId": request_id,
+                 "fullObjectName": self.get_fqn(source, table), "state": "Pending",
+                 "markedAs": "Delete Manually"}
+                for obj, table in enumerate(tables)]
+
+    def get_sar_records(self, request: int) -> list:
+        source, tables = self.get_request_tables(request)
+        request_id = self.get_request_id(request)
+        row_id = str(request)
+        records = []
+        for obj, table in enumerate(tables):
+            common = {"source": self.get_source_name(source), "fullObjectName": self.get_fqn(source, table),
+                "proximityId": f"{request_id}_{obj}", "identity_unique_id": row_id}
+            records.append({**common, "attr_original_name": "id", "value": row_id,
+                "category": ["ID"], "is_primary": "TRUE"})
+            records.extend({**common, "attr_original_name": col, "value": f"{col}_{row_id}",
+                "category": ["PII"], "is_primary": "FALSE"} for col in self.get_column_names())
+        return records
+
+    def get_data_sources(self) -> list:
+        return [{"name": self.get_source_name(source), "type": self.ds_type, "enabled": "yes"}
+                for source in range(self.sources)]
+
+    def get_remediation_objects(self, source: int) -> list:
+        return [{"id": f"obj_{source}_{table}", "fullyQualifiedName": self.get_fqn(source, table),
+                 "fullObjectName": f"{self.schema}.{self.get_table_name(table)}",
+                 "source": self.get_source_name(source)}
+                for table in range(self.tables)]
+
+    def get_remediation_columns(self, source: int) -> list:
+        return [{"fully_qualified_name": self.get_fqn(source, table),
+                 "annotations": {"actionTaken": "Thales Tokenization",
+                                 "policyHit": self.get_column_names()}}
+                for table in range(self.tables)]
+
+
+class BigIDStandIn:
+    """
+    Local stand-in for the BigID endpoints used by BigIDAPI, serving a
+    SyntheticCatalog. Tags, object tags, comments and completed minimization
+    requests are kept in memory, so a run sees its own changes. Every request
+    waits latency seconds. Point the API at <url>/api/v1/.
+    """
+    def __init__(self, catalog: SyntheticCatalog, latency: float = 0):
+        self.catalog = catalog
+        self.latency = latency
+
+        self.tags          = {}     # tag_id: {"name": ..., "parent_id": ...}
+        self.object_tags   = {}     # fully qualified name: [{"tagName": ..., "tagValue": ...}]
+        self.comments      = {}     # object id: [comment, ...]
+        self.statuses      = {}     # execution id: [status, ...]
+        self.request_stats = {}
+
+        self._completed     = set()
+        self._pending       = None
+        self._access_token  = "standin-system-token"
+        self._started       = time.time()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        api = "/api/v1"
+        proxy = "/proxy/tpa/api/{remediation_id}"
+        routes = [
+            ("GET", f"{api}/refresh-access-token", self.refresh_access_token),
+            ("GET", f"{api}/data-minimization/objects", self.get_minimization_objects),
+            ("POST", f"{api}/data-minimization/objects/action", self.minimization_action),
+            ("GET", f"{api}/sar/reports/{{request_id}}", self.get_sar_report),
+            ("GET", f"{api}/ds_connections", self.get_ds_connections),
+            ("GET", f"{api}/ds_connections/{{name}}", self.get_ds_connection),
+            ("GET", f"{api}/tpa/{{tpa_id}}/credentials/{{name}}", self.get_credentials),
+            ("GET", f"{api}/data-catalog/tags/all-pairs", self.get_tags),
+            ("GET", f"{proxy}/datasource/auditor-datasource", self.get_auditor_datasources),
+            ("GET", f"{proxy}/object", self.get_remediation_objects),
+            ("GET", f"{proxy}/object/columns-view", self.get_remediation_columns),
+            ("GET", f"{proxy}/object/object-detail", self.get_object_detail),
+            ("POST", f"{proxy}/object/tags/create-tag", self.create_tag),
+            ("POST", f"{proxy}/object/tags/add-tags", self.add_tags),
+            ("GET", f"{proxy}/object/{{object_id}}/comment", self.get_comments),
+            ("POST", f"{proxy}/object/{{object_id}}/comment", self.add_comment),
+            ("PUT", "/standin/callback/{execution_id}", self.update_status),
+            ("GET", "/standin/stats", self.stats),
+        ]
+        for method, path, handler in routes:
+            app.router.add_route(method, path, handler)
+        return app
+
+    def get_stats(self) -> dict:
+        return {"requests": dict(self.request_stats), "completed_requests": len(self._completed),
+            "uptime": time.time() - self._started}
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.Response:
+        name = getattr(handler, "__name__", "unknown")
+        self.request_stats[name] = self.request_stats.get(name, 0) + 1
+        if name not in ("stats", "update_status"):
+            if self.latency > 0:
+                await asyncio.sleep(self.latency)
+            if not request.headers.get("Authorization"):
+                return web.json_response({"message": "Missing Authorization"}, status=401)
+        return await handler(request)
+
+    def _get_source(self, source_name: str) -> int:
+        prefix = "source_"
+        if not source_name or not source_name.startswith(prefix):
+            raise web.HTTPNotFound(text=f"Unknown data source {source_name}")
+        source = int(source_name[len(prefix):])
+        if source >= self.catalog.sources:
+            raise web.HTTPNotFound(text=f"Unknown data source {source_name}")
+        return source
+
+    def _get_pending(self) -> list:
+        # Rebuilt lazily, completing many requests in a row stays linear
+        if self._pending is None:
+            self._pending = [request for request in range(self.catalog.requests)
+                             if request not in self._completed]
+        return self._pending
+
+    async def refresh_access_token(self, request: web.Request) -> web.Response:
+        return web.json_response({"systemToken": self._access_token})
+
+    async def get_minimization_objects(self, request: web.Request) -> web.Response:
+        skip = int(request.query.get("skip", 0))
+        limit = int(request.query.get("limit", 1000))
+        pending = self._get_pending()
+        per_request = self.catalog.objects_per_request
+        total_count = len(pending) * per_request
+
+        delete_queries = []
+        for request_index in range(skip // per_request, len(pending)):
+            if len(delete_queries) >= limit + skip % per_request:
+                break
+            delete_queries.extend(self.catalog.get_delete_queries(pending[request_index]))
+        delete_queries = delete_queries[skip % per_request:][:limit]
+        return web.json_response({"data": {"deleteQueries": delete_queries,
+            "totalCount": total_count}})
+
+    async def minimization_action(self, request: web.Request) -> web.Response:
+        content = await request.json()
+        request_ids = [flt["value"] for flt in content["query"]["filter"]
+                       if flt["field"] == "requestId"]
+        for request_id in request_ids:
+            self._completed.add(int(request_id.split("_")[-1]))
+        self._pending = None
+        return web.json_response({"statusCode": 200, "message": "OK"})
+
+    async def get_sar_report(self, request: web.Request) -> web.Response:
+        request_id = request.match_info["request_id"]
+        try:
+            request_index = int(request_id.split("_")[-1])
+        except ValueError:
+            raise web.HTTPNotFound(text=f"Unknown request {request_id}")
+        return web.json_response({"records": self.catalog.get_sar_records(request_index)})
+
+    async def get_ds_connections(self, request: web.Request) -> web.Response:
+        return web.json_response({"ds_connections": self.catalog.get_data_sources()})
+
+    async def get_ds_connection(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        self._get_source(name)
+        return web.json_response({"ds_connection": {"name": name, "type": self.catalog.ds_type,
+            "rdb_url": self.catalog.rdb_url, "rdb_name": self.catalog.rdb_url.split("/")[-1]}})
+
+    async def get_credentials(self, request: web.Request) -> web.Response:
+        self._get_source(request.match_info["name"])
+        return web.json_response({
+            "username": {"value": self.catalog.username, "encrypted": False},
+            "password": {"value": self.catalog.password, "encrypted": False}})
+
+    async def get_tags(self, request: web.Request) -> web.Response:
+        pairs = []
+        for tag_id, tag in self.tags.items():
+            if tag["parent_id"] is not None:
+                parent = self.tags[tag["parent_id"]]
+                pairs.append({"tagName": parent["name"], "tagId": tag["parent_id"],
+                    "tagValue": tag["name"], "valueId": tag_id})
+            elif not any(value["parent_id"] == tag_id for value in self.tags.values()):
+                pairs.append({"tagName": tag["name"], "tagId": tag_id, "tagValue": None,
+                    "valueId": None})
+        return web.json_response({"data": pairs})
+
+    async def get_auditor_datasources(self, request: web.Request) -> web.Response:
+        return web.json_response({"results": [{"name": ds["name"],
+            "policyHit": self.catalog.get_column_names()} for ds in self.catalog.get_data_sources()]})
+
+    async def get_remediation_objects(self, request: web.Request) -> web.Response:
+        filters = json.loads(request.headers.get("filterV2", "[]"))
+        source_names = [name for flt in filters if flt["field"] == "source" for name in flt["value"]]
+        if not source_names:
+            source_names = [ds["name"] for ds in self.catalog.get_data_sources()]
+        results = [obj for name in source_names
+                   for obj in self.catalog.get_remediation_objects(self._get_source(name))]
+        return web.json_response({"results": results})
+
+    async def get_remediation_columns(self, request: web.Request) -> web.Response:
+        source = self._get_source(request.query.get("source"))
+        return web.json_response({"results": self.catalog.get_remediation_columns(source)})
+
+    async def get_object_detail(self, request: web.Request) -> web.Response:
+        object_name = request.query.get("object_name")
+        return web.json_response({"basicDetails": {"fullyQualifiedName": object_name,
+            "tags": self.object_tags.get(object_name, [])}})
+
+    async def create_tag(self, request: web.Request) -> web.Response:
+        content = await request.json()
+        parent_id = content.get("parentId") if content.get("type") == "VALUE" else None
+        for tag_id, tag in self.tags.items():
+            if tag["name"] == content["name"] and tag["parent_id"] == parent_id:
+                return web.json_response({"message": f"Tag {content['name']} already exists"},
+                    status=409)
+        tag_id = f"tag_{len(self.tags)}"
+        self.tags[tag_id] = {"name": content["name"], "parent_id": parent_id}
+        return web.json_response({"_id": tag_id, "parent_id": parent_id})
+
+    async def add_tags(self, request: web.Request) -> web.Response:
+        content = await request.json()
+        for obj in content["data"]:
+            object_tags = self.object_tags.setdefault(obj["fullyQualifiedName"], [])
+            for tag in obj["tags"]:
+                if tag["tagId"] not in self.tags or tag["valueId"] not in self.tags:
+                    return web.json_response({"message": "Unknown tag"}, status=404)
+                object_tags.append({"tagName": self.tags[tag["tagId"]]["name"],
+                    "tagValue": self.tags[tag["valueId"]]["name"], "tagId": tag["tagId"],
+                    "valueId": tag["valueId"]})
+        return web.json_response({"status": "success"})
+
+    async def get_comments(self, request: web.Request) -> web.Response:
+        comments = self.comments.get(request.match_info["object_id"], [])
+        return web.json_response({"results": [{"comment": {"comment": comment}}
+                                              for comment in comments]})
+
+    async def add_comment(self, request: web.Request) -> web.Response:
+        content = await request.json()
+        self.comments.setdefault(request.match_info["object_id"], []).append(content["comment"])
+        return web.json_response({"status": "success"})
+
+    async def update_status(self, request: web.Request) -> web.Response:
+        self.statuses.setdefault(request.match_info["execution_id"], []).append(
+            await request.json())
+        return web.json_response({"status": "success"})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in BigID server with a synthetic catalog")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0, help="Seconds per request")
+    parser.add_argument("--sources", type=int, default=1)
+    parser.add_argument("--tables", type=int, default=10, help="Tables per data source")
+    parser.add_argument("--columns", type=int, default=3, help="Policy hit columns per table")
+    parser.add_argument("--requests", type=int, default=100, help="Pending minimization requests")
+    parser.add_argument("--objects-per-request", type=int, default=1)
+    parser.add_argument("--ds-type", default="rdb-postgresql")
+    parser.add_argument("--rdb-url", default="localhost:5432/postgres")
+    parser.add_argument("--schema", default="public")
+    parser.add_argument("--username", default="user")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+
+    catalog = SyntheticCatalog(args.sources, args.tables, args.columns, args.requests,
+        args.objects_per_request, args.ds_type, args.rdb_url, args.schema, args.username,
+        args.password)
+    # The catalog state is kept in memory, so a single process serves it
+    run_app(lambda: BigIDStandIn(catalog, args.latency).create_app(), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from aiohttp import web
+
+from standins.server import get_ssl_context, run_app
+
+
+KEEPLEFT_REASON = "After accounting for keepleft and keepright, the data is too short"
+
+
+class CTSStandIn:
+    """
+    Local stand-in for the CTS REST tokenization endpoint. Tokens are
+    deterministic: the same tokengroup, template and value always give the
+    same token, of the same length as the value. Every request waits latency
+    seconds plus up to jitter, fails with a 503 with probability error_rate,
+    and values of up to keepleft characters get the CTS keepleft error.
+    """
+    def __init__(self, latency: float = 0, jitter: float = 0, error_rate: float = 0,
+            keepleft: int = 0, seed: int = None):
+        self.latency    = latency
+        self.jitter     = jitter
+        self.error_rate = error_rate
+        self.keepleft   = keepleft
+        self._random    = random.Random(seed)
+
+        self.requests  = 0
+        self.values    = 0
+        self.errors    = 0
+        self._started  = time.time()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/vts/rest/v2.0/tokenize", self.tokenize)
+        app.router.add_get("/standin/stats", self.stats)
+        return app
+
+    def get_token(self, tokengroup: str, tokentemplate: str, data) -> dict:
+        if data is None:
+            return {"status": "error", "reason": "Data is null"}
+        data = str(data)
+        if len(data) <= self.keepleft:
+            return {"status": "error", "reason": KEEPLEFT_REASON}
+
+        digest = hashlib.sha256(f"{tokengroup}\0{tokentemplate}\0{data}".encode()).hexdigest()
+        tail_len = len(data) - self.keepleft
+        token = data[:self.keepleft] + (digest * (tail_len // len(digest) + 1))[:tail_len]
+        return {"status": "Succeed", "token": token}
+
+    def get_stats(self) -> dict:
+        return {"requests": self.requests, "values": self.values, "errors": self.errors,
+            "uptime": time.time() - self._started}
+
+    async def tokenize(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"reason": "Stand-in CTS is overloaded"}, status=503)
+
+        try:
+            content = json.loads(await request.read())
+        except ValueError:
+            return web.json_response({"reason": "Invalid JSON"}, status=400)
+        if isinstance(content, dict):
+            content = [content]
+
+        self.values += len(content)
+        tokens = [self.get_token(item.get("tokengroup"), item.get("tokentemplate"), item.get("data"))
+                  for item in content]
+        return web.Response(body=json.dumps(tokens).encode(), content_type="application/json")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in CTS tokenization server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--certfile", help="Server certificate, a self-signed one by default")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0, help="Random extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests failing with 503")
+    parser.add_argument("--keepleft", type=int, default=0, help="Characters kept from the values")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    standin = lambda: CTSStandIn(args.latency, args.jitter, args.error_rate,
+        args.keepleft).create_app()
+    run_app(standin, args.host, args.port, get_ssl_context(args.certfile, args.keyfile),
+        args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+
+from aiohttp import web
+
+
+class BackgroundServer:
+    """
+    Runs an aiohttp application in an event loop thread of its own, so tests
+    and benchmarks can start a stand-in server next to the code they drive.
+    With port 0 a free port is picked, see url once started.
+    """
+    def __init__(self, app: web.Application, host: str = "127.0.0.1", port: int = 0,
+            ssl_context: ssl.SSLContext = None, backlog: int = 4096):
+        self._app         = app
+        self._host        = host
+        self._ssl_context = ssl_context
+        self._backlog     = backlog
+        self.port         = port
+
+        self._loop   = None
+        self._thread = None
+        self._ready  = threading.Event()
+        self._error  = None
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self._ssl_context is not None else "http"
+        return f"{scheme}://{self._host}:{self.port}"
+
+    def start(self) -> "BackgroundServer":
+        self._thread = threading.Thread(target=self._run, name="standin-server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self._app, access_log=None)
+        try:
+            self._loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, self._host, self.port, ssl_context=self._ssl_context,
+                backlog=self._backlog)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+        except Exception as err:
+            self._error = err
+            self._ready.set()
+            self._loop.close()
+            return
+
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(runner.cleanup())
+            self._loop.close()
+
+
+class ServerProcess:
+    """
+    Runs app_factory() in a process of its own, so a stand-in does not share
+    the GIL with the code it serves. The process is forked, app_factory and
+    ssl_context do not need to be picklable.
+    """
+    def __init__(self, app_factory, host: str = "127.0.0.1", port: int = 0,
+            ssl_context: ssl.SSLContext = None, backlog: int = 4096):
+        self._app_factory = app_factory
+        self._host        = host
+        self._port        = port
+        self._ssl_context = ssl_context
+        self._backlog     = backlog
+        self._process     = None
+        self._conn        = None
+        self.url          = None
+
+    def start(self) -> "ServerProcess":
+        import multiprocessing
+
+        context = multiprocessing.get_context("fork")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=self._run, args=(child_conn,), daemon=True)
+        self._process.start()
+        self.url = self._conn.recv()
+        if isinstance(self.url, Exception):
+            raise self.url
+        return self
+
+    def stop(self):
+        if self._process is not None and self._process.is_alive():
+            self._conn.send("stop")
+            self._process.join(5)
+            if self._process.is_alive():
+                self._process.terminate()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self, conn):
+        try:
+            server = BackgroundServer(self._app_factory(), self._host, self._port,
+                self._ssl_context, self._backlog).start()
+        except Exception as err:
+            conn.send(err)
+            return
+        conn.send(server.url)
+        conn.recv()
+        server.stop()
+
+
+def create_self_signed_cert(directory: str = None, common_name: str = "localhost") -> tuple:
+    """
+    Writes a self-signed certificate and its key with the openssl command line
+    and returns (certfile, keyfile)
+    """
+    directory = directory or tempfile.mkdtemp()
+    certfile = os.path.join(directory, "standin.pem")
+    keyfile = os.path.join(directory, "standin.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "7",
+        "-subj", f"/CN={common_name}", "-addext", f"subjectAltName=DNS:{common_name},IP:127.0.0.1",
+        "-keyout", keyfile, "-out", certfile], check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def get_ssl_context(certfile: str = None, keyfile: str = None) -> ssl.SSLContext:
+    """
+    Returns the server TLS context, with a new self-signed certificate when
+    no certificate is given
+    """
+    if certfile is None:
+        certfile, keyfile = create_self_signed_cert()
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(certfile, keyfile)
+    return ssl_context
+
+
+def run_app(app_factory, host: str, port: int, ssl_context: ssl.SSLContext = None,
+        workers: int = 1, backlog: int = 4096):
+    """
+    Serves app_factory() until interrupted. With several workers, every
+    process accepts connections on the same port through SO_REUSEPORT.
+    """
+    if workers <= 1:
+        web.run_app(app_factory(), host=host, port=port, ssl_context=ssl_context,
+            backlog=backlog, access_log=None)
+        return
+
+    import multiprocessing
+
+    processes = [multiprocessing.Process(target=web.run_app, args=(app_factory(),),
+                     kwargs={"host": host, "port": port, "ssl_context": ssl_context,
+                             "backlog": backlog, "access_log": None, "reuse_port": True})
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
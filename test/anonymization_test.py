@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+
+from configparser import RawConfigParser
+from unittest import mock
+
+import app_modules.anonymization as anon
+
+
+class FakeBigID:
+    def __init__(self, objects: list, report_total: bool = True):
+        # objects = [(request_id, full_object_name, _id), ...] sorted by requestId
+        self.objects = objects
+        self.report_total = report_total
+        self.offsets = []
+        self._lock = threading.Lock()
+
+    def get_minimization_requests_page(self, offset: int, fetch_next: int) -> tuple:
+        with self._lock:
+            self.offsets.append(offset)
+        page = {}
+        for request_id, full_obj_name, obj_id in self.objects[offset:offset + fetch_next]:
+            req = page.setdefault(request_id, {"selected": [], "ids": []})
+            req["selected"].append(full_obj_name)
+            req["ids"].append(obj_id)
+        return page, len(self.objects) if self.report_total else None
+
+    def get_sar_reports(self, request_ids: list) -> dict:
+        return {request_id: [{"source": "ds", "fullObjectName": full_obj_name}
+                             for req_id, full_obj_name, _ in self.objects if req_id == request_id]
+                for request_id in request_ids}
+
+    def get_data_source_conns(self, tpa_id: str, source_names: list) -> dict:
+        return {source_name: None for source_name in source_names}
+
+
+class AnonymizationTest(unittest.TestCase):
+
+    def test_iter_minimization_requests(self):
+        objects = [(f"req{i // 3}", f"ds.s.t{i}", f"id{i}") for i in range(20)]
+        expected = [(f"req{r}", {"selected": [f"ds.s.t{i}" for i in range(3 * r, min(3 * r + 3, 20))],
+                                 "ids": [f"id{i}" for i in range(3 * r, min(3 * r + 3, 20))]})
+                    for r in range(7)]
+
+        for report_total in (True, False):
+            bigid = FakeBigID(objects, report_total)
+            self.assertEqual(expected, list(anon.iter_minimization_requests(bigid, 4, 3)))
+            self.assertEqual([0, 4, 8, 12, 16] + ([] if report_total else [20]),
+                sorted(bigid.offsets))
+
+        self.assertEqual([], list(anon.iter_minimization_requests(FakeBigID([]), 4, 3)))
+
+    def test_iter_minimization_requests_bounded(self):
+        bigid = FakeBigID([(f"req{i // 3}", f"ds.s.t{i}", f"id{i}") for i in range(400)])
+        requests = anon.iter_minimization_requests(bigid, 4, 2)
+        next(requests)
+        next(requests)
+        time.sleep(0.1)
+        # The two pages read and the next 2 pages, not the 99 pages of the total count
+        self.assertEqual([0, 4, 8, 12], sorted(bigid.offsets))
+        requests.close()
+
+    def test_completed_requests_marked_on_failure(self):
+        bigid = FakeBigID([(f"req{i}", f"ds.s.t{i}", f"id{i}") for i in range(3)])
+        bigid.set_minimization_request_action = mock.Mock(
+            side_effect=[ConnectionError("BigID down"), None])
+
+        def anonymize(ds_conn_getter, cts, records, params, config, progress):
+            if records[0]["fullObjectName"] == "ds.s.t2":
+                raise ValueError("failed t2")
+
+        with mock.patch("app_modules.anonymization.connect_ds_anonymize", side_effect=anonymize):
+            with self.assertRaises(ValueError):
+                anon.run_data_anonymization(RawConfigParser(), {}, "tpa", None, bigid)
+        # The requests anonymized before the failure are marked, also past a failed mark
+        self.assertEqual([mock.call("req0", "Completion Delete Manually", ["id0"]),
+                          mock.call("req1", "Completion Delete Manually", ["id1"])],
+            bigid.set_minimization_request_action.call_args_list)
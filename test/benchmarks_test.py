@@ -0,0 +1,29 @@
+import tempfile
+import unittest
+
+from benchmarks.harness import compare_results, run_case
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_run_cases(self):
+        workdir = tempfile.mkdtemp()
+        for name in ("remediation-staging", "remediation-column", "anonymization"):
+            result = run_case(name, 200, workdir, cts_mode="inprocess", batch_size=50, tables=2,
+                columns=2)
+            self.assertEqual((name, 200, 0, 400), (result["name"], result["rows"],
+                result["clear_rows_left"], result["values_tokenized"]))
+            self.assertGreater(result["rows_per_sec"], 0)
+            self.assertGreater(result["peak_rss_mb"], 0)
+
+    def test_compare_results(self):
+        baseline = [{"name": "a", "rows": 10, "cts": "standin", "rows_per_sec": 100,
+            "cts_calls_per_sec": 10, "peak_rss_mb": 50}]
+        same = dict(baseline[0])
+        self.assertEqual([], compare_results([same], baseline, 0.25))
+        slower = dict(baseline[0], rows_per_sec=70, peak_rss_mb=70)
+        regressions = compare_results([slower], baseline, 0.25)
+        self.assertEqual(2, len(regressions))
+        self.assertIn("rows_per_sec 70 vs baseline 100 (-30%)", regressions[0])
+        other_rows = dict(slower, rows=20)
+        self.assertEqual([], compare_results([other_rows], baseline, 0.25))
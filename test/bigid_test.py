@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+
+from bigid.bigid import BigIDAPI
+from utils.cache import TTLCache
+
+
+class BigIDTest(unittest.TestCase):
+
+    def test_get_sar_reports_in_parallel(self):
+        bigid = BigIDAPI.__new__(BigIDAPI)
+        bigid._max_concurrency = 4
+        lock, in_flight, max_in_flight = threading.Lock(), [0], [0]
+
+        def get_sar_report(request_id):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return [{"requestId": request_id}]
+
+        bigid.get_sar_report = get_sar_report
+        reports = bigid.get_sar_reports(["r1", "r2", "r1"] + [f"r{i}" for i in range(3, 10)])
+        self.assertEqual([f"r{i}" for i in range(1, 10)], list(reports.keys()))
+        self.assertEqual([{"requestId": "r5"}], reports["r5"])
+        self.assertLessEqual(max_in_flight[0], 4)
+        self.assertGreater(max_in_flight[0], 1)
+
+    def test_fan_out_raises_errors(self):
+        bigid = BigIDAPI.__new__(BigIDAPI)
+        bigid._max_concurrency = 4
+
+        def get_object_tags(object_name):
+            if object_name == "bad":
+                raise ValueError(object_name)
+            return []
+
+        bigid.get_object_tags = get_object_tags
+        with self.assertRaises(ValueError):
+            bigid.get_objects_tags(["a", "bad", "c"])
+
+    def test_tags_cache_write_through(self):
+        bigid = BigIDAPI.__new__(BigIDAPI)
+        bigid._cache = TTLCache(300)
+        fetched = []
+        bigid._get_bigid_tags = lambda: fetched.append(1) or [
+            {"tagName": "Other", "tagId": "t0", "tagValue": "v", "valueId": "v0"}]
+        bigid._get_data_source_credentials = lambda tpa_id, name: fetched.append(2) or {"u": name}
+
+        self.assertEqual(1, len(bigid.get_bigid_tags()))
+        self.assertEqual({"u": "ds1"}, bigid.get_data_source_credentials("tpa", "ds1"))
+        self.assertEqual({"u": "ds1"}, bigid.get_data_source_credentials("tpa", "ds1"))
+
+        bigid._add_cached_tag({"tagName": "Thales_Tokenized", "tagId": "t1", "tagValue": None,
+            "valueId": None})
+        self.assertEqual(["Other", "Thales_Tokenized"],
+            [tag["tagName"] for tag in bigid.get_bigid_tags()])
+        self.assertEqual([1, 2], fetched)
+
+        bigid.invalidate_cache(("tags",))
+        bigid.get_bigid_tags()
+        self.assertEqual([1, 2, 1], fetched)
+
+    def test_ttl_cache(self):
+        cache = TTLCache(ttl=0.05)
+        self.assertEqual(1, cache.get_or_load("a", lambda: 1))
+        self.assertEqual(1, cache.get_or_load("a", lambda: 2))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(3, cache.get_or_load("a", lambda: 3))
+        cache.invalidate()
+        self.assertIsNone(cache.get("a"))
+        disabled = TTLCache(ttl=0)
+        disabled.set("a", 1)
+        self.assertIsNone(disabled.get("a"))
+
+    def test_tags_index(self):
+        bigid = BigIDAPI.__new__(BigIDAPI)
+        bigid._cache = TTLCache(300)
+        bigid._get_bigid_tags = lambda: [
+            {"tagName": "Thales_Tokenized", "tagId": "t1", "tagValue": "email", "valueId": "v1"},
+            {"tagName": "Thales_Tokenized", "tagId": "t1", "tagValue": "name", "valueId": "v2"}]
+
+        index = bigid.get_tags_index()
+        self.assertEqual("v2", index[("Thales_Tokenized", "name")]["valueId"])
+        self.assertEqual("t1", index[("Thales_Tokenized", None)]["tagId"])
+        self.assertNotIn(("Thales_Tokenized", "phone"), index)
+
+        bigid._add_cached_tag({"tagName": "Thales_Tokenized", "tagId": "t1", "tagValue": "phone",
+            "valueId": "v3"})
+        self.assertEqual("v3", bigid.get_tags_index()[("Thales_Tokenized", "phone")]["valueId"])
@@ -0,0 +1,24 @@
+import datetime
+import os
+import tempfile
+import unittest
+import uuid
+
+from decimal import Decimal
+
+from utils.checkpoints import CheckpointStore
+
+
+class CheckpointsTest(unittest.TestCase):
+
+    def test_typed_keys_round_trip(self):
+        checkpoints = CheckpointStore(os.path.join(tempfile.mkdtemp(), "checkpoints.db"))
+        last_key = (datetime.datetime(2024, 3, 1, 12, 30, 5, 250),
+                    datetime.date(2024, 3, 1), datetime.time(23, 59),
+                    Decimal("12345678901234567890.0001"), uuid.UUID(int=7), b"\x00\xff",
+                    42, "id-1", None)
+        checkpoints.save("ds", "ds.s.t", "val", last_key, 10)
+        restored = checkpoints.get("ds", "ds.s.t", "val")["last_key"]
+        self.assertEqual(last_key, restored)
+        self.assertEqual([type(value) for value in last_key], [type(value) for value in restored])
+        checkpoints.close()
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from typing import Union
+
+from databases.connection_interface import DBConnectionInterface
+
+
+class SQLiteConnector(DBConnectionInterface):
+    write_strategies = ("staging", "executemany")
+
+    def __init__(self, write_strategy: str = None):
+        # WAL lets the streaming connection read while the main one writes
+        self._path = os.path.join(tempfile.mkdtemp(), "test.db")
+        self._conn = self._new_connection()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self.set_write_strategy(write_strategy)
+
+    def _new_connection(self):
+        return sqlite3.connect(self._path)
+
+    def run_query(self, query: str, fetch_results: bool = False, is_multiple: bool = False,
+            params_mult: list = None, params: list = None):
+        cursor = self._conn.cursor()
+        if is_multiple:
+            cursor.executemany(query, params_mult)
+        else:
+            cursor.execute(query, params or [])
+        rows = cursor.fetchall() if fetch_results else None
+        self._conn.commit()
+        if rows:
+            return rows
+
+    def get_select_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            last_key: tuple = None, fetch_next: int = None, schema: str = None) -> tuple:
+        pkeys_str = ", ".join(primary_keys)
+        columns_str = ", ".join(self.get_columns(column))
+        where_str, params = "", None
+        if last_key is not None:
+            condition, params = self.get_keyset_condition(primary_keys, last_key)
+            where_str = f"WHERE {condition}"
+        limit_str = f"LIMIT {fetch_next}" if fetch_next else ""
+        query = f"SELECT {pkeys_str}, {columns_str} FROM {table_name} {where_str} " \
+            + f"ORDER BY {pkeys_str} {limit_str}"
+        return query, params
+
+    def stream_query(self, query: str, params: list = None, batch_size: int = 1000):
+        conn = self._new_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params or [])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def placeholder(self, position: int) -> str:
+        return "?"
+
+    def estimate_table_size(self, table_name: str, schema: str = None) -> int:
+        # sqlite_stat1 is filled by ANALYZE, its first number is the row count
+        try:
+            rows = self.run_query("SELECT stat FROM sqlite_stat1 WHERE tbl = ?", fetch_results=True,
+                params=[table_name])
+        except sqlite3.OperationalError:
+            return None
+        return int(rows[0][0].split()[0]) if rows else None
+
+    def get_update_batch_query(self, table_name: str, primary_keys: list, column: Union[str, list],
+            schema: str = None) -> str:
+        set_str = ", ".join(f"{col} = ?" for col in self.get_columns(column))
+        where_str = " AND ".join(f"{pkey} = ?" for pkey in primary_keys)
+        return f"UPDATE {table_name} SET {set_str} WHERE {where_str}"
+
+    def _update_batch_staging(self, table_name: str, primary_keys: list, columns: list,
+            pkeys: list, rows: list, schema: str = None):
+        pkeys_str = ", ".join(primary_keys)
+        join_str = " AND ".join(f"{table_name}.{pkey} = s.{pkey}" for pkey in primary_keys)
+        select_str = ", ".join(f"{col} AS token_{i}" for i, col in enumerate(columns))
+        set_str = ", ".join(f"{col} = s.token_{i}" for i, col in enumerate(columns))
+        placeholders = ", ".join(["?"] * (len(primary_keys) + len(columns)))
+        cursor = self._conn.cursor()
+        cursor.execute(f"CREATE TEMP TABLE staging AS SELECT {pkeys_str}, {select_str} "
+            + f"FROM {table_name} LIMIT 0")
+        cursor.executemany(f"INSERT INTO staging VALUES ({placeholders})",
+            [(*pk, *row) for pk, row in zip(pkeys, rows)])
+        cursor.execute(f"UPDATE {table_name} SET {set_str} FROM staging AS s "
+            + f"WHERE {join_str}")
+        cursor.execute("DROP TABLE staging")
+        self._conn.commit()
+
+
+class ConnectionInterfaceTest(unittest.TestCase):
+
+    def test_get_keyset_condition(self):
+        conn = SQLiteConnector()
+        self.assertEqual(("(a > ?)", [1]), conn.get_keyset_condition(["a"], (1,)))
+        self.assertEqual(("(a > ?) OR (a = ? AND b > ?)", [1, 1, "x"]),
+            conn.get_keyset_condition(["a", "b"], (1, "x")))
+
+    def test_iter_batches_composite_key(self):
+        conn = SQLiteConnector()
+        conn.run_query("CREATE TABLE t (a INTEGER, b INTEGER, val TEXT, PRIMARY KEY (a, b))")
+        rows = [(a, b, f"{a}-{b}") for a in range(7) for b in range(3)]
+        conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True, params_mult=rows)
+
+        for batch_size in (1, 4, 21, 50):
+            batches = list(conn.iter_batches("t", ["a", "b"], "val", batch_size))
+            self.assertEqual(rows, [row for batch in batches for row in batch])
+            self.assertTrue(all(len(batch) <= batch_size for batch in batches))
+            streamed = list(conn.stream_batches("t", ["a", "b"], "val", batch_size))
+            self.assertEqual(batches, streamed)
+
+        start_key = (3, 1)
+        resumed = [row for batch in conn.iter_batches("t", ["a", "b"], "val", 5,
+            start_key=start_key) for row in batch]
+        self.assertEqual([row for row in rows if row[:2] > start_key], resumed)
+
+    def test_update_batch(self):
+        for strategy in ("staging", "executemany"):
+            conn = SQLiteConnector(strategy)
+            conn.run_query("CREATE TABLE t (a INTEGER, b INTEGER, val TEXT, PRIMARY KEY (a, b))")
+            conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True,
+                params_mult=[(a, b, "clear") for a in range(3) for b in range(2)])
+            conn.update_batch("t", ["a", "b"], "val", [(0, 1), (2, 0)], ["tk1", "tk2"])
+            self.assertEqual([(0, 0, "clear"), (0, 1, "tk1"), (1, 0, "clear"), (1, 1, "clear"),
+                (2, 0, "tk2"), (2, 1, "clear")],
+                conn.run_query("SELECT * FROM t ORDER BY a, b", fetch_results=True))
+
+    def test_update_batch_columns(self):
+        for strategy in ("staging", "executemany"):
+            conn = SQLiteConnector(strategy)
+            conn.run_query("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+            conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True,
+                params_mult=[(i, "ann", "a@x") for i in range(3)])
+            conn.update_batch("t", ["id"], ["name", "email"], [(0,), (2,)],
+                [("tk1", "tk2"), ("tk3", "tk4")])
+            self.assertEqual([(0, "tk1", "tk2"), (1, "ann", "a@x"), (2, "tk3", "tk4")],
+                conn.run_query("SELECT * FROM t ORDER BY id", fetch_results=True))
+            batches = list(conn.iter_batches("t", ["id"], ["name", "email"], 2))
+            self.assertEqual([[(0, "tk1", "tk2"), (1, "ann", "a@x")], [(2, "tk3", "tk4")]],
+                batches)
+
+    def test_set_write_strategy(self):
+        self.assertEqual("staging", SQLiteConnector().write_strategy)
+        with self.assertRaises(ValueError):
+            SQLiteConnector("copy")
+
+    def test_get_anonymization_update_query(self):
+        conn = SQLiteConnector()
+        conn.run_query("CREATE TABLE t (id TEXT, name TEXT, email TEXT)")
+        conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True,
+            params_mult=[("1", "ann", "a@x"), ("2", "bob", "b@x"), ("3", "ann", "c@x")])
+        query = conn.get_anonymization_update_query("t", ["name", "email"], "id")
+        conn.run_query(query, is_multiple=True, params_mult=[("tk1", "tk2", "ann", "a@x", "1"),
+            ("tk3", "tk4", "bob", "wrong", "2")])
+        self.assertEqual([("1", "tk1", "tk2"), ("2", "bob", "b@x"), ("3", "ann", "c@x")],
+            conn.run_query("SELECT * FROM t ORDER BY id", fetch_results=True))
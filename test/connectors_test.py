@@ -0,0 +1,109 @@
+import unittest
+
+from unittest import mock
+
+from databases.mysql_conn import MySQLConnector
+from databases.postgresql_conn import PostgreSQLConnector, copy_escape
+
+try:
+    from databases.sqlserver_conn import SQLServerConnector
+except ImportError:
+    # pyodbc needs the unixODBC library
+    SQLServerConnector = None
+
+
+def connect(connector_class, *args, **kwargs):
+    """
+    Returns a connector whose connection is a mock, with the mock cursor
+    """
+    connection = mock.MagicMock()
+    with mock.patch.object(connector_class, "_new_connection", return_value=connection):
+        conn = connector_class("host", 1, "db", "user", "password", *args, **kwargs)
+    cursor = connection.cursor.return_value
+    return conn, cursor
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.split())
+
+
+class ConnectorsTest(unittest.TestCase):
+
+    def test_copy_escape(self):
+        self.assertEqual("\\N", copy_escape(None))
+        self.assertEqual("a\\tb\\nc\\rd\\\\e", copy_escape("a\tb\nc\rd\\e"))
+        self.assertEqual("42", copy_escape(42))
+
+    def test_postgresql_copy_update(self):
+        conn, cursor = connect(PostgreSQLConnector, write_strategy="copy")
+        buffers = []
+        cursor.copy_expert.side_effect = lambda query, buffer: buffers.append(buffer.read())
+        conn.update_batch("t", ["id", "part"], ["name", "email"], [(1, "a"), (2, None)],
+            [("tk\t1", "x\\y"), ("line\nbreak", None)], schema="sales")
+
+        queries = [normalize(call.args[0]) for call in cursor.execute.call_args_list]
+        self.assertEqual([
+            "CREATE TEMP TABLE thales_staging ON COMMIT DROP AS SELECT id, part, "
+                + "name AS thales_token_0, email AS thales_token_1 FROM SALES.T WITH NO DATA",
+            "UPDATE SALES.T AS t SET name = s.thales_token_0, email = s.thales_token_1 "
+                + "FROM thales_staging AS s WHERE t.id = s.id AND t.part = s.part"], queries)
+        self.assertEqual("COPY thales_staging (id, part, thales_token_0, thales_token_1) FROM STDIN",
+            cursor.copy_expert.call_args.args[0])
+        self.assertEqual(["1\ta\ttk\\t1\tx\\\\y\n2\t\\N\tline\\nbreak\t\\N\n"], buffers)
+
+    def test_mysql_staging_update(self):
+        conn, cursor = connect(MySQLConnector, write_strategy="staging")
+        conn.update_batch("t", ["id"], "name", [(1,), (2,)], ["tk1", "tk2"], schema="sales")
+
+        queries = [normalize(call.args[0]) for call in cursor.execute.call_args_list]
+        self.assertEqual([
+            "DROP TEMPORARY TABLE IF EXISTS thales_staging",
+            "CREATE TEMPORARY TABLE thales_staging AS SELECT id, name AS thales_token_0 "
+                + "FROM sales.t LIMIT 0",
+            "UPDATE sales.t AS t JOIN thales_staging AS s ON t.id = s.id "
+                + "SET t.name = s.thales_token_0",
+            "DROP TEMPORARY TABLE thales_staging"], queries)
+        insert, params = cursor.executemany.call_args.args
+        self.assertEqual("INSERT INTO thales_staging (id, thales_token_0) VALUES (%s, %s)",
+            normalize(insert))
+        self.assertEqual([(1, "tk1"), (2, "tk2")], params)
+
+    def test_mysql_stream_write_timeout(self):
+        conn, _ = connect(MySQLConnector, net_write_timeout="600")
+        stream_connection = mock.MagicMock()
+        cursor = stream_connection.cursor.return_value
+        cursor.fetchmany.side_effect = [[(1, "a"), (2, "b")], []]
+        with mock.patch.object(conn, "_new_connection", return_value=stream_connection):
+            batches = list(conn.stream_query("SELECT id, name FROM t", batch_size=2))
+
+        self.assertEqual([[(1, "a"), (2, "b")]], batches)
+        self.assertEqual([mock.call("SET SESSION net_write_timeout = 600"),
+                          mock.call("SELECT id, name FROM t", None)], cursor.execute.call_args_list)
+        stream_connection.close.assert_called_once()
+
+    @unittest.skipIf(SQLServerConnector is None, "pyodbc cannot be loaded")
+    def test_sqlserver_update_batch_query(self):
+        conn, _ = connect(SQLServerConnector)
+        self.assertEqual("UPDATE DBO.T SET name = ?, email = ? WHERE id = ? AND part = ?",
+            normalize(conn.get_update_batch_query("t", ["id", "part"], ["name", "email"], "dbo")))
+
+    @unittest.skipIf(SQLServerConnector is None, "pyodbc cannot be loaded")
+    def test_sqlserver_staging_table_drops_identity(self):
+        conn, cursor = connect(SQLServerConnector, write_strategy="staging")
+        self.assertEqual("SELECT ISNULL(id, id) AS id, ISNULL(name, name) AS thales_token_0 "
+            + "INTO #thales_staging FROM DBO.T WHERE 1 = 0",
+            normalize(conn.get_staging_table_query("DBO.T", ["id"], ["name"])))
+
+        conn.update_batch("t", ["id"], ["name", "email"], [(1,), (2,)],
+            [("tk1", "tk2"), ("tk3", "tk4")], schema="dbo")
+        queries = [normalize(call.args[0]) for call in cursor.execute.call_args_list]
+        self.assertEqual([
+            "SELECT ISNULL(id, id) AS id, ISNULL(name, name) AS thales_token_0, "
+                + "ISNULL(email, email) AS thales_token_1 INTO #thales_staging FROM DBO.T WHERE 1 = 0",
+            "UPDATE t SET t.name = s.thales_token_0, t.email = s.thales_token_1 "
+                + "FROM DBO.T AS t JOIN #thales_staging AS s ON t.id = s.id",
+            "DROP TABLE #thales_staging"], queries)
+        insert, params = cursor.executemany.call_args.args
+        self.assertEqual("INSERT INTO #thales_staging (id, thales_token_0, thales_token_1) "
+            + "VALUES (?, ?, ?)", normalize(insert))
+        self.assertEqual([(1, "tk1", "tk2"), (2, "tk3", "tk4")], params)
@@ -0,0 +1,152 @@
+import asyncio
+import unittest
+
+from configparser import RawConfigParser
+
+from app_service import AppService
+from cts.async_cts_request import AsyncCTSRequest
+from cts.batch_tuner import BatchTuner
+from cts.cts_request import CTSRequest
+from cts.token_cache import TokenCache
+from utils.exceptions import CTSException, CTSOverloadedException
+
+
+class CTSTest(unittest.TestCase):
+
+    def test_token_cache_lru(self):
+        cache = TokenCache(max_entries=2)
+        cache.put_many("grp", "tmpl", {"a": "tk_a", "b": "tk_b"})
+        self.assertEqual({"a": "tk_a"}, cache.get_many("grp", "tmpl", ["a"]))
+        cache.put_many("grp", "tmpl", {"c": "tk_c"})
+        self.assertEqual({"a": "tk_a", "c": "tk_c"}, cache.get_many("grp", "tmpl", ["a", "b", "c"]))
+        self.assertEqual({}, cache.get_many("grp", "other", ["a"]))
+
+        stats = cache.get_stats()
+        self.assertEqual((2, 3, 2, 1), (stats["entries"], stats["hits"], stats["misses"],
+            stats["evictions"]))
+
+        cache.clear()
+        self.assertEqual((0, 0), (cache.get_stats()["entries"], cache.get_stats()["bytes"]))
+
+    def test_token_cache_max_bytes(self):
+        cache = TokenCache(max_entries=100, max_bytes=10)
+        cache.put_many("grp", "tmpl", {"aa": "tk_aa", "bb": "tk_bb"})
+        self.assertEqual({"bb": "tk_bb"}, cache.get_many("grp", "tmpl", ["aa", "bb"]))
+        self.assertLessEqual(cache.nbytes, 10)
+
+    def test_tokenize_with_cache(self):
+        sent = []
+
+        def fake_tokenize(values, tokengroup, tokentemplate):
+            sent.append(list(values))
+            return [f"tk_{val}" for val in values]
+
+        cts = CTSRequest("localhost", "user", "pw", "", token_cache=TokenCache(100))
+        cts._tokenize = fake_tokenize
+        self.assertEqual(["tk_BR", "tk_US", "tk_BR"], cts.tokenize(["BR", "US", "BR"], "g", "t"))
+        self.assertEqual(["tk_US", "tk_FR"], cts.tokenize(["US", "FR"], "g", "t"))
+        self.assertEqual([["BR", "US"], ["FR"]], sent)
+
+    def test_short_response(self):
+        cts = CTSRequest("localhost", "user", "pw", "", token_cache=TokenCache(10))
+        cts._make_request = lambda content, method: [{"status": "Succeed", "token": "tk_a"}]
+        with self.assertRaisesRegex(CTSException, "1 tokens for 2 values"):
+            cts.tokenize(["a", "b", "a"], "g", "t")
+
+        cts._tokenize = lambda values, group, template: ["tk_a"]
+        with self.assertRaisesRegex(CTSException, "1 tokens for 2 values"):
+            cts.tokenize(["a", "b"], "g", "t")
+
+    def test_batch_tuner(self):
+        tuner = BatchTuner(initial_batch_size=100, max_batch_size=160, target_latency=1.0,
+            increase_step=50)
+        tuner.record_success(100, 0.1)
+        self.assertEqual(150, tuner.get_batch_size())
+        tuner.record_success(10, 0.1)
+        self.assertEqual(150, tuner.get_batch_size())
+        tuner.record_success(150, 0.1)
+        self.assertEqual(160, tuner.get_batch_size())
+        tuner.record_success(160, 2.0)
+        self.assertEqual(80, tuner.get_batch_size())
+        tuner.record_failure()
+        self.assertEqual(40, tuner.get_batch_size())
+        self.assertEqual((4, 1), (tuner.get_stats()["requests"], tuner.get_stats()["failures"]))
+
+    def test_tokenize_adaptive_batches(self):
+        sent = []
+
+        def fake_request(values, tokengroup, tokentemplate):
+            sent.append(len(values))
+            if len(values) > 4:
+                raise CTSOverloadedException("503")
+            return [f"tk_{val}" for val in values]
+
+        cts = CTSRequest("localhost", "user", "pw", "", max_retries=5,
+            batch_tuner=BatchTuner(initial_batch_size=16, increase_step=0, max_payload_bytes=10000))
+        cts._tokenize_request = fake_request
+        values = [f"v{i}" for i in range(10)]
+        self.assertEqual([f"tk_{val}" for val in values], cts.tokenize(values, "g", "t"))
+        self.assertEqual([10, 8, 4, 4, 2], sent)
+
+        cts._tokenize_request = lambda values, group, template: fake_request(values * 5, group,
+            template)
+        cts._max_retries = 1
+        with self.assertRaises(CTSException):
+            cts.tokenize(values, "g", "t")
+
+    def test_tokenize_payload_budget(self):
+        sent = []
+        cts = CTSRequest("localhost", "user", "pw", "",
+            batch_tuner=BatchTuner(initial_batch_size=100, max_payload_bytes=200))
+        cts._tokenize_request = lambda values, group, template: sent.append(len(values)) or values
+        cts.tokenize(["x" * 30] * 10, "g", "t")
+        self.assertEqual([2, 2, 2, 2, 2], sent)
+
+    def test_async_tokenize(self):
+        cts = AsyncCTSRequest("localhost", "user", "pw", "", max_retries=2)
+        calls = []
+
+        async def fake_request(content, method):
+            calls.append(content[0]["data"])
+            if calls == ["down"]:
+                raise CTSOverloadedException("503")
+            if content[0]["data"] == "bad":
+                return {"reason": "invalid token group"}
+            await asyncio.sleep(0.01)
+            return [{"status": "error", "reason": "After accounting for keepleft ..."}
+                    if item["data"] == "x" else {"status": "Succeed", "token": f"tk_{item['data']}"}
+                    for item in content]
+
+        cts._make_request = fake_request
+        self.assertEqual(["tk_down"], asyncio.run(cts.tokenize(["down"], "g", "t")))
+        self.assertEqual(["down", "down"], calls)
+
+        futures = [cts.submit([f"v{i}", "x"], "g", "t") for i in range(6)]
+        self.assertEqual([[f"tk_v{i}", "x"] for i in range(6)], [f.result() for f in futures])
+        with self.assertRaises(CTSException):
+            cts.submit(["bad"], "g", "t").result()
+        cts.close()
+
+    def test_async_basic_auth_header(self):
+        cts = AsyncCTSRequest("localhost", "user", "pw", "")
+
+        async def get_headers():
+            async with cts:
+                return dict(cts._get_session().headers)
+
+        self.assertEqual("Basic dXNlcjpwdw==", asyncio.run(get_headers())["Authorization"])
+
+    def test_async_client_params(self):
+        config = RawConfigParser()
+        config.read_dict({"CTS": {"adaptive_batching": "true"}})
+        service = AppService.__new__(AppService)
+        service.config = config
+
+        service.params = {"CTSClient": "async", "TokenCacheSize": "0"}
+        service.validate_params()
+        service.params = {"CTSClient": "async", "TokenCacheSize": "1000"}
+        with self.assertRaises(ValueError):
+            service.validate_params()
+        service.params = {"CTSClient": "threads", "TokenCacheSize": "1000"}
+        service.validate_params()
+        self.assertEqual(1000, service.params["TokenCacheSize"])
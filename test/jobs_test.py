@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from utils.exceptions import ExecutionInFlightException
+from utils.jobs import ExecutionProgress, JobRegistry
+
+
+class JobsTest(unittest.TestCase):
+
+    def test_job_progress_and_status(self):
+        registry = JobRegistry(max_workers=2, status_dir=tempfile.mkdtemp())
+        started, release = threading.Event(), threading.Event()
+
+        def action(progress):
+            progress.add_total(10)
+            progress.add_processed(4)
+            started.set()
+            release.wait(5)
+
+        progress = registry.submit("exec-1", "Remediate", action, save_interval=0)
+        started.wait(5)
+        status = registry.get_status("exec-1")
+        self.assertEqual("IN_PROGRESS", status["statusEnum"])
+        self.assertEqual((4, 10, 0.4), (status["rowsProcessed"], status["rowsTotal"],
+            status["progress"]))
+        self.assertEqual(1, registry.get_jobs_in_flight())
+
+        release.set()
+        registry._executor.shutdown(wait=True)
+        status = registry.get_status("exec-1")
+        self.assertEqual("COMPLETED", status["statusEnum"])
+        self.assertEqual(1, status["progress"])
+        self.assertEqual(progress.to_dict(), status)
+        self.assertIsNone(registry.get_status("unknown"))
+
+    def test_job_error(self):
+        registry = JobRegistry(max_workers=1, status_dir=tempfile.mkdtemp())
+
+        def action(progress):
+            raise ValueError("boom")
+
+        registry.submit("exec-2", "Anonymize", action)
+        registry._executor.shutdown(wait=True)
+        status = registry.get_status("exec-2")
+        self.assertEqual("ERROR", status["statusEnum"])
+        self.assertIn("Anonymize", status["message"])
+
+    def test_status_updates_do_not_block(self):
+        release, updates = threading.Event(), []
+
+        def on_update(status):
+            release.wait(5)
+            updates.append(status)
+
+        progress = ExecutionProgress("exec-3", tempfile.mkdtemp(), on_update, save_interval=0)
+        start = time.perf_counter()
+        for _ in range(100):
+            progress.add_processed(1)
+        self.assertLess(time.perf_counter() - start, 1)
+
+        release.set()
+        progress.finish("COMPLETED", "Done")
+        # Statuses queued behind the slow request are dropped, the last one is sent
+        self.assertLess(len(updates), 100)
+        self.assertEqual(("COMPLETED", 100), (updates[-1]["statusEnum"],
+            updates[-1]["rowsProcessed"]))
+        self.assertTrue(all("report" not in update for update in updates))
+
+    def test_execution_in_flight_rejected(self):
+        registry = JobRegistry(max_workers=2, status_dir=tempfile.mkdtemp())
+        release = threading.Event()
+        registry.submit("exec-4", "Remediate", lambda progress: release.wait(5))
+        with self.assertRaises(ExecutionInFlightException):
+            registry.submit("exec-4", "Anonymize", lambda progress: None)
+        release.set()
+        registry._executor.shutdown(wait=True)
+        self.assertEqual("Completed action Remediate successfully",
+            registry.get_status("exec-4")["message"])
+
+    def test_old_status_files_pruned(self):
+        status_dir = tempfile.mkdtemp()
+        registry = JobRegistry(max_workers=1, status_dir=status_dir, status_retention=3600)
+        old_path = os.path.join(status_dir, "exec-old.json")
+        with open(old_path, "w", encoding="utf-8") as f:
+            f.write("{}")
+        os.utime(old_path, (0, 0))
+
+        registry.submit("exec-5", "Remediate", lambda progress: None)
+        registry._executor.shutdown(wait=True)
+        self.assertEqual(["exec-5.json"], os.listdir(status_dir))
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from utils import log
+from utils.log import Log, configure_log
+
+
+def write_log(filename: str, worker: int):
+    configure_log("INFO", filename, max_bytes=2000, backup_count=50, buffer_size=0)
+    for i in range(100):
+        Log.info(f"worker {worker} message {i}")
+
+
+class LogTest(unittest.TestCase):
+
+    def tearDown(self):
+        configure_log()
+
+    def test_buffered_log(self):
+        filename = os.path.join(tempfile.mkdtemp(), "log.txt")
+        configure_log("INFO", filename, buffer_size=10)
+
+        Log.debug("query")
+        Log.info("first")
+        Log.warn("second")
+        self.assertFalse(os.path.exists(filename))
+
+        Log.flush()
+        with open(filename, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith("INFO  [log_test.py] - first"))
+        self.assertTrue(lines[1].endswith("WARN  [log_test.py] - second"))
+
+        # Errors are written right away
+        Log.error("third")
+        with open(filename, encoding="utf-8") as f:
+            self.assertTrue(f.read().splitlines()[-1].endswith("ERROR [log_test.py] - third"))
+
+    def test_rotation(self):
+        filename = os.path.join(tempfile.mkdtemp(), "log.txt")
+        configure_log("DEBUG", filename, max_bytes=200, backup_count=2, buffer_size=0)
+        for i in range(20):
+            Log.debug(f"message {i}")
+        self.assertTrue(os.path.exists(f"{filename}.1"))
+        self.assertLessEqual(os.path.getsize(filename), 200)
+
+    @unittest.skipIf(log.fcntl is None, "fcntl is not available")
+    def test_rotation_across_processes(self):
+        filename = os.path.join(tempfile.mkdtemp(), "log.txt")
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=write_log, args=(filename, worker)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        lines = []
+        for path in [filename] + [f"{filename}.{i}" for i in range(1, 51)]:
+            if os.path.exists(path):
+                self.assertLessEqual(os.path.getsize(path), 2000)
+                with open(path, encoding="utf-8") as f:
+                    lines += f.read().splitlines()
+        # No record is lost or overwritten by the rotation of another worker
+        self.assertEqual(400, len(lines))
+        self.assertEqual(400, len({line.split(" - ")[1] for line in lines}))
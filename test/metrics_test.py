@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from unittest import mock
+
+import utils.metrics as metrics
+from utils.metrics import MetricsRegistry, track_calls
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counters_and_gauges(self):
+        registry = MetricsRegistry()
+        registry.inc("rows_tokenized_total", 10, action="remediation")
+        registry.inc("rows_tokenized_total", 5, action="remediation")
+        registry.set_gauge("jobs_in_flight", 3)
+        registry.set_gauge("jobs_in_flight", 1)
+        text = registry.render()
+        self.assertIn('thales_bigid_rows_tokenized_total{action="remediation"} 15', text)
+        self.assertIn("# TYPE thales_bigid_rows_tokenized_total counter", text)
+        self.assertIn("thales_bigid_jobs_in_flight 1", text)
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        for seconds in (0.001, 0.02, 0.02, 60):
+            registry.observe("cts_request_seconds", seconds, client="threads")
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE thales_bigid_cts_request_seconds histogram", lines)
+        self.assertIn('thales_bigid_cts_request_seconds_bucket{client="threads",le="0.005"} 1', lines)
+        self.assertIn('thales_bigid_cts_request_seconds_bucket{client="threads",le="0.025"} 3', lines)
+        self.assertIn('thales_bigid_cts_request_seconds_bucket{client="threads",le="30"} 3', lines)
+        self.assertIn('thales_bigid_cts_request_seconds_bucket{client="threads",le="+Inf"} 4', lines)
+        self.assertIn('thales_bigid_cts_request_seconds_count{client="threads"} 4', lines)
+        self.assertIn('thales_bigid_cts_request_seconds_sum{client="threads"} 60.041', lines)
+
+    def test_workers_are_summed(self):
+        metrics_dir = tempfile.mkdtemp()
+        worker, other = MetricsRegistry(metrics_dir), MetricsRegistry(metrics_dir)
+        worker.inc("jobs_total", action="Remediate", status="COMPLETED")
+        worker.observe("db_write_seconds", 0.2, connector="PostgreSQLConnector")
+        other.inc("jobs_total", 2, action="Remediate", status="COMPLETED")
+        other.observe("db_write_seconds", 0.3, connector="PostgreSQLConnector")
+        other.set_gauge("jobs_in_flight", 2)
+        # Another worker, as seen from this process
+        with mock.patch("os.getpid", return_value=os.getppid()):
+            other.flush()
+
+        text = worker.render()
+        self.assertIn('thales_bigid_jobs_total{action="Remediate",status="COMPLETED"} 3', text)
+        self.assertIn('thales_bigid_db_write_seconds_count{connector="PostgreSQLConnector"} 2', text)
+        self.assertIn("thales_bigid_jobs_in_flight 2", text)
+
+    def test_finished_worker_gauges_are_dropped(self):
+        metrics_dir = tempfile.mkdtemp()
+        worker, finished = MetricsRegistry(metrics_dir), MetricsRegistry(metrics_dir)
+        finished.inc("rows_tokenized_total", 7, action="anonymization")
+        finished.set_gauge("jobs_in_flight", 4)
+        with mock.patch("os.getpid", return_value=2 ** 22 + 1):
+            finished.flush()
+        with mock.patch("utils.metrics._is_alive", side_effect=lambda pid: pid == os.getpid()):
+            text = worker.render()
+        self.assertIn('thales_bigid_rows_tokenized_total{action="anonymization"} 7', text)
+        self.assertNotIn("jobs_in_flight", text)
+
+    def test_finished_worker_snapshots_are_folded(self):
+        metrics_dir = tempfile.mkdtemp()
+        worker, finished = MetricsRegistry(metrics_dir), MetricsRegistry(metrics_dir)
+        worker.inc("jobs_total", action="Remediate", status="COMPLETED")
+        finished.inc("jobs_total", 2, action="Remediate", status="COMPLETED")
+        finished.observe("db_read_seconds", 0.2, connector="OracleConnector")
+        with mock.patch("os.getpid", return_value=2 ** 22 + 1):
+            finished.flush()
+        with mock.patch("utils.metrics._is_alive", side_effect=lambda pid: pid == os.getpid()):
+            first, second = worker.render(), worker.render()
+        self.assertEqual(first, second)
+        self.assertIn('thales_bigid_jobs_total{action="Remediate",status="COMPLETED"} 3', first)
+        self.assertIn('thales_bigid_db_read_seconds_count{connector="OracleConnector"} 1', first)
+        # Only the snapshot of the live worker is left, holding the folded values
+        self.assertEqual([f"{os.getpid()}.json"], os.listdir(metrics_dir))
+
+    def test_concurrent_flushes(self):
+        metrics_dir = tempfile.mkdtemp()
+        registry = MetricsRegistry(metrics_dir, flush_interval=0)
+
+        def update():
+            for _ in range(500):
+                registry.inc("rows_tokenized_total", action="remediation")
+
+        threads = [threading.Thread(target=update) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.flush()
+        self.assertEqual([f"{os.getpid()}.json"], os.listdir(metrics_dir))
+        with open(os.path.join(metrics_dir, f"{os.getpid()}.json"), encoding="utf-8") as f:
+            self.assertEqual([["rows_tokenized_total", [["action", "remediation"]], 4000]],
+                json.load(f)["counters"])
+
+    def test_track_calls(self):
+        registry = MetricsRegistry()
+
+        @track_calls("bigid_request")
+        def _get_data(fail: bool):
+            if fail:
+                raise ValueError("failed")
+            return "data"
+
+        with mock.patch.object(metrics, "_registry", registry):
+            self.assertEqual("data", _get_data(False))
+            self.assertRaises(ValueError, _get_data, True)
+        text = registry.render()
+        self.assertIn('thales_bigid_bigid_request_seconds_count{method="get_data"} 2', text)
+        self.assertIn('thales_bigid_bigid_request_errors_total{method="get_data"} 1', text)
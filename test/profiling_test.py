@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from utils.jobs import ExecutionProgress
+from utils.profiling import ExecutionProfiler, get_profile_path, is_profiling_requested
+
+
+def busy_worker(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_profile_requested(self):
+        self.assertTrue(is_profiling_requested({"X-Thales-Profile": "1"}, {}))
+        self.assertTrue(is_profiling_requested({}, {"Profile": "True"}))
+        self.assertFalse(is_profiling_requested({}, {"Profile": "false"}))
+        self.assertFalse(is_profiling_requested({}, {}))
+
+    def test_profiled_action(self):
+        tmp_dir = tempfile.mkdtemp()
+        profiles_dir = os.path.join(tmp_dir, "profiles")
+        progress = ExecutionProgress("exec-1", tmp_dir)
+        kept = []
+
+        def action(progress):
+            progress.mark_phase("allocate")
+            kept.append([str(i) for i in range(20000)])
+            progress.mark_phase("work")
+            # Threads started by the action are sampled too
+            worker = threading.Thread(target=busy_worker, args=(0.3,))
+            worker.start()
+            worker.join()
+
+        ExecutionProfiler("exec-1", profiles_dir, interval=0.005).wrap(action)(progress)
+        # Phases marked after the action ends are ignored
+        progress.mark_phase("late")
+
+        profile_path = get_profile_path(profiles_dir, "exec-1")
+        with zipfile.ZipFile(profile_path) as artifact:
+            profile = json.loads(artifact.read("profile.json"))
+            stacks = artifact.read("stacks.folded").decode()
+            summary = artifact.read("summary.txt").decode()
+
+        self.assertEqual(["start", "allocate", "work", "end"],
+            [phase["phase"] for phase in profile["phases"]])
+        work = profile["phases"][2]
+        self.assertTrue(any(alloc["location"].startswith(__file__) and alloc["sizeDiff"] > 0
+                            for alloc in work["topAllocations"]))
+        self.assertGreater(profile["samples"], 0)
+        self.assertIn("busy_worker", stacks)
+        self.assertIn("busy_worker", summary)
+
+    def test_old_profiles_removed(self):
+        profiles_dir = tempfile.mkdtemp()
+        progress = ExecutionProgress("exec", tempfile.mkdtemp())
+        for i in range(3):
+            ExecutionProfiler(f"exec-{i}", profiles_dir, max_profiles=2).wrap(lambda p: None)(progress)
+            time.sleep(0.01)
+        self.assertIsNone(get_profile_path(profiles_dir, "exec-0"))
+        self.assertIsNotNone(get_profile_path(profiles_dir, "exec-2"))
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest import mock
+
+import app_modules.remediation as remed
+import utils.utils as ut
+from cts.async_cts_request import AsyncCTSRequest
+from databases.postgresql_conn import PostgreSQLConnector
+from utils.checkpoints import CheckpointStore
+from test.connection_interface_test import SQLiteConnector
+from test.connectors_test import connect, normalize
+
+
+class FakeCTS:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def tokenize(self, values, tokengroup, tokentemplate):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        return [f"tk_{val}" for val in values]
+
+
+class RemediationTest(unittest.TestCase):
+
+    def test_tokenize_batches_keeps_order(self):
+        batches = [([i], [f"v{i}"]) for i in range(20)]
+        for concurrency in (1, 4):
+            cts = FakeCTS(delay=0.001)
+            results = list(remed.tokenize_batches(cts, iter(batches), "grp", "tmpl", concurrency))
+            self.assertEqual([([i], [f"tk_v{i}"]) for i in range(20)], results)
+            self.assertLessEqual(cts.max_in_flight, concurrency)
+
+    def test_tokenize_batches_async_client(self):
+        cts = AsyncCTSRequest("localhost", "user", "pw", "")
+
+        async def fake_request(content, method):
+            await asyncio.sleep(0.001)
+            return [{"status": "Succeed", "token": f"tk_{item['data']}"} for item in content]
+
+        cts._make_request = fake_request
+        batches = [([i], [f"v{i}"]) for i in range(50)]
+        results = list(remed.tokenize_batches(cts, iter(batches), "grp", "tmpl", 20))
+        cts.close()
+        self.assertEqual([([i], [f"tk_v{i}"]) for i in range(50)], results)
+
+    def test_tokenize_column(self):
+        for strategy in ("staging", "executemany"):
+            for read_mode in ("stream", "keyset"):
+                conn = SQLiteConnector(strategy)
+                conn.run_query("CREATE TABLE t (id INTEGER PRIMARY KEY, val TEXT)")
+                conn.run_query("INSERT INTO t VALUES (?, ?)", is_multiple=True,
+                    params_mult=[(i, f"v{i}") for i in range(25)])
+                remed.tokenize_column(FakeCTS(), conn, None, "t", "val", ["id"], 4, "grp", "tmpl",
+                    concurrency=3, read_mode=read_mode)
+                self.assertEqual([(i, f"tk_v{i}") for i in range(25)],
+                    conn.run_query("SELECT * FROM t ORDER BY id", fetch_results=True))
+
+    def test_tokenize_table(self):
+        class TemplateCTS(FakeCTS):
+            def tokenize(self, values, tokengroup, tokentemplate):
+                return [f"{tokentemplate}_{val}" for val in super().tokenize(values, tokengroup,
+                    tokentemplate)]
+
+        for strategy in ("staging", "executemany"):
+            for read_mode in ("stream", "keyset"):
+                conn = SQLiteConnector(strategy)
+                conn.run_query("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+                conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True,
+                    params_mult=[(i, f"n{i}", f"e{i}") for i in range(25)])
+                pkeys_done = []
+                remed.tokenize_table(TemplateCTS(), conn, None, "t", ["name", "email"], ["id"], 4,
+                    "grp", ["t1", "t2"], concurrency=3, read_mode=read_mode,
+                    on_batch=lambda pkeys: pkeys_done.extend(pkeys))
+                self.assertEqual([(i, f"t1_tk_n{i}", f"t2_tk_e{i}") for i in range(25)],
+                    conn.run_query("SELECT * FROM t ORDER BY id", fetch_results=True))
+                self.assertEqual([(i,) for i in range(25)], pkeys_done)
+
+    def test_group_columns(self):
+        checkpoint = {"last_key": (5,), "rows": 6}
+        pending = [("a", None), ("b", checkpoint), ("c", None)]
+        self.assertEqual([(["a", "c"], None), (["b"], checkpoint)],
+            remed.group_columns(pending, "table"))
+        self.assertEqual([(["a"], None), (["b"], checkpoint), (["c"], None)],
+            remed.group_columns(pending, "column"))
+
+    def test_run_in_pool_collects_errors(self):
+        done = []
+
+        def func(item):
+            if item % 3 == 0:
+                raise ValueError(f"failed {item}")
+            done.append(item)
+
+        errors = remed.run_in_pool(func, list(range(10)), 4, lambda item: f"item{item}")
+        self.assertEqual({"item0", "item3", "item6", "item9"}, set(errors))
+        self.assertEqual([1, 2, 4, 5, 7, 8], sorted(done))
+
+    def test_tokenize_column_resumes_from_checkpoint(self):
+        class FailingCTS(FakeCTS):
+            def __init__(self, fail_at: int):
+                super().__init__()
+                self.calls, self.fail_at = 0, fail_at
+
+            def tokenize(self, values, tokengroup, tokentemplate):
+                self.calls += 1
+                if self.calls == self.fail_at:
+                    raise ValueError("CTS down")
+                return super().tokenize(values, tokengroup, tokentemplate)
+
+        checkpoints = CheckpointStore(os.path.join(tempfile.mkdtemp(), "checkpoints.db"))
+        on_batch = lambda pkeys: checkpoints.save("ds", "ds.main.t", "val", pkeys[-1], len(pkeys))
+        for read_mode in ("stream", "keyset"):
+            checkpoints.clear("ds", "ds.main.t", "val")
+            conn = SQLiteConnector()
+            conn.run_query("CREATE TABLE t (a INTEGER, b TEXT, val TEXT, PRIMARY KEY (a, b))")
+            conn.run_query("INSERT INTO t VALUES (?, ?, ?)", is_multiple=True,
+                params_mult=[(i // 2, str(i % 2), f"v{i}") for i in range(25)])
+
+            with self.assertRaises(ValueError):
+                remed.tokenize_column(FailingCTS(4), conn, None, "t", "val", ["a", "b"], 4, "grp",
+                    "tmpl", read_mode=read_mode, on_batch=on_batch)
+            checkpoint = checkpoints.get("ds", "ds.main.t", "val")
+            self.assertEqual(((5, "1"), 12, 3, "in_progress"), (checkpoint["last_key"],
+                checkpoint["rows"], checkpoint["batches"], checkpoint["status"]))
+
+            remed.tokenize_column(FakeCTS(), conn, None, "t", "val", ["a", "b"], 4, "grp", "tmpl",
+                read_mode=read_mode, start_key=checkpoint["last_key"], on_batch=on_batch)
+            checkpoints.complete("ds", "ds.main.t", "val")
+            self.assertEqual([f"tk_v{i}" for i in range(25)],
+                [row[0] for row in conn.run_query("SELECT val FROM t ORDER BY a, b",
+                    fetch_results=True)])
+            self.assertEqual((25, "done"), (checkpoints.get("ds", "ds.main.t", "val")["rows"],
+                checkpoints.get("ds", "ds.main.t", "val")["status"]))
+        checkpoints.close()
+
+    def test_get_table_size(self):
+        conn = SQLiteConnector()
+        conn.run_query("CREATE TABLE t (id INTEGER PRIMARY KEY, val TEXT)")
+        conn.run_query("CREATE INDEX t_val ON t (val)")
+        conn.run_query("INSERT INTO t VALUES (?, ?)", is_multiple=True,
+            params_mult=[(i, f"v{i}") for i in range(30)])
+        self.assertIsNone(conn.estimate_table_size("t"))
+        self.assertEqual(30, remed.get_table_size(conn, "t"))
+
+        conn.run_query("ANALYZE")
+        conn.run_query("DELETE FROM t WHERE id >= 10")
+        # The statistics are used even when stale
+        self.assertEqual(30, remed.get_table_size(conn, "t"))
+
+    def test_get_table_size_counts_in_schema(self):
+        conn, cursor = connect(PostgreSQLConnector)
+        cursor.fetchall.side_effect = [[], [(12,)]]
+        self.assertEqual(12, remed.get_table_size(conn, "t", "sales"))
+        self.assertEqual("SELECT COUNT(*) FROM SALES.T", normalize(cursor.execute.call_args.args[0]))
+
+    def test_get_ds_connector_options(self):
+        config = ut.read_config_file("config.ini")
+        connector_class = mock.MagicMock()
+        bigid = mock.MagicMock()
+        ds_conn_getter = bigid.get_data_source_conn_from_source_name.return_value
+        ds_conn_getter.get_conn_param.return_value = (connector_class, "host", 1, "db")
+        for rdb_type, options in (
+                ("rdb-mssql", {"write_strategy": "staging", "driver": config["SQLServer"]["driver"],
+                               "encrypt": config["SQLServer"]["encrypt"]}),
+                ("rdb-mysql", {"write_strategy": "staging",
+                               "net_write_timeout": config["MySQL"]["net_write_timeout"]}),
+                ("rdb-postgresql", {"write_strategy": "copy"})):
+            ds_conn_getter.get_rdb_type.return_value = rdb_type
+            remed.get_ds_connector(bigid, config, "tpa", "ds")
+            self.assertEqual(options, connector_class.call_args.kwargs)
+
+    def test_tokenize_uses_schema(self):
+        conn, cursor = connect(PostgreSQLConnector, write_strategy="executemany")
+        cursor.fetchall.side_effect = [[(1, "n1", "e1")], None, [(1, "n1")], None]
+        remed.tokenize_table(FakeCTS(), conn, "sales", "t", ["name", "email"], ["id"], 1, "grp",
+            ["t1", "t2"], read_mode="keyset")
+        remed.tokenize_column(FakeCTS(), conn, "sales", "t", "name", ["id"], 1, "grp", "t1",
+            read_mode="keyset")
+        reads = [normalize(call.args[0]) for call in cursor.execute.call_args_list]
+        self.assertTrue(reads)
+        self.assertTrue(all(" FROM SALES.T " in query for query in reads))
+        updates = [normalize(call.args[0]) for call in cursor.executemany.call_args_list]
+        self.assertEqual(["UPDATE SALES.T SET name = %s, email = %s WHERE id = %s",
+            "UPDATE SALES.T SET name = %s WHERE id = %s"], updates)
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import app_modules.remediation as remed
+from test.connection_interface_test import SQLiteConnector
+from test.remediation_test import FakeCTS
+from utils.jobs import ExecutionProgress, JobRegistry
+from utils.reports import ReportStore, RunReport, get_percentile
+
+
+class ReportsTest(unittest.TestCase):
+
+    def test_run_report(self):
+        report = RunReport("exec-1", "Remediate", max_latencies=50)
+        report.add_time("bigid_metadata", 0.5)
+        with report.timer("db_write"):
+            pass
+        self.assertEqual([1, 2, 3], list(report.time_iter("db_read", [1, 2, 3])))
+        report.add_rows("source_0", "table_0", ["col_0", "col_1"], 100)
+        report.add_rows("source_0", "table_0", "col_0", 50)
+        for i in range(1, 101):
+            report.observe_cts(i / 100, 10, error=(i == 100))
+        report.finish("COMPLETED")
+
+        result = report.to_dict()
+        self.assertEqual(("exec-1", "Remediate", "COMPLETED"),
+            (result["executionId"], result["action"], result["status"]))
+        self.assertEqual(0.5, result["phases"]["bigid_metadata"])
+        self.assertEqual(50.5, result["phases"]["cts"])
+        self.assertEqual(250, result["rows"])
+        self.assertEqual([("col_0", 150, 2), ("col_1", 100, 1)],
+            [(col["column"], col["rows"], col["batches"]) for col in result["columns"]])
+        self.assertEqual((100, 1000, 1), (result["cts"]["requests"], result["cts"]["values"],
+            result["cts"]["errors"]))
+        self.assertEqual(1, result["cts"]["latency"]["max"])
+        # Percentiles of a sample of the latencies
+        self.assertLessEqual(result["cts"]["latency"]["p50"], result["cts"]["latency"]["p99"])
+        self.assertEqual(50, len(report._latencies))
+        self.assertEqual(result, report.to_dict())
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual((1, 50, 90, 99, 100), tuple(get_percentile(values, p)
+            for p in (0, 50, 90, 99, 100)))
+        self.assertIsNone(get_percentile([], 50))
+
+    def test_tokenize_column_times_phases(self):
+        conn = SQLiteConnector("staging")
+        conn.run_query("CREATE TABLE t (id INTEGER PRIMARY KEY, val TEXT)")
+        conn.run_query("INSERT INTO t VALUES (?, ?)", is_multiple=True,
+            params_mult=[(i, f"v{i}") for i in range(25)])
+        progress = ExecutionProgress("exec-2", tempfile.mkdtemp())
+        remed.tokenize_column(FakeCTS(), conn, None, "t", "val", ["id"], 4, "grp", "tmpl",
+            progress=progress)
+        # Unrounded, reading 25 rows from SQLite takes well under a millisecond
+        phases = progress.report._phases
+        self.assertGreater(phases["db_read"], 0)
+        self.assertGreater(phases["db_write"], 0)
+
+    def test_report_store_prunes(self):
+        reports_dir = os.path.join(tempfile.mkdtemp(), "reports")
+        store = ReportStore(reports_dir, max_reports=5)
+        for i in range(20):
+            store.save({"executionId": f"exec-{i}", "padding": "x" * 50})
+        self.assertEqual(5, len(os.listdir(reports_dir)))
+        reports = store.read(limit=3)
+        self.assertEqual(["exec-19", "exec-18", "exec-17"], [rep["executionId"] for rep in reports])
+        self.assertEqual([{"executionId": "exec-18", "padding": "x" * 50}],
+            store.read(execution_id="exec-18"))
+        self.assertEqual([], store.read(execution_id="exec-0"))
+
+    def test_job_report_stored(self):
+        store = ReportStore(os.path.join(tempfile.mkdtemp(), "reports"))
+        registry = JobRegistry(max_workers=1, status_dir=tempfile.mkdtemp(), report_store=store)
+        updates = []
+
+        def action(progress):
+            progress.report.add_rows("source_0", "table_0", "col_0", 10)
+
+        registry.submit("exec-3", "Remediate", action, on_update=updates.append)
+        registry._executor.shutdown(wait=True)
+
+        report = registry.get_status("exec-3")["report"]
+        self.assertEqual(("Remediate", "COMPLETED", 10), (report["action"], report["status"],
+            report["rows"]))
+        self.assertEqual([report], store.read(execution_id="exec-3"))
+        self.assertTrue(updates)
+        self.assertTrue(all("report" not in update for update in updates))
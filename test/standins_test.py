@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from configparser import RawConfigParser
+
+import app_modules.anonymization as anon
+import app_modules.remediation as remed
+from bigid.bigid import BigIDAPI
+from cts.async_cts_request import AsyncCTSRequest
+from cts.cts_request import CTSRequest
+from standins.bigid_server import BigIDStandIn, SyntheticCatalog
+from standins.cts_server import CTSStandIn
+from standins.server import BackgroundServer, get_ssl_context
+from utils.exceptions import CTSException
+
+
+@unittest.skipUnless(shutil.which("openssl"), "openssl is needed for the CTS certificate")
+class CTSStandInTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ssl_context = get_ssl_context()
+
+    def start(self, standin: CTSStandIn) -> BackgroundServer:
+        server = BackgroundServer(standin.create_app(), ssl_context=self.ssl_context).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_tokenize(self):
+        standin = CTSStandIn(keepleft=2)
+        server = self.start(standin)
+        cts = CTSRequest(f"127.0.0.1:{server.port}", "user", "pw", "", max_retries=0)
+        tokens = cts.tokenize(["alice", "bob", "al", "alice"], "grp", "tmpl")
+        self.assertEqual(tokens[0], tokens[3])
+        self.assertEqual(["al", "bo"], [token[:2] for token in tokens[:2]])
+        self.assertEqual([5, 3], [len(token) for token in tokens[:2]])
+        self.assertNotEqual("alice", tokens[0])
+        # Too short for the keepleft, returned unchanged
+        self.assertEqual("al", tokens[2])
+        self.assertNotEqual(tokens[0], cts.tokenize(["alice"], "grp", "other")[0])
+        self.assertEqual({"requests": 2, "values": 5, "errors": 0},
+            {key: standin.get_stats()[key] for key in ("requests", "values", "errors")})
+
+    def test_errors(self):
+        server = self.start(CTSStandIn(error_rate=1))
+        cts = CTSRequest(f"127.0.0.1:{server.port}", "user", "pw", "", max_retries=0)
+        with self.assertRaises(CTSException):
+            cts.tokenize(["alice"], "grp", "tmpl")
+
+    def test_concurrent_requests(self):
+        standin = CTSStandIn(latency=0.2)
+        server = self.start(standin)
+        cts = AsyncCTSRequest(f"127.0.0.1:{server.port}", "user", "pw", "", pool_size=500,
+            max_in_flight=500)
+        start = time.time()
+        futures = [cts.submit([f"value_{i:06d}"], "grp", "tmpl") for i in range(1000)]
+        tokens = [future.result() for future in futures]
+        cts.close()
+        self.assertEqual(1000, len(set(token for batch in tokens for token in batch)))
+        self.assertEqual(1000, standin.requests)
+        # 1000 requests of 0.2 seconds, at most 500 at the same time
+        self.assertLess(time.time() - start, 5)
+
+
+class BigIDStandInTest(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = SyntheticCatalog(sources=2, tables=4, columns=2, requests=25,
+            objects_per_request=2)
+        self.standin = BigIDStandIn(self.catalog)
+        server = BackgroundServer(self.standin.create_app()).start()
+        self.addCleanup(server.stop)
+
+        token_path = os.path.join(tempfile.mkdtemp(), "token")
+        with open(token_path, "w", encoding="utf-8") as f:
+            f.write("user-token")
+        config = RawConfigParser()
+        config.read_dict({"BigID": {"user_token_path": token_path, "encryption_key": "key",
+            "remediation_id": "remediation", "max_concurrency": "4"}, "Proxy": {}})
+        self.bigid = BigIDAPI(config, f"{server.url}/api/v1/")
+
+    def test_minimization_requests(self):
+        requests = list(anon.iter_minimization_requests(self.bigid, page_size=7, concurrency=4))
+        self.assertEqual([self.catalog.get_request_id(i) for i in range(25)],
+            [request_id for request_id, _ in requests])
+        self.assertEqual(["source_0.public.table_0", "source_0.public.table_1"],
+            requests[0][1]["selected"])
+
+        reports = self.bigid.get_sar_reports([request_id for request_id, _ in requests[:3]])
+        records = reports[self.catalog.get_request_id(1)]
+        self.assertEqual(6, len(records))
+        self.assertEqual({"source_1"}, {rec["source"] for rec in records})
+
+        request_id, del_info = requests[0]
+        self.bigid.set_minimization_request_action(request_id, "Completion Delete Manually",
+            del_info["ids"])
+        _, total_count = self.bigid.get_minimization_requests_page(0, 10)
+        self.assertEqual(48, total_count)
+
+    def test_remediation_metadata(self):
+        self.assertEqual(["source_0", "source_1"],
+            [ds["name"] for ds in self.bigid.get_all_data_sources()])
+        ds_conns = self.bigid.get_data_source_conns("tpa", ["source_0"])
+        self.assertEqual("user", ds_conns["source_0"].get_username(None))
+
+        objects = self.bigid.get_remediation_objects_by_fqn("source_1")
+        self.assertEqual(4, len(objects))
+        columns = self.bigid.get_remediation_objects_by_source_columns("source_1")
+        self.assertEqual(["col_0", "col_1"], columns[0]["annotations"]["policyHit"])
+
+        fqn = columns[0]["fully_qualified_name"]
+        for col in ("col_0", "col_1"):
+            remed.tag_column_thales_tokenized(self.bigid, "source_1", col, fqn)
+        self.assertEqual([("Thales_Tokenized", "col_0"), ("Thales_Tokenized", "col_1")],
+            [(tag["tagName"], tag["tagValue"]) for tag in self.bigid.get_object_tags(fqn)])
+        # The main tag was created once
+        self.assertEqual(3, len(self.standin.tags))
+
+        remed.comment_tokenization(self.bigid, "col_0", objects[fqn]["id"])
+        self.assertEqual(["col_0"], remed.get_tokenized_cols_from_comments(
+            self.bigid.get_object_comments(objects[fqn]["id"])))
@@ -22,7 +22,29 @@ class UtilsTest(unittest.TestCase):
             self.assertEquals(expected, ut.read_categories(input),
                 f"Input '{input}' did not generate the expected results: '{expected}'")
     
+    def test_read_column_tokentemplates(self):
+        self.assertEqual({}, ut.read_column_tokentemplates(""))
+        self.assertEqual({"email": "t1", "ssn": "t2"},
+            ut.read_column_tokentemplates(" email:t1 , ssn: t2,"))
+        with self.assertRaises(ValueError):
+            ut.read_column_tokentemplates("email")
+
     def test_category_allowed(self):
         found_allowed_expected = [
             ([])
         ]
+
+    def test_get_pooled_session(self):
+        session = ut.get_pooled_session("test:pooled", pool_size=2)
+        self.assertIs(session, ut.get_pooled_session("test:pooled", pool_size=2))
+        self.assertIsNot(session, ut.get_pooled_session("test:other", pool_size=2))
+        self.assertEqual({"requests": 0, "new_connections": 0, "reused_connections": 0},
+            ut.get_session_stats(session))
+
+    def test_chunked(self):
+        self.assertEqual([[0, 1], [2, 3], [4]], list(ut.chunked(iter(range(5)), 2)))
+        self.assertEqual([], list(ut.chunked([], 2)))
+
+    def test_index_by(self):
+        items = [{"k": "a", "v": 1}, {"k": "b", "v": 2}, {"k": "a", "v": 3}]
+        self.assertEqual({"a": items[0], "b": items[1]}, ut.index_by(items, lambda x: x["k"]))
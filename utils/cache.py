@@ -0,0 +1,52 @@
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread safe key/value cache whose entries expire ttl seconds after they
+    were stored. A ttl of 0 disables the cache.
+    """
+    def __init__(self, ttl: float = 300):
+        self._ttl     = ttl
+        self._entries = {}
+        self._lock    = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self._ttl)
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value of key, calling loader() and caching its
+        result when the key is missing or expired
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Removes key from the cache, or every entry if key is None
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,131 @@
+import base64
+import datetime
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from decimal import Decimal
+
+
+class CheckpointStore:
+    """
+    Progress of every (source, table, column) remediation, kept in a local
+    SQLite file so a failed run resumes after the last batch written back
+    instead of reading and tokenizing the column from the start again.
+    Checkpoints are not written in the transaction of the target database,
+    so a crash right after a batch is committed there, before its checkpoint
+    is saved, tokenizes that one batch twice on the next run.
+    """
+    def __init__(self, path: str = "checkpoints.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    source_name TEXT NOT NULL,
+                    table_name  TEXT NOT NULL,
+                    column_name TEXT NOT NULL,
+                    last_key    TEXT,
+                    rows        INTEGER NOT NULL DEFAULT 0,
+                    batches     INTEGER NOT NULL DEFAULT 0,
+                    status      TEXT NOT NULL,
+                    updated_at  REAL NOT NULL,
+                    PRIMARY KEY (source_name, table_name, column_name)
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, source_name: str, table_name: str, column_name: str) -> dict:
+        """
+        Returns the checkpoint of the column, or None if it was never started
+        """
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT last_key, rows, batches, status, updated_at FROM checkpoints
+                WHERE source_name = ? AND table_name = ? AND column_name = ?
+            """, (source_name, table_name, column_name)).fetchone()
+        if row is None:
+            return None
+        last_key = None
+        if row[0] is not None:
+            last_key = tuple(decode_key_value(value) for value in json.loads(row[0]))
+        return {"last_key": last_key, "rows": row[1], "batches": row[2], "status": row[3],
+            "updated_at": row[4]}
+
+    def save(self, source_name: str, table_name: str, column_name: str, last_key: tuple,
+            nrows: int):
+        """
+        Records a batch written back to the database. last_key is the primary
+        key of its last row.
+        """
+        last_key = json.dumps([encode_key_value(value) for value in last_key])
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO checkpoints
+                    (source_name, table_name, column_name, last_key, rows, batches, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, 1, 'in_progress', ?)
+                ON CONFLICT (source_name, table_name, column_name) DO UPDATE SET
+                    last_key = excluded.last_key, rows = rows + excluded.rows,
+                    batches = batches + 1, status = 'in_progress', updated_at = excluded.updated_at
+            """, (source_name, table_name, column_name, last_key, nrows, time.time()))
+            self._conn.commit()
+
+    def complete(self, source_name: str, table_name: str, column_name: str):
+        """
+        Marks the column as fully tokenized
+        """
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO checkpoints
+                    (source_name, table_name, column_name, status, updated_at)
+                VALUES (?, ?, ?, 'done', ?)
+                ON CONFLICT (source_name, table_name, column_name) DO UPDATE SET
+                    status = 'done', updated_at = excluded.updated_at
+            """, (source_name, table_name, column_name, time.time()))
+            self._conn.commit()
+
+    def clear(self, source_name: str, table_name: str, column_name: str):
+        with self._lock:
+            self._conn.execute("""
+                DELETE FROM checkpoints
+                WHERE source_name = ? AND table_name = ? AND column_name = ?
+            """, (source_name, table_name, column_name))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Key types that are not JSON types, tagged so the resumed keyset condition
+# compares the primary key with a value of its own type
+_KEY_TYPES = {
+    "datetime": (datetime.datetime, datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    "date": (datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    "time": (datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    "decimal": (Decimal, str, Decimal),
+    "uuid": (uuid.UUID, str, uuid.UUID),
+    "bytes": (bytes, lambda value: base64.b64encode(value).decode("ascii"), base64.b64decode),
+}
+
+
+def encode_key_value(value):
+    """
+    Returns a primary key value as JSON, with its type when JSON has none
+    """
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    # datetime is checked before its date base class
+    for type_name, (key_type, encode, _) in _KEY_TYPES.items():
+        if isinstance(value, key_type):
+            return {"t": type_name, "v": encode(value)}
+    return str(value)
+
+
+def decode_key_value(value):
+    if isinstance(value, dict):
+        return _KEY_TYPES[value["t"]][2](value["v"])
+    return value
@@ -23,3 +23,11 @@ class PostgreSQLConnectorException(Exception):
 class SQLServerConnectorException(Exception):
     pass
 
+class RemediationException(Exception):
+    pass
+
+class CTSOverloadedException(CTSException):
+    pass
+
+class ExecutionInFlightException(Exception):
+    pass
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from utils.exceptions import ExecutionInFlightException
+from utils.log import Log
+from utils.metrics import Metrics
+from utils.reports import ReportStore, RunReport
+
+
+class StatusSender:
+    """
+    Hands the statuses of an execution to send from a background thread, so
+    a slow BigID request does not hold up the batch loops. Only the latest
+    status waiting to be sent is kept, the older ones are dropped.
+    """
+    def __init__(self, send: Callable, name: str = "status-sender"):
+        self._send      = send
+        self._pending   = None
+        self._closed    = False
+        self._condition = threading.Condition()
+        self._thread    = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, status: dict):
+        with self._condition:
+            if self._closed:
+                return
+            self._pending = status
+            self._condition.notify()
+
+    def close(self):
+        """
+        Waits for the last status put to be sent, then stops the thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                status, self._pending = self._pending, None
+            if status is None:
+                return
+            self._send(status)
+
+
+class ExecutionProgress:
+    """
+    Status of one /api/execute call. The batch loops report the rows they
+    processed, and every change is saved to <status_dir>/<execution_id>.json
+    so any uWSGI worker can answer the progress endpoint. Its RunReport
+    gathers the timings of the execution.
+    """
+    def __init__(self, execution_id: str, status_dir: str, on_update: Callable = None,
+            save_interval: float = 1.0, action_name: str = None):
+        self.execution_id   = execution_id
+        self.status         = "IN_PROGRESS"
+        self.message        = "Execution started"
+        self.rows_total     = 0
+        self.rows_processed = 0
+        # ExecutionProfiler of the execution, when it is profiled
+        self.profiler       = None
+        self.report         = RunReport(execution_id, action_name)
+
+        self._status_path   = os.path.join(status_dir, f"{os.path.basename(execution_id)}.json")
+        self._sender        = None
+        if on_update is not None:
+            self._on_update = on_update
+            self._sender = StatusSender(self._send_update, f"status-{execution_id}")
+        self._save_interval = save_interval
+        self._last_save     = 0
+        self._lock          = threading.Lock()
+        self._save_lock     = threading.Lock()
+        self._save(force=True)
+
+    def add_total(self, nrows: int):
+        with self._lock:
+            self.rows_total += nrows
+        self._save()
+
+    def add_processed(self, nrows: int):
+        with self._lock:
+            self.rows_processed += nrows
+        self._save()
+
+    def mark_phase(self, name: str):
+        if self.profiler is not None:
+            self.profiler.mark_phase(name)
+
+    def finish(self, status: str, message: str):
+        with self._lock:
+            self.status = status
+            self.message = message
+        self.report.finish(status)
+        self._save(force=True)
+        if self._sender is not None:
+            self._sender.close()
+
+    def get_progress(self) -> float:
+        if self.status != "IN_PROGRESS":
+            return 1
+        if self.rows_total == 0:
+            return 0
+        # Totals grow as tables are discovered, never report a finished run early
+        return min(self.rows_processed / self.rows_total, 0.99)
+
+    def to_dict(self) -> dict:
+        return {
+            "executionId": self.execution_id,
+            "statusEnum": self.status,
+            "progress": self.get_progress(),
+            "message": self.message,
+            "rowsProcessed": self.rows_processed,
+            "rowsTotal": self.rows_total,
+            "report": self.report.to_dict()
+        }
+
+    def _save(self, force: bool = False):
+        with self._save_lock:
+            now = time.time()
+            if not force and now - self._last_save < self._save_interval:
+                return
+            self._last_save = now
+
+            status = self.to_dict()
+            tmp_path = f"{self._status_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f)
+            os.replace(tmp_path, self._status_path)
+
+            # Put under the lock so an older status never replaces a newer one
+            if self._sender is not None:
+                # BigID only expects the status fields
+                self._sender.put({key: value for key, value in status.items() if key != "report"})
+
+    def _send_update(self, status: dict):
+        try:
+            self._on_update(status)
+        except Exception as err:
+            Log.warn(f"Could not report progress of execution {self.execution_id}: {err}")
+
+
+class JobRegistry:
+    """
+    Runs actions in a background thread pool so /api/execute can return
+    immediately, and keeps their progress keyed by executionId. The status
+    files of the executions are deleted status_retention seconds after their
+    last update.
+    """
+    def __init__(self, max_workers: int = 4, status_dir: str = "executions",
+            report_store: ReportStore = None, status_retention: float = 604800):
+        self._executor         = ThreadPoolExecutor(max_workers=max_workers)
+        self._status_dir       = status_dir
+        self._report_store     = report_store
+        self._status_retention = status_retention
+        self._jobs             = {}
+        self._lock             = threading.Lock()
+        os.makedirs(self._status_dir, exist_ok=True)
+
+    def submit(self, execution_id: str, action_name: str, action: Callable,
+            on_update: Callable = None, save_interval: float = 1.0) -> ExecutionProgress:
+        """
+        Runs action(progress) in the background and returns its progress object.
+        Raises ExecutionInFlightException if the execution is already running.
+        """
+        with self._lock:
+            if execution_id in self._jobs:
+                raise ExecutionInFlightException(f"Execution {execution_id} is already running")
+            # Created under the lock, it overwrites the status file of the execution
+            progress = ExecutionProgress(execution_id, self._status_dir, on_update, save_interval,
+                action_name)
+            self._jobs[execution_id] = progress
+            Metrics.set_gauge("jobs_in_flight", len(self._jobs))
+        self._executor.submit(self._run, action_name, action, progress)
+        return progress
+
+    def get_status(self, execution_id: str) -> dict:
+        """
+        Returns the status of the execution, also when it runs in another
+        worker. Returns None if the execution is unknown.
+        """
+        with self._lock:
+            progress = self._jobs.get(execution_id)
+        if progress is not None:
+            return progress.to_dict()
+
+        status_path = os.path.join(self._status_dir, f"{os.path.basename(execution_id)}.json")
+        try:
+            with open(status_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get_jobs_in_flight(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def _run(self, action_name: str, action: Callable, progress: ExecutionProgress):
+        try:
+            action(progress)
+            progress.finish("COMPLETED", f"Completed action {action_name} successfully")
+            Metrics.inc("jobs_total", action=action_name, status="COMPLETED")
+        except Exception:
+            Metrics.inc("jobs_total", action=action_name, status="ERROR")
+            Log.error(f"Execution {progress.execution_id} failed: {traceback.format_exc()}")
+            progress.finish("ERROR", "Error - attempt to execute action "
+                + f"{action_name} failed: {traceback.format_exc()}")
+        finally:
+            if self._report_store is not None:
+                try:
+                    self._report_store.save(progress.report.to_dict())
+                except Exception as err:
+                    Log.warn(f"Could not store the report of execution {progress.execution_id}: {err}")
+            with self._lock:
+                self._jobs.pop(progress.execution_id, None)
+                Metrics.set_gauge("jobs_in_flight", len(self._jobs))
+            self._prune_status_files()
+
+    def _prune_status_files(self):
+        """
+        Deletes the status files not updated for status_retention seconds
+        """
+        expiry = time.time() - self._status_retention
+        for name in os.listdir(self._status_dir):
+            path = os.path.join(self._status_dir, name)
+            try:
+                if os.path.getmtime(path) < expiry:
+                    os.remove(path)
+            except FileNotFoundError:
+                # Deleted by another worker
+                continue
@@ -1,7 +1,20 @@
 import datetime
-import inspect
+import logging
+import logging.handlers
 import os
 
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the app runs in a single process
+    fcntl = None
+
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "log.txt")
+
+_logger = logging.getLogger("thales-bigid")
+_logger.propagate = False
+
 
 def create_log_file(logfile_name = "log.txt"):
     if not os.path.exists(logfile_name):
@@ -13,40 +26,136 @@ def create_log_file(logfile_name = "log.txt"):
         os.chmod(logfile_name, 0o666)
 
 
-def write_to_file(mode: str, message: str, filename: str):
+class LogFormatter(logging.Formatter):
+    """
+    Keeps the log.txt line format: [timestamp] LEVEL [file.py] - message
+    """
+    level_names = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        now = datetime.datetime.fromtimestamp(record.created)
+        level = self.level_names.get(record.levelname, record.levelname)
+        return f"[{now}] {level:<5} [{record.filename}] - {record.getMessage()}"
+
+
+class SharedRotatingFileHandler(logging.handlers.WatchedFileHandler):
     """
-    Formats the log string and writes it to the log.txt file.
+    Size rotated log file shared by the uWSGI worker processes. Records are
+    written and the file rotated under an fcntl lock, so only one worker
+    renames the files at a time, and the other workers reopen log.txt when
+    they see it was replaced.
     """
-    log_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    now = datetime.datetime.now()
-    now.strftime("%Y/%m/%d %H:%M:%S.%f")
+    def __init__(self, filename: str, max_bytes: int = 0, backup_count: int = 0,
+            encoding: str = None, delay: bool = False):
+        super().__init__(filename, encoding=encoding, delay=delay)
+        self.max_bytes    = max_bytes
+        self.backup_count = backup_count
+        self._lock_file   = None
 
-    fname = f" [{filename}]" if filename else ""
-    formatted = f"[{now}] {mode}{fname} - {message}\n"
+    def emit(self, record: logging.LogRecord):
+        if fcntl is None:
+            return super().emit(record)
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.baseFilename}.lock", "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            if self.max_bytes > 0:
+                size = len(f"{self.format(record)}{self.terminator}".encode("utf-8"))
+                current_size = self._get_size()
+                if current_size > 0 and current_size + size > self.max_bytes:
+                    self._rotate()
+            super().emit(record)
+            self.flush()
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
 
-    with open(os.path.join(log_path, "log.txt"), "a", encoding="utf-8") as f:
-        f.write(formatted)
+    def close(self):
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
 
+    def _get_size(self) -> int:
+        try:
+            return os.stat(self.baseFilename).st_size
+        except FileNotFoundError:
+            return 0
 
-def get_caller_fname():
+    def _rotate(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        for i in range(self.backup_count - 1, 0, -1):
+            path = f"{self.baseFilename}.{i}"
+            if os.path.exists(path):
+                os.replace(path, f"{self.baseFilename}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.baseFilename, f"{self.baseFilename}.1")
+        else:
+            os.remove(self.baseFilename)
+        self.stream = self._open()
+        self._statstream()
+
+
+def configure_log(level: str = "INFO", filename: str = LOG_PATH, max_bytes: int = 10485760,
+        backup_count: int = 5, buffer_size: int = 100):
     """
-    Gets the name of the file that called the Log methods
+    Sets up the log handlers. Records go to a size rotated log file, shared
+    by the uWSGI workers, through a buffer that is written every buffer_size records, on any error and on
+    Log.flush(). A buffer_size of 0 writes every record right away.
     """
-    caller_frame = inspect.stack()[2]
-    caller_filename_full = caller_frame.filename
-    return os.path.basename(caller_filename_full)
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+
+    file_handler = SharedRotatingFileHandler(filename, max_bytes, backup_count,
+        encoding="utf-8", delay=True)
+    file_handler.setFormatter(LogFormatter())
+    handler = file_handler
+    if buffer_size > 0:
+        handler = logging.handlers.MemoryHandler(buffer_size, flushLevel=logging.ERROR,
+            target=file_handler)
+
+    _logger.addHandler(handler)
+    _logger.setLevel(level.upper())
+
+
+def configure_log_from_config(config):
+    """
+    Sets up the log handlers from the [Log] section of config.ini
+    """
+    configure_log(
+        level=config.get("Log", "level", fallback="INFO"),
+        max_bytes=config.getint("Log", "max_bytes", fallback=10485760),
+        backup_count=config.getint("Log", "backup_count", fallback=5),
+        buffer_size=config.getint("Log", "buffer_size", fallback=100))
 
 
 class Log:
 
+    @staticmethod
+    def debug(message: str):
+        _logger.debug(message, stacklevel=2)
+
     @staticmethod
     def info(message: str):
-        write_to_file("INFO ", message, get_caller_fname())
+        _logger.info(message, stacklevel=2)
 
     @staticmethod
     def warn(message: str):
-        write_to_file("WARN ", message, get_caller_fname())
+        _logger.warning(message, stacklevel=2)
 
     @staticmethod
     def error(message: str):
-        write_to_file("ERROR", message, get_caller_fname())
+        _logger.error(message, stacklevel=2)
+
+    @staticmethod
+    def flush():
+        """
+        Writes the buffered records to the log file
+        """
+        for handler in _logger.handlers:
+            handler.flush()
+
+
+configure_log()
@@ -0,0 +1,318 @@
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+PREFIX = "thales_bigid_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "bigid_request_seconds": ("histogram", "Duration of BigID API calls by method", LATENCY_BUCKETS),
+    "bigid_request_errors_total": ("counter", "BigID API calls that failed by method", None),
+    "cts_request_seconds": ("histogram", "Duration of CTS tokenize requests", LATENCY_BUCKETS),
+    "cts_batch_size": ("histogram", "Values sent in each CTS tokenize request", SIZE_BUCKETS),
+    "cts_request_errors_total": ("counter", "CTS tokenize requests that failed by error", None),
+    "db_read_seconds": ("histogram", "Duration of reading a batch of rows", LATENCY_BUCKETS),
+    "db_read_rows_total": ("counter", "Rows read in batches", None),
+    "db_write_seconds": ("histogram", "Duration of writing a batch of tokens back", LATENCY_BUCKETS),
+    "db_write_rows_total": ("counter", "Rows written back in batches", None),
+    "rows_tokenized_total": ("counter", "Rows whose values were tokenized and written back", None),
+    "jobs_in_flight": ("gauge", "Executions running in the background", None),
+    "jobs_total": ("counter", "Executions finished by action and status", None),
+}
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms of this process. Updates only touch
+    dictionaries in memory; with a metrics_dir they are also written to
+    <metrics_dir>/<pid>.json at most every flush_interval seconds, so any
+    uWSGI worker can report the sum of all the workers.
+    """
+    def __init__(self, metrics_dir: str = None, flush_interval: float = 5):
+        self._metrics_dir    = metrics_dir
+        self._flush_interval = flush_interval
+        self._lock           = threading.Lock()
+        self._flush_lock     = threading.Lock()
+        self._last_flush     = time.monotonic()
+        self._counters       = {}
+        self._gauges         = {}
+        self._histograms     = {}
+        if self._metrics_dir:
+            os.makedirs(self._metrics_dir, exist_ok=True)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per bucket counts, the last one is +Inf, then the sum
+                histogram = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                "gauges": [[name, list(labels), value]
+                           for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, list(labels), list(values)]
+                               for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush(self):
+        if not self._metrics_dir:
+            return
+        with self._flush_lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        self._last_flush = time.monotonic()
+        path = os.path.join(self._metrics_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _maybe_flush(self):
+        if not self._metrics_dir or time.monotonic() - self._last_flush < self._flush_interval:
+            return
+        # Only one thread flushes, the others keep going
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_flush >= self._flush_interval:
+                self._write_snapshot()
+        except OSError:
+            # Metrics must never fail the run, the next update retries
+            pass
+        finally:
+            self._flush_lock.release()
+
+    def _fold_dead_workers(self):
+        """
+        Adds the counters and histograms of finished workers to this process
+        and deletes their snapshots, so totals never go down and the metrics
+        dir does not grow with every worker respawn. A snapshot is claimed by
+        renaming it, so only one worker folds it.
+        """
+        claimed_paths = []
+        for path in glob.glob(os.path.join(self._metrics_dir, "*.json")):
+            try:
+                pid = int(os.path.basename(path)[:-len(".json")])
+            except ValueError:
+                continue
+            if pid == os.getpid() or _is_alive(pid):
+                continue
+            claimed_path = f"{path}.{os.getpid()}.fold"
+            try:
+                os.rename(path, claimed_path)
+            except OSError:
+                # Folded by another worker
+                continue
+            claimed_paths.append(claimed_path)
+            try:
+                with open(claimed_path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (ValueError, OSError):
+                continue
+            with self._lock:
+                for name, labels, value in snapshot["counters"]:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    self._counters[key] = self._counters.get(key, 0) + value
+                for name, labels, values in snapshot["histograms"]:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    total = self._histograms.get(key)
+                    self._histograms[key] = list(values) if total is None \
+                        else [a + b for a, b in zip(total, values)]
+
+        if claimed_paths:
+            # The folded values are on disk again before their snapshots go
+            self.flush()
+            for claimed_path in claimed_paths:
+                os.remove(claimed_path)
+
+    def collect(self) -> dict:
+        """
+        Returns the snapshots of all the workers summed up. Counters and
+        histograms of finished workers are kept so totals never go down,
+        their gauges are dropped.
+        """
+        if self._metrics_dir:
+            self._fold_dead_workers()
+        snapshots = [(os.getpid(), self.snapshot())]
+        if self._metrics_dir:
+            for path in glob.glob(os.path.join(self._metrics_dir, "*.json")):
+                try:
+                    pid = int(os.path.basename(path)[:-len(".json")])
+                    if pid == os.getpid():
+                        continue
+                    with open(path, "r", encoding="utf-8") as f:
+                        snapshots.append((pid, json.load(f)))
+                except (ValueError, OSError):
+                    continue
+
+        merged = {"counters": {}, "gauges": {}, "histograms": {}}
+        for pid, snapshot in snapshots:
+            for kind in ("counters", "gauges"):
+                if kind == "gauges" and not _is_alive(pid):
+                    continue
+                for name, labels, value in snapshot[kind]:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    merged[kind][key] = merged[kind].get(key, 0) + value
+            for name, labels, values in snapshot["histograms"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                total = merged["histograms"].get(key)
+                merged["histograms"][key] = values if total is None \
+                    else [a + b for a, b in zip(total, values)]
+        return merged
+
+    def render(self) -> str:
+        """
+        Returns the metrics of all the workers in the Prometheus text format
+        """
+        merged = self.collect()
+        lines = []
+        by_name = {}
+        for kind in ("counters", "gauges", "histograms"):
+            for (name, labels), value in merged[kind].items():
+                by_name.setdefault(name, []).append((labels, value))
+
+        for name in sorted(by_name):
+            metric_type, help_text, buckets = METRICS.get(name, ("untyped", name, None))
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+            for labels, value in sorted(by_name[name]):
+                if metric_type != "histogram":
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket"
+                        + f"{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {value[-1]}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_registry = MetricsRegistry()
+
+
+def configure_metrics(metrics_dir: str = None, flush_interval: float = 5):
+    """
+    Replaces the registry of this process, e.g. to share the metrics of
+    the uWSGI workers through metrics_dir
+    """
+    global _registry
+    _registry = MetricsRegistry(metrics_dir, flush_interval)
+
+
+def configure_metrics_from_config(config):
+    """
+    Sets up the registry from the [Metrics] section of config.ini
+    """
+    configure_metrics(config.get("Metrics", "dir", fallback=None) or None,
+        config.getfloat("Metrics", "flush_interval", fallback=5))
+
+
+class Metrics:
+
+    @staticmethod
+    def inc(name: str, value: float = 1, **labels):
+        _registry.inc(name, value, **labels)
+
+    @staticmethod
+    def set_gauge(name: str, value: float, **labels):
+        _registry.set_gauge(name, value, **labels)
+
+    @staticmethod
+    def observe(name: str, value: float, **labels):
+        _registry.observe(name, value, **labels)
+
+    @staticmethod
+    def timer(name: str, **labels):
+        return _registry.timer(name, **labels)
+
+    @staticmethod
+    def flush():
+        _registry.flush()
+
+    @staticmethod
+    def render() -> str:
+        _registry.flush()
+        return _registry.render()
+
+
+def track_calls(metric: str):
+    """
+    Decorator that observes the duration of every call in <metric>_seconds
+    and counts the calls that raise in <metric>_errors_total, both labelled
+    with the method name
+    """
+    def decorator(func):
+        method = func.__name__.lstrip("_")
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                Metrics.inc(f"{metric}_errors_total", method=method)
+                raise
+            finally:
+                Metrics.observe(f"{metric}_seconds", time.perf_counter() - start, method=method)
+        return wrapper
+    return decorator
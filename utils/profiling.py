@@ -0,0 +1,233 @@
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+
+from typing import Callable
+
+from utils.log import Log
+
+
+PROFILE_HEADER = "X-Thales-Profile"
+PROFILE_PARAM = "Profile"
+
+_tracing_lock    = threading.Lock()
+_tracing_users   = 0
+_tracing_started = False
+
+
+def is_profiling_requested(headers: dict, params: dict) -> bool:
+    """
+    Profiling is asked for with the hidden Profile action parameter or the
+    X-Thales-Profile header
+    """
+    value = headers.get(PROFILE_HEADER) or params.get(PROFILE_PARAM) or ""
+    return str(value).strip().lower() in ("1", "true", "yes")
+
+
+def get_profile_path(profiles_dir: str, execution_id: str) -> str:
+    """
+    Returns the profile artifact of the execution, None if it was not profiled
+    """
+    path = os.path.join(profiles_dir, f"{os.path.basename(execution_id)}.zip")
+    return path if os.path.isfile(path) else None
+
+
+def _start_tracing(frames: int):
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _tracing_started = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        # Tracing started outside, e.g. with PYTHONTRACEMALLOC, is left alone
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+class SamplingProfiler:
+    """
+    Wall clock profiler: a thread records the stack of every profiled thread
+    each interval seconds. Unlike cProfile it sees the threads of the source,
+    table and CTS pools, and its cost does not grow with the calls made.
+    Threads running before start() are not profiled, except the caller.
+    """
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self._interval  = interval
+        self._max_depth = max_depth
+        self._stacks    = {}
+        self._ignored   = set()
+        self._stop      = threading.Event()
+        self._thread    = None
+        self.samples    = 0
+
+    def start(self):
+        self._ignored = {thread.ident for thread in threading.enumerate()} - {threading.get_ident()}
+        self._thread = threading.Thread(target=self._run, name="execution-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or ident in self._ignored:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self._max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack = tuple(reversed(stack))
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def get_folded_stacks(self) -> str:
+        """
+        Returns the stacks in the folded format of flamegraph.pl and speedscope
+        """
+        return "".join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1]))
+
+    def get_summary(self, top: int = 30) -> str:
+        """
+        Returns the functions seen in most samples, by their own samples and
+        including the functions they called
+        """
+        total = sum(self._stacks.values()) or 1
+        own, inclusive = {}, {}
+        for stack, count in self._stacks.items():
+            own[stack[-1]] = own.get(stack[-1], 0) + count
+            for func in set(stack):
+                inclusive[func] = inclusive.get(func, 0) + count
+
+        lines = [f"{self.samples} samples every {self._interval}s, {total} thread samples", ""]
+        for title, counts in (("Own samples", own), ("Inclusive samples", inclusive)):
+            lines.append(title)
+            for func, count in sorted(counts.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"{count:>8} {count / total:>7.1%}  {func}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+class ExecutionProfiler:
+    """
+    Profiles one execution: samples the stacks of its threads and snapshots
+    the memory allocations at every phase boundary marked by the action.
+    The profile is written to <profiles_dir>/<execution_id>.zip when the
+    action ends, keeping the last max_profiles of them.
+    """
+    def __init__(self, execution_id: str, profiles_dir: str = "profiles", interval: float = 0.01,
+            top: int = 30, trace_frames: int = 1, max_profiles: int = 20):
+        self.execution_id   = execution_id
+        self._profiles_dir  = profiles_dir
+        self._top           = top
+        self._trace_frames  = trace_frames
+        self._max_profiles  = max_profiles
+        self._sampler       = SamplingProfiler(interval)
+        self._lock          = threading.Lock()
+        self._phases        = []
+        self._snapshot      = None
+        self._start         = None
+        self._seconds       = None
+        self._running       = False
+        self._filters       = [tracemalloc.Filter(False, tracemalloc.__file__),
+                               tracemalloc.Filter(False, __file__)]
+
+    def wrap(self, action: Callable) -> Callable:
+        """
+        Returns action profiled, to be run by the JobRegistry
+        """
+        def profiled_action(progress):
+            progress.profiler = self
+            self.start()
+            try:
+                return action(progress)
+            finally:
+                self.stop()
+                try:
+                    self.save()
+                except Exception as err:
+                    Log.error(f"Could not save the profile of execution {self.execution_id}: {err}")
+        return profiled_action
+
+    def start(self):
+        Log.info(f"Profiling execution {self.execution_id}")
+        _start_tracing(self._trace_frames)
+        self._start = time.perf_counter()
+        self._running = True
+        self.mark_phase("start")
+        self._sampler.start()
+
+    def stop(self):
+        self._sampler.stop()
+        self.mark_phase("end")
+        self._running = False
+        self._seconds = time.perf_counter() - self._start
+        _stop_tracing()
+
+    def mark_phase(self, name: str):
+        """
+        Records the time, the memory in use and the allocations that grew the
+        most since the previous phase boundary
+        """
+        if not self._running:
+            return
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+            if self._snapshot is None:
+                stats = snapshot.statistics("lineno")
+            else:
+                stats = snapshot.compare_to(self._snapshot, "lineno")
+            self._snapshot = snapshot
+            self._phases.append({
+                "phase": name,
+                "seconds": round(time.perf_counter() - self._start, 3),
+                "thread": threading.current_thread().name,
+                "memoryCurrent": current,
+                "memoryPeak": peak,
+                "topAllocations": [{
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size": stat.size,
+                    "sizeDiff": getattr(stat, "size_diff", stat.size),
+                    "count": stat.count
+                } for stat in stats[:self._top]]
+            })
+
+    def save(self) -> str:
+        os.makedirs(self._profiles_dir, exist_ok=True)
+        path = os.path.join(self._profiles_dir, f"{os.path.basename(self.execution_id)}.zip")
+        profile = {
+            "executionId": self.execution_id,
+            "seconds": round(self._seconds, 3),
+            "samples": self._sampler.samples,
+            "phases": self._phases
+        }
+        tmp_path = f"{path}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as artifact:
+            artifact.writestr("profile.json", json.dumps(profile, indent=2))
+            artifact.writestr("summary.txt", self._sampler.get_summary(self._top))
+            artifact.writestr("stacks.folded", self._sampler.get_folded_stacks())
+        os.replace(tmp_path, path)
+        Log.info(f"Profile of execution {self.execution_id} written to {path}")
+
+        profiles = sorted(glob.glob(os.path.join(self._profiles_dir, "*.zip")), key=os.path.getmtime)
+        for old_path in profiles[:-self._max_profiles]:
+            os.remove(old_path)
+        return path
@@ -0,0 +1,202 @@
+import json
+import os
+import random
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+PHASES = ("bigid_metadata", "sar_fetch", "db_read", "cts", "db_write", "tagging")
+
+
+class RunReport:
+    """
+    Timings and counts of one execution, built while it runs. Phase times are
+    summed over the threads of the execution, so with concurrency they can
+    add up to more than its wall time. CTS latency percentiles are computed
+    on a sample of at most max_latencies requests.
+    """
+    def __init__(self, execution_id: str = None, action: str = None, max_latencies: int = 10000):
+        self.execution_id   = execution_id
+        self.action         = action
+        self.status         = "IN_PROGRESS"
+        self.started_at     = time.time()
+        self._start         = time.perf_counter()
+        self._seconds       = None
+        self._lock          = threading.Lock()
+        self._phases        = dict.fromkeys(PHASES, 0.0)
+        self._columns       = {}
+        self._cts_requests  = 0
+        self._cts_values    = 0
+        self._cts_errors    = 0
+        self._cts_max       = 0.0
+        self._latencies     = []
+        self._max_latencies = max_latencies
+        self._random        = random.Random(0)
+
+    def add_time(self, phase: str, seconds: float):
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def time_iter(self, phase: str, iterable):
+        """
+        Yields the items of iterable, adding the time spent producing each of
+        them to phase
+        """
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.add_time(phase, time.perf_counter() - start)
+                yield item
+        finally:
+            # Lets a streaming cursor release its connection when the caller stops early
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def add_rows(self, source: str, table: str, columns, nrows: int):
+        """
+        Counts a batch of nrows rows written to each of the columns
+        """
+        columns = [columns] if isinstance(columns, str) else columns
+        with self._lock:
+            for column in columns:
+                counts = self._columns.setdefault((source, table, column), [0, 0])
+                counts[0] += nrows
+                counts[1] += 1
+
+    def observe_cts(self, seconds: float, nvalues: int, error: bool = False):
+        with self._lock:
+            self._phases["cts"] += seconds
+            self._cts_requests += 1
+            self._cts_values += nvalues
+            self._cts_errors += int(error)
+            self._cts_max = max(self._cts_max, seconds)
+            # Reservoir sampling keeps the memory of the report bounded
+            if len(self._latencies) < self._max_latencies:
+                self._latencies.append(seconds)
+            else:
+                index = self._random.randrange(self._cts_requests)
+                if index < self._max_latencies:
+                    self._latencies[index] = seconds
+
+    def finish(self, status: str):
+        with self._lock:
+            self.status = status
+            self._seconds = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            seconds = self._seconds if self._seconds is not None else time.perf_counter() - self._start
+            latencies = sorted(self._latencies)
+            columns = [{"source": source, "table": table, "column": column,
+                        "rows": rows, "batches": batches}
+                       for (source, table, column), (rows, batches) in self._columns.items()]
+            rows = sum(column["rows"] for column in columns)
+            per_sec = lambda count: round(count / seconds, 1) if seconds > 0 else 0
+            return {
+                "executionId": self.execution_id,
+                "action": self.action,
+                "status": self.status,
+                "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "seconds": round(seconds, 3),
+                "rows": rows,
+                "rowsPerSec": per_sec(rows),
+                "phases": {phase: round(spent, 3) for phase, spent in self._phases.items()},
+                "cts": {
+                    "requests": self._cts_requests,
+                    "values": self._cts_values,
+                    "errors": self._cts_errors,
+                    "requestsPerSec": per_sec(self._cts_requests),
+                    "valuesPerSec": per_sec(self._cts_values),
+                    "latency": {
+                        "p50": get_percentile(latencies, 50),
+                        "p90": get_percentile(latencies, 90),
+                        "p99": get_percentile(latencies, 99),
+                        "max": round(self._cts_max, 4)
+                    }
+                },
+                "columns": columns
+            }
+
+
+def get_percentile(sorted_values: list, percent: float) -> float:
+    """
+    Nearest rank percentile of sorted_values, None if it is empty
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(-(-percent * len(sorted_values) // 100)), 1)
+    return round(sorted_values[rank - 1], 4)
+
+
+def get_report(progress) -> RunReport:
+    """
+    Returns the report of the execution, or a throwaway one when the action
+    runs without an ExecutionProgress
+    """
+    return progress.report if progress is not None else RunReport()
+
+
+class ReportStore:
+    """
+    Keeps the reports of the finished executions, so throughput can be
+    followed over weeks of scheduled runs. Each report is written to its own
+    file of reports_dir, named after the time it was saved, so the uWSGI
+    workers never write to the same file. The last max_reports are kept.
+    """
+    def __init__(self, reports_dir: str = "reports", max_reports: int = 1000):
+        self._reports_dir = reports_dir
+        self._max_reports = max_reports
+        os.makedirs(reports_dir, exist_ok=True)
+
+    def save(self, report: dict):
+        name = f"{time.time_ns():020d}-{os.path.basename(str(report.get('executionId')))}.json"
+        path = os.path.join(self._reports_dir, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+        os.replace(tmp_path, path)
+
+        for old_name in self._get_names()[:-self._max_reports]:
+            try:
+                os.remove(os.path.join(self._reports_dir, old_name))
+            except FileNotFoundError:
+                # Removed by another worker
+                pass
+
+    def read(self, limit: int = 100, execution_id: str = None) -> list:
+        """
+        Returns the last limit reports, newest first, only those of
+        execution_id if given
+        """
+        reports = []
+        for name in reversed(self._get_names()):
+            try:
+                with open(os.path.join(self._reports_dir, name), "r", encoding="utf-8") as f:
+                    report = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if execution_id is None or report.get("executionId") == execution_id:
+                reports.append(report)
+            if len(reports) >= limit:
+                break
+        return reports
+
+    def _get_names(self) -> list:
+        # The names start with the time they were saved, oldest first
+        return sorted(name for name in os.listdir(self._reports_dir) if name.endswith(".json"))
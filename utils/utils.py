@@ -1,13 +1,20 @@
 import requests
 import math
+import threading
 
 from configparser import RawConfigParser
+from itertools import islice
 from requests.adapters import HTTPAdapter, Retry
 from requests.auth import HTTPBasicAuth
 from utils.log import Log
 from typing import Union
 
 
+# Sessions shared by every caller in this process (i.e. per uWSGI worker)
+_pooled_sessions = {}
+_pooled_sessions_lock = threading.Lock()
+
+
 def read_config_file(config_path: str) -> RawConfigParser:
     config = RawConfigParser()
     config.read(config_path, encoding="utf-8")
@@ -24,16 +31,76 @@ def get_bigid_user_token(path: str) -> str:
     return token
 
 
-def json_get_request(url: str, header: dict, proxies: dict = None) -> requests.Response:
+def get_retry_strategy() -> Retry:
+    return Retry(total=3,
+            backoff_factor=0.2,
+            status_forcelist=[ 500, 502, 503, 504 ],
+            raise_on_redirect=True)
+
+
+def get_pooled_session(key: str, pool_size: int = 10, proxies: dict = None) -> requests.Session:
+    """
+    Returns the keep-alive session registered under key, creating it on the
+    first call. The session is shared by every caller in the process, so its
+    connection pool (and the TLS handshakes) is reused across requests.
+    """
+    with _pooled_sessions_lock:
+        session = _pooled_sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            if not proxies:
+                session.trust_env = False
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                max_retries=get_retry_strategy())
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _pooled_sessions[key] = session
+            Log.info(f"Created pooled HTTP session {key} with {pool_size=}")
+    return session
+
+
+def close_pooled_sessions():
+    with _pooled_sessions_lock:
+        for session in _pooled_sessions.values():
+            session.close()
+        _pooled_sessions.clear()
+
+
+def get_session_stats(session: requests.Session) -> dict:
+    """
+    Returns how many connections were opened and how many requests reused an
+    already open connection, summed over all hosts served by the session.
+    """
+    new_connections, num_requests = 0, 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            new_connections += pool.num_connections
+            num_requests += pool.num_requests
+    return {
+        "requests": num_requests,
+        "new_connections": new_connections,
+        "reused_connections": max(num_requests - new_connections, 0)
+    }
+
+
+def json_get_request(url: str, header: dict, proxies: dict = None,
+        session: requests.Session = None) -> requests.Response:
+    if session is not None:
+        return session.get(
+            url,
+            verify=False,
+            proxies=proxies,
+            headers=header,
+            timeout=5
+        )
+
     with requests.Session() as s:
         if not proxies:
             s.trust_env = False
 
-        retries = Retry(total=3,
-                backoff_factor=0.2,
-                status_forcelist=[ 500, 502, 503, 504 ],
-                raise_on_redirect=True)
-        s.mount('https://', HTTPAdapter(max_retries=retries))
+        s.mount('https://', HTTPAdapter(max_retries=get_retry_strategy()))
         response = s.get(
             url,
             verify=False,
@@ -47,20 +114,28 @@ def json_get_request(url: str, header: dict, proxies: dict = None) -> requests.R
 
 def json_post_request(url: str, header: dict, content: dict, proxies: dict = None,
         verify: Union[bool, str] = False, username: str = None,
-        password: str = None) -> requests.Response:
+        password: str = None, session: requests.Session = None,
+        timeout: float = 5) -> requests.Response:
 
     auth = None
     if username and password:
         auth = HTTPBasicAuth(username, password)
 
+    if session is not None:
+        return session.post(
+            url,
+            auth=auth,
+            verify=verify,
+            proxies=proxies,
+            headers=header,
+            json=content,
+            timeout=timeout
+        )
+
     with requests.Session() as s:
         if not proxies:
             s.trust_env = False
-        retries = Retry(total=3,
-                backoff_factor=0.2,
-                status_forcelist=[ 500, 502, 503, 504 ],
-                raise_on_redirect=True)
-        s.mount('https://', HTTPAdapter(max_retries=retries))
+        s.mount('https://', HTTPAdapter(max_retries=get_retry_strategy()))
         response = s.post(
             url,
             auth=auth,
@@ -68,6 +143,34 @@ def json_post_request(url: str, header: dict, content: dict, proxies: dict = Non
             proxies=proxies,
             headers=header,
             json=content,
+            timeout=timeout
+        )
+
+    return response
+
+
+def json_put_request(url: str, header: dict, content: dict, proxies: dict = None,
+        session: requests.Session = None) -> requests.Response:
+    if session is not None:
+        return session.put(
+            url,
+            verify=False,
+            proxies=proxies,
+            headers=header,
+            json=content,
+            timeout=5
+        )
+
+    with requests.Session() as s:
+        if not proxies:
+            s.trust_env = False
+        s.mount('https://', HTTPAdapter(max_retries=get_retry_strategy()))
+        response = s.put(
+            url,
+            verify=False,
+            proxies=proxies,
+            headers=header,
+            json=content,
             timeout=5
         )
 
@@ -93,6 +196,21 @@ def read_categories(categories_raw: str) -> set:
     return set()
 
 
+def read_column_tokentemplates(templates_raw: str) -> dict:
+    """
+    Reads "column:template,column2:template2" into {column: template}
+    """
+    templates = {}
+    for item in (templates_raw or "").split(","):
+        if not item.strip():
+            continue
+        column, sep, template = item.partition(":")
+        if not sep or not column.strip() or not template.strip():
+            raise ValueError(f"Invalid column token template {item.strip()}. Use column:template")
+        templates[column.strip()] = template.strip()
+    return templates
+
+
 def category_allowed(categories_found: list, categories_allowed: Union[list, set]) -> bool:
     if len(categories_allowed) == 0:
         return True
@@ -112,6 +230,29 @@ def offset_fetchnext_iter(nlines: int, batch_size: int, start_offset: int = 0) -
         yield (offset, fetch_next)
     
 
+def chunked(iterable, size: int):
+    """
+    Yields lists of up to size items of iterable, consuming it lazily
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, max(size, 1)))
+        if not chunk:
+            return
+        yield chunk
+
+
+def index_by(items: list, key_func) -> dict:
+    """
+    Returns the items keyed by key_func(item). The first item wins when
+    several share a key.
+    """
+    index = {}
+    for item in items:
+        index.setdefault(key_func(item), item)
+    return index
+
+
 def merge_anonymization_dicts(dest: dict, source: dict):
     for request_id in source.keys():
         if request_id in dest: